@@ -1,5 +1,9 @@
-import requests
 import time
+STARTUP_STARTED = time.perf_counter()
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import secrets
 import sqlite3
 from datetime import datetime, timedelta
@@ -8,14 +12,19 @@ import random
 import threading
 import os
 import sys
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response
 from threading import Thread
 import traceback
 import base64
-from io import BytesIO
 import hashlib
 import hmac
-import subprocess
+import queue
+import struct
+import zlib
+import bisect
+from concurrent.futures import ThreadPoolExecutor, Future, TimeoutError as FutureTimeoutError
+from collections import OrderedDict
+from collections.abc import MutableMapping
 
 print("TELEGRAM BOT - CROSS PLATFORM")
 print("Code Verification + Channel Join + Game Scanner")
@@ -33,66 +42,242 @@ print("GitHub Database Backup & Restore System")
 print("24/7 Operation with Persistent Data Recovery")
 print("=" * 50)
 
-# ==================== RENDER DEBUG SECTION ====================
-print("🔍 RENDER DEBUG: Starting initialization...")
-print(f"🔍 DEBUG: Python version: {sys.version}")
-print(f"🔍 DEBUG: Current directory: {os.getcwd()}")
-print(f"🔍 DEBUG: Files in directory: {os.listdir('.')}")
-
-BOT_TOKEN = os.environ.get('BOT_TOKEN')
+# ==================== STARTUP PROFILE ====================
 
-print(f"🔍 DEBUG: BOT_TOKEN exists: {'YES' if BOT_TOKEN else 'NO'}")
+class StartupProfiler:
+    """Times the phases of a cold start.
 
-if BOT_TOKEN:
-    print(f"🔍 DEBUG: Token starts with: {BOT_TOKEN[:10]}...")
-    print(f"🔍 DEBUG: Token length: {len(BOT_TOKEN)}")
-else:
-    print("❌ DEBUG: BOT_TOKEN is MISSING! Check Render Environment Variables")
+    Enabled by the --startup-profile flag, or STARTUP_PROFILE=1 where the
+    command line is not ours (index.py on Vercel). Each mark() closes the
+    phase that ran since the previous mark; report() prints the breakdown
+    once startup is complete. Disabled, mark() returns immediately.
+    """
 
-# Test critical imports
-try:
-    import requests
-    print("✅ DEBUG: requests import OK")
-except ImportError as e:
-    print(f"❌ DEBUG: requests import failed: {e}")
+    def __init__(self, started_at, enabled):
+        self.enabled = enabled
+        self.started_at = started_at
+        self.last_mark = started_at
+        self.phases = []
+        self.reported = False
+        self.lock = threading.Lock()
 
-try:
-    import sqlite3
-    print("✅ DEBUG: sqlite3 import OK")
-except ImportError as e:
-    print(f"❌ DEBUG: sqlite3 import failed: {e}")
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        with self.lock:
+            now = time.perf_counter()
+            self.phases.append((phase, now - self.last_mark))
+            self.last_mark = now
 
-try:
-    from flask import Flask, jsonify
-    print("✅ DEBUG: flask imports OK")
-except ImportError as e:
-    print(f"❌ DEBUG: flask imports failed: {e}")
-# ==================== END DEBUG SECTION ====================
+    def report(self):
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        total = time.perf_counter() - self.started_at
+        print("⏱️ Startup profile:")
+        for phase, seconds in self.phases:
+            print(f"   {phase:<24} {seconds * 1000:9.1f} ms  {seconds * 100 / total:5.1f}%")
+        print(f"   {'total':<24} {total * 1000:9.1f} ms")
+
+startup_profiler = StartupProfiler(
+    STARTUP_STARTED,
+    '--startup-profile' in sys.argv or os.environ.get('STARTUP_PROFILE') == '1'
+)
+startup_profiler.mark('imports')
+
+# ==================== METRICS ====================
+
+class MetricsRegistry:
+    """Counters, gauges and histograms exposed on /metrics in the Prometheus text format.
+
+    Recording happens on hot paths, so counters and histograms go to a
+    per-thread shard of plain dicts that only its own thread writes: no lock
+    is taken after a thread's first sample. A scrape merges the shards and
+    folds those of exited threads into a retired shard. Gauges are either
+    set directly (rarely changing values) or read at scrape time from
+    registered collectors.
+    """
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = {}
+        self.retired = self.new_shard()
+        self.definitions = {}
+        self.gauges = {}
+        self.collectors = {}
+
+    @staticmethod
+    def new_shard():
+        return {'counters': {}, 'histograms': {}}
+
+    def define(self, name, metric_type, help_text, buckets=None):
+        self.definitions[name] = (metric_type, help_text, tuple(buckets or self.DEFAULT_BUCKETS))
+
+    def get_shard(self):
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = self.local.shard = self.new_shard()
+            with self.lock:
+                # Short-lived threads come and go without a scrape; fold theirs in here
+                self.retire_dead_shards()
+                self.shards[threading.current_thread()] = shard
+        return shard
+
+    def retire_dead_shards(self):
+        """Merge shards of exited threads into the retired totals; call with the lock held"""
+        for thread in [thread for thread in self.shards if not thread.is_alive()]:
+            self.merge_into(self.retired, self.shards.pop(thread))
+
+    def inc(self, name, labels=(), value=1):
+        counters = self.get_shard()['counters']
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        histograms = self.get_shard()['histograms']
+        key = (name, labels)
+        histogram = histograms.get(key)
+        buckets = self.definitions[name][2]
+        if histogram is None:
+            # Per-bucket counts (the last slot is +Inf), sum
+            histogram = histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+        histogram[0][bisect.bisect_left(buckets, value)] += 1
+        histogram[1] += value
+
+    def set_gauge(self, name, value, labels=()):
+        with self.lock:
+            self.gauges[(name, labels)] = value
+
+    def register_collector(self, key, collector):
+        """collector() yields (name, labels, value) at scrape time; re-registering a key replaces it"""
+        with self.lock:
+            self.collectors[key] = collector
+
+    @staticmethod
+    def merge_into(target, shard):
+        counters = target['counters']
+        for key, value in shard['counters'].copy().items():
+            counters[key] = counters.get(key, 0) + value
+        histograms = target['histograms']
+        for key, (bucket_counts, total) in shard['histograms'].copy().items():
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = [list(bucket_counts), total]
+            else:
+                merged[0] = [a + b for a, b in zip(merged[0], bucket_counts)]
+                merged[1] += total
+
+    def collect(self):
+        """Merged counters and histograms, plus gauge values"""
+        merged = self.new_shard()
+        with self.lock:
+            self.retire_dead_shards()
+            self.merge_into(merged, self.retired)
+            for shard in self.shards.values():
+                self.merge_into(merged, shard)
+            gauges = dict(self.gauges)
+            collectors = list(self.collectors.values())
+        
+        for collector in collectors:
+            try:
+                for name, labels, value in collector():
+                    gauges[(name, labels)] = value
+            except Exception as e:
+                print(f"⚠️ Metrics collector error: {e}")
+        return merged, gauges
+
+    @staticmethod
+    def format_labels(labels, extra=()):
+        pairs = tuple(labels) + tuple(extra)
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+    def render(self):
+        merged, gauges = self.collect()
+        samples = {}
+        for (name, labels), value in sorted(merged['counters'].items()):
+            samples.setdefault(name, []).append(f"{name}{self.format_labels(labels)} {value}")
+        for (name, labels), value in sorted(gauges.items()):
+            samples.setdefault(name, []).append(f"{name}{self.format_labels(labels)} {value}")
+        # Buckets stay in ascending le order, as the format expects
+        for (name, labels), (bucket_counts, total) in sorted(merged['histograms'].items()):
+            lines = samples.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(self.definitions[name][2] + ('+Inf',), bucket_counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{self.format_labels(labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{self.format_labels(labels)} {total}")
+            lines.append(f"{name}_count{self.format_labels(labels)} {cumulative}")
+        
+        output = []
+        for name, (metric_type, help_text, _) in self.definitions.items():
+            if name not in samples:
+                continue
+            output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {metric_type}")
+            output.extend(samples[name])
+        return '\n'.join(output) + '\n'
+
+metrics = MetricsRegistry()
+
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+BACKUP_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+for metric_name, metric_type, help_text, metric_buckets in (
+    ('telegram_api_requests_total', 'counter', 'Bot API requests by method and outcome', None),
+    ('telegram_api_request_duration_seconds', 'histogram', 'Bot API request latency by method', None),
+    ('telegram_api_throttled_total', 'counter', 'Sends delayed by the outbound rate limiter', None),
+    ('telegram_api_flood_waits_total', 'counter', 'Flood-control (429) responses received', None),
+    ('updates_processed_total', 'counter', 'Updates handled by type and outcome', None),
+    ('update_processing_duration_seconds', 'histogram', 'Time spent handling an update by type', None),
+    ('update_queue_depth', 'gauge', 'Updates waiting in the dispatcher queues', None),
+    ('callback_route_calls_total', 'counter', 'Callback query handler calls by route and outcome', None),
+    ('callback_route_duration_seconds', 'histogram', 'Callback query handler latency by route', None),
+    ('sqlite_statement_duration_seconds', 'histogram', 'SQLite statement execution time by statement family', SQL_BUCKETS),
+    ('sqlite_write_queue_depth', 'gauge', 'Write jobs waiting for the database writer thread', None),
+    ('game_search_duration_seconds', 'histogram', 'Game search latency by engine', SQL_BUCKETS),
+    ('broadcast_deliveries_total', 'counter', 'Broadcast messages by outcome', None),
+    ('broadcast_active_jobs', 'gauge', 'Broadcast jobs currently running', None),
+    ('backups_total', 'counter', 'GitHub backups by outcome', None),
+    ('backup_duration_seconds', 'histogram', 'Time to snapshot, compress and upload a backup', BACKUP_BUCKETS),
+    ('backup_size_bytes', 'gauge', 'Size of the last successful backup', None),
+    ('backup_last_success_timestamp_seconds', 'gauge', 'Unix time of the last successful backup', None),
+    ('session_store_entries', 'gauge', 'Live entries per session store', None),
+    ('user_state_cache_entries', 'gauge', 'Users held in the user state cache', None),
+    ('bot_errors', 'gauge', 'Errors in the current crash-protection window', None),
+    ('bot_consecutive_errors', 'gauge', 'Consecutive errors without a successful update', None),
+    ('keepalive_pings_total', 'counter', 'Keep-alive pings sent to the health endpoint', None),
+):
+    metrics.define(metric_name, metric_type, help_text, metric_buckets)
 
 # Health check server
 app = Flask(__name__)
 
 @app.route('/health')
 def health_check():
-    """Enhanced health check endpoint for Render monitoring"""
+    """Health check endpoint for Render monitoring.
+
+    Reads the signals HealthMonitor keeps up to date in the background; no
+    network or database I/O happens on the request path.
+    """
     try:
-        bot_status = 'unknown'
-        if 'bot' in globals() and hasattr(bot, 'test_bot_connection'):
-            bot_status = 'healthy' if bot.test_bot_connection() else 'unhealthy'
-        
-        health_status = {
-            'status': 'healthy',
-            'timestamp': time.time(),
-            'service': 'telegram-game-bot',
-            'version': '1.0.0',
-            'bot_status': bot_status,
-            'checks': {
-                'bot_online': {'status': bot_status, 'message': f'Bot is {bot_status}'},
-                'system': {'status': 'healthy', 'message': 'System operational'},
-                'database': {'status': 'healthy', 'message': 'Database connected'}
-            }
-        }
-        return jsonify(health_status), 200
+        bot_instance = globals().get('bot')
+        if bot_instance is None or not hasattr(bot_instance, 'health_monitor'):
+            return jsonify({
+                'status': 'starting',
+                'timestamp': time.time(),
+                'service': 'telegram-game-bot',
+                'version': '1.0.0',
+                'bot_status': 'starting'
+            }), 200
+        
+        health_status, status_code = bot_instance.health_monitor.get_health()
+        return jsonify(health_status), status_code
     except Exception as e:
         return jsonify({
             'status': 'error',
@@ -101,6 +286,14 @@ def health_check():
             'bot_status': 'error'
         }), 500
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint; set METRICS_TOKEN to require a bearer token"""
+    token = os.environ.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'status': 'error', 'message': 'Unauthorized access'}), 401
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/redeploy', methods=['POST'])
 def redeploy_bot():
     """Redeploy endpoint for admins and users"""
@@ -134,6 +327,60 @@ def redeploy_bot():
             'timestamp': time.time()
         }), 500
 
+WEBHOOK_PATH = '/webhook'
+
+def webhook_secret_for(token):
+    """Secret token Telegram echoes back in X-Telegram-Bot-Api-Secret-Token"""
+    secret = os.environ.get('WEBHOOK_SECRET', '').strip()
+    if secret:
+        return secret
+    # Stable default so every instance serving the same bot agrees on it
+    return hashlib.sha256(f"webhook:{token}".encode()).hexdigest()
+
+def reject_invalid_webhook_secret(token):
+    """401 response when the request lacks the webhook secret, else None.
+
+    Needs only the token, so callers can run it before building a bot.
+    """
+    secret_header = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if token and hmac.compare_digest(secret_header, webhook_secret_for(token)):
+        return None
+    print("⚠️ Rejected webhook request with invalid secret token")
+    return jsonify({'status': 'error', 'message': 'Unauthorized access'}), 401
+
+def process_webhook_request(bot_instance, synchronous=False):
+    """Validate a Telegram webhook POST and hand the update to the bot"""
+    try:
+        if bot_instance is None:
+            return jsonify({'status': 'error', 'message': 'Bot not ready'}), 503
+        
+        rejection = reject_invalid_webhook_secret(bot_instance.token)
+        if rejection:
+            return rejection
+        
+        update = request.get_json(silent=True)
+        if not isinstance(update, dict) or not isinstance(update.get('update_id'), int):
+            return jsonify({'status': 'error', 'message': 'Invalid update'}), 400
+        
+        if not bot_instance.handle_webhook_update(update, synchronous=synchronous):
+            # Non-2xx makes Telegram redeliver the update later
+            return jsonify({'status': 'error', 'message': 'Update not accepted'}), 503
+        
+        if synchronous:
+            # A serverless instance may be frozen after the response; the flusher thread can't be relied on
+            bot_instance.flush_sessions()
+        
+        return jsonify({'status': 'ok'}), 200
+        
+    except Exception as e:
+        print(f"❌ Webhook request error: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@app.route(WEBHOOK_PATH, methods=['POST'])
+def telegram_webhook():
+    """Telegram webhook endpoint"""
+    return process_webhook_request(globals().get('bot'))
+
 def trigger_redeploy():
     """Trigger a redeploy of the bot"""
     try:
@@ -162,7 +409,9 @@ def home():
         'version': '1.0.0',
         'endpoints': {
             'health': '/health',
+            'metrics': '/metrics',
             'redeploy': '/redeploy (POST)',
+            'webhook': f'{WEBHOOK_PATH} (POST)',
             'features': ['Game Distribution', 'Mini-Games', 'Admin Uploads', 'Broadcast Messaging', 'Telegram Stars', 'Game Requests', 'Premium Games', 'Game Removal System', 'Redeploy System', '24/7 Operation']
         }
     })
@@ -199,12 +448,14 @@ class EnhancedKeepAliveService:
     def __init__(self, health_url=None):
         self.health_url = health_url or f"http://localhost:{os.environ.get('PORT', 8080)}/health"
         self.is_running = False
+        self.stop_event = threading.Event()
         self.ping_count = 0
         self.last_successful_ping = time.time()
         
     def start(self):
         """Start enhanced keep-alive service with better monitoring"""
         self.is_running = True
+        stop_event = self.stop_event = threading.Event()
         
         def ping_loop():
             consecutive_failures = 0
@@ -248,7 +499,8 @@ class EnhancedKeepAliveService:
                 else:
                     sleep_time = 240
                 
-                time.sleep(sleep_time)
+                if stop_event.wait(sleep_time):
+                    break
         
         thread = threading.Thread(target=ping_loop, daemon=True)
         thread.start()
@@ -263,13 +515,557 @@ class EnhancedKeepAliveService:
     def stop(self):
         """Stop keep-alive service"""
         self.is_running = False
+        self.stop_event.set()
         print("🛑 Keep-alive service stopped")
 
+# ==================== DATABASE LAYER ====================
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times each statement into sqlite_statement_duration_seconds"""
+
+    FAMILIES = {
+        'SELECT': 'select', 'WITH': 'select', 'INSERT': 'insert', 'REPLACE': 'insert',
+        'UPDATE': 'update', 'DELETE': 'delete', 'CREATE': 'ddl', 'ALTER': 'ddl', 'DROP': 'ddl',
+        'BEGIN': 'transaction', 'COMMIT': 'transaction', 'ROLLBACK': 'transaction',
+        'SAVEPOINT': 'transaction', 'RELEASE': 'transaction', 'PRAGMA': 'pragma',
+    }
+
+    @classmethod
+    def statement_family(cls, sql):
+        keyword = sql.split(None, 1)[0].upper() if sql.strip() else ''
+        return cls.FAMILIES.get(keyword, 'other')
+
+    def execute(self, sql, parameters=()):
+        start_time = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.observe('sqlite_statement_duration_seconds', time.perf_counter() - start_time,
+                            (('family', self.statement_family(sql)),))
+
+    def executemany(self, sql, seq_of_parameters):
+        start_time = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.observe('sqlite_statement_duration_seconds', time.perf_counter() - start_time,
+                            (('family', self.statement_family(sql)),))
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, including the implicit one of execute(), are timed"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class DatabaseManager:
+    """SQLite access in WAL mode: per-thread reader connections and one writer thread.
+
+    Reads use a connection owned by the calling thread, so they never share a
+    cursor with another thread and, under WAL, never wait on a writer. Every
+    write is queued to the writer thread, which runs queued jobs back to back
+    inside one transaction (each job in its own savepoint, so a failing job
+    only rolls back itself) and commits once per batch.
+    """
+
+    PRAGMAS = (
+        'PRAGMA synchronous = NORMAL',
+        'PRAGMA cache_size = -16000',
+        'PRAGMA mmap_size = 134217728',
+        'PRAGMA temp_store = MEMORY',
+        'PRAGMA busy_timeout = 5000',
+        # INSERT OR REPLACE must fire the delete triggers that keep games_fts in sync
+        'PRAGMA recursive_triggers = ON',
+    )
+    MAX_BATCH = 64
+    NO_JOB = object()
+    BUMP_WRITE_COUNTER = "UPDATE db_meta SET value = value + 1 WHERE key = 'write_counter'"
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.is_memory = db_path == ':memory:'
+        self.local = threading.local()
+        self.reader_connections = {}
+        self.connections_lock = threading.Lock()
+        # Guards closed against run_write, so no job is queued behind the shutdown sentinel
+        self.submit_lock = threading.Lock()
+        self.closed = False
+        self.write_timeout = float(os.environ.get('DB_WRITE_TIMEOUT', 30))
+        # Set once the db_meta table exists; every committed batch that changed rows bumps the counter
+        self.write_counter_enabled = False
+
+        self.writer_conn = self.connect()
+        if not self.is_memory:
+            mode = self.writer_conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+            if mode.lower() != 'wal':
+                print(f"⚠️ SQLite WAL unavailable, journal mode is {mode}")
+
+        self.write_queue = queue.Queue()
+        self.writer_thread = threading.Thread(target=self.writer_loop, name="db-writer", daemon=True)
+        self.writer_thread.start()
+
+    def connect(self):
+        if self.is_memory:
+            # Named shared-cache memory DB so every thread sees the same data
+            conn = sqlite3.connect(f'file:memdb{id(self)}?mode=memory&cache=shared', uri=True,
+                                   check_same_thread=False, isolation_level=None, factory=InstrumentedConnection)
+        else:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None, timeout=5,
+                                   factory=InstrumentedConnection)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def reader(self):
+        """Connection for the calling thread (the writer thread reads its own writes)"""
+        if self.closed:
+            raise sqlite3.ProgrammingError("Database is closed")
+        if threading.current_thread() is self.writer_thread:
+            return self.writer_conn
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.connect()
+            self.local.conn = conn
+            with self.connections_lock:
+                self.prune_reader_connections()
+                self.reader_connections[threading.current_thread()] = conn
+        return conn
+
+    def prune_reader_connections(self):
+        """Close connections left behind by threads that have exited"""
+        for thread in [thread for thread in self.reader_connections if not thread.is_alive()]:
+            try:
+                self.reader_connections.pop(thread).close()
+            except Exception:
+                pass
+
+    def run_write(self, operation, *args, transactional=True):
+        """Run operation(conn, *args) on the writer thread and return its result.
+
+        transactional=False runs it outside any transaction, for statements
+        such as wal_checkpoint that SQLite refuses inside BEGIN.
+
+        Waits up to DB_WRITE_TIMEOUT for the writer to pick the job up. A job
+        still queued by then is cancelled and TimeoutError is raised, so it
+        never commits behind the caller's back. A job already running is
+        waited out, since its outcome is no longer in doubt.
+        """
+        if threading.current_thread() is self.writer_thread:
+            return operation(self.writer_conn, *args)
+        future = Future()
+        with self.submit_lock:
+            if self.closed:
+                raise sqlite3.ProgrammingError("Database is closed")
+            self.write_queue.put((operation, args, future, transactional))
+        try:
+            return future.result(timeout=self.write_timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                print(f"⚠️ Database write not started within {self.write_timeout:g}s, cancelled")
+                raise
+            return future.result()
+
+    def execute_write(self, sql, params=()):
+        """Execute one write statement; returns the cursor (lastrowid, rowcount)"""
+        return self.run_write(lambda conn: conn.execute(sql, params))
+
+    def execute_writes(self, statements):
+        """Execute several (sql, params) statements as one transaction"""
+        def write_all(conn):
+            cursor = conn.cursor()
+            for sql, params in statements:
+                cursor.execute(sql, params)
+            return cursor
+        return self.run_write(write_all)
+
+    def writer_loop(self):
+        carried = self.NO_JOB
+        while True:
+            job = self.write_queue.get() if carried is self.NO_JOB else carried
+            carried = self.NO_JOB
+            if job is None:
+                break
+            if not job[3]:
+                self.run_outside_transaction(job)
+                continue
+
+            # Group whatever else is already queued into the same commit
+            batch = [job]
+            while len(batch) < self.MAX_BATCH:
+                try:
+                    job = self.write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None or not job[3]:
+                    carried = job
+                    break
+                batch.append(job)
+            self.run_batch(batch)
+
+    def run_outside_transaction(self, job):
+        operation, args, future, _ = job
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(operation(self.writer_conn, *args))
+        except Exception as e:
+            future.set_exception(e)
+
+    def run_batch(self, batch):
+        conn = self.writer_conn
+        outcomes = []
+        changes_before = conn.total_changes
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for operation, args, future, _ in batch:
+                # Callers that timed out cancelled their job; skip it
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute('SAVEPOINT write_job')
+                try:
+                    result = operation(conn, *args)
+                    conn.execute('RELEASE write_job')
+                    outcomes.append((future, result, None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write_job')
+                    conn.execute('RELEASE write_job')
+                    outcomes.append((future, None, e))
+            if self.write_counter_enabled and conn.total_changes != changes_before:
+                conn.execute(self.BUMP_WRITE_COUNTER)
+            conn.execute('COMMIT')
+        except Exception as e:
+            print(f"❌ Database write batch failed: {e}")
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for operation, args, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def checkpoint(self, mode='TRUNCATE'):
+        """Fold the WAL back into the main database file"""
+        if self.is_memory:
+            return None
+        return self.run_write(lambda conn: conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone(), transactional=False)
+
+    def close(self):
+        """Stop the writer and close every connection"""
+        with self.submit_lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.write_queue.put(None)
+        self.writer_thread.join(timeout=10)
+        if not self.writer_thread.is_alive():
+            # Jobs the writer never reached; their callers would otherwise wait out the timeout
+            while True:
+                try:
+                    job = self.write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not None and not job[2].done():
+                    job[2].set_exception(sqlite3.ProgrammingError("Database is closed"))
+        with self.connections_lock:
+            for conn in list(self.reader_connections.values()) + [self.writer_conn]:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self.reader_connections = {}
+
+    def snapshot(self, dest_path, pages=None, step_sleep=None):
+        """Write a consistent copy of the database to dest_path.
+
+        Runs the online backup API from a private connection whose read
+        transaction pins one WAL snapshot, copying a few pages per step so
+        writers keep going, then runs integrity_check on the copy before
+        moving it into place. Returns the size of the snapshot in bytes.
+        """
+        pages = pages or int(os.environ.get('SNAPSHOT_PAGES_PER_STEP', 256))
+        step_sleep = step_sleep if step_sleep is not None else float(os.environ.get('SNAPSHOT_STEP_SLEEP', 0.005))
+        temp_path = dest_path + '.tmp'
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        source = self.connect()
+        try:
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            dest = sqlite3.connect(temp_path)
+            try:
+                source.backup(dest, pages=pages, sleep=step_sleep)
+                # A standalone file: no -wal companion needed to read it
+                dest.execute('PRAGMA journal_mode = DELETE')
+                result = dest.execute('PRAGMA integrity_check').fetchone()[0]
+                if result != 'ok':
+                    raise sqlite3.DatabaseError(f"Snapshot failed integrity check: {result}")
+            finally:
+                dest.close()
+        finally:
+            source.close()
+
+        os.replace(temp_path, dest_path)
+        return os.path.getsize(dest_path)
+
+    def get_write_counter(self):
+        return self.read_write_counter(self.reader())
+
+    @staticmethod
+    def read_write_counter(conn):
+        """Logical write counter of a database, or None if it predates db_meta"""
+        try:
+            row = conn.execute("SELECT value FROM db_meta WHERE key = 'write_counter'").fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] if row else None
+
+    @staticmethod
+    def remove_database_files(db_path):
+        """Delete a database file together with its -wal/-shm companions"""
+        for path in (db_path, db_path + '-wal', db_path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+
+# ==================== TELEGRAM BOT API CLIENT ====================
+
+class OutboundRateLimiter:
+    """Token-bucket limiter for outgoing messages.
+
+    Each bucket is tracked as the theoretical time its next token frees up
+    (the virtual-scheduling form of a token bucket), so a caller reserves a
+    send slot under the lock and sleeps only until that slot, rather than
+    sleeping a fixed interval. A send needs a slot in the global bucket and
+    in its chat's bucket; private chats and groups have separate budgets.
+    """
+
+    def __init__(self, global_rate=None, chat_rate=None, group_per_minute=None, burst=None):
+        self.global_rate = global_rate or float(os.environ.get('RATE_LIMIT_GLOBAL_PER_SEC', 30))
+        self.chat_rate = chat_rate or float(os.environ.get('RATE_LIMIT_CHAT_PER_SEC', 1))
+        self.group_rate = (group_per_minute or float(os.environ.get('RATE_LIMIT_GROUP_PER_MIN', 20))) / 60.0
+        self.chat_burst = burst or int(os.environ.get('RATE_LIMIT_CHAT_BURST', 3))
+        self.lock = threading.Lock()
+        self.global_bucket = self.new_bucket(self.global_rate, self.global_rate)
+        self.chat_buckets = {}
+        self.throttled_count = 0
+        self.flood_wait_count = 0
+
+    @staticmethod
+    def new_bucket(rate, capacity):
+        return {'interval': 1.0 / rate, 'tolerance': (max(1, capacity) - 1) / rate, 'tat': 0.0, 'blocked_until': 0.0}
+
+    @staticmethod
+    def is_group_chat(chat_id):
+        chat = str(chat_id)
+        return chat.startswith('-') or chat.startswith('@')
+
+    def get_chat_bucket(self, chat_id):
+        key = str(chat_id)
+        bucket = self.chat_buckets.get(key)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                self.prune_idle_buckets()
+            if self.is_group_chat(chat_id):
+                bucket = self.new_bucket(self.group_rate, self.chat_burst)
+            else:
+                bucket = self.new_bucket(self.chat_rate, self.chat_burst)
+            self.chat_buckets[key] = bucket
+        return bucket
+
+    def prune_idle_buckets(self):
+        """Drop buckets that are fully refilled; they carry no state"""
+        now = time.monotonic()
+        idle = [key for key, bucket in self.chat_buckets.items()
+                if bucket['tat'] <= now and bucket['blocked_until'] <= now]
+        for key in idle:
+            del self.chat_buckets[key]
+
+    def reserve(self, chat_id=None):
+        """Reserve the next send slot and return how long to wait for it"""
+        with self.lock:
+            now = time.monotonic()
+            # The global slot depends on the global bucket alone, so one chat's
+            # backlog or flood-wait never delays sends to other chats
+            global_bucket = self.global_bucket
+            global_at = max(now, global_bucket['tat'] - global_bucket['tolerance'], global_bucket['blocked_until'])
+            global_bucket['tat'] = max(global_bucket['tat'], global_at) + global_bucket['interval']
+
+            send_at = global_at
+            if chat_id is not None:
+                chat_bucket = self.get_chat_bucket(chat_id)
+                send_at = max(send_at, chat_bucket['tat'] - chat_bucket['tolerance'], chat_bucket['blocked_until'])
+                chat_bucket['tat'] = max(chat_bucket['tat'], send_at) + chat_bucket['interval']
+
+            delay = send_at - now
+            if delay > 0:
+                self.throttled_count += 1
+            return delay
+
+    def acquire(self, chat_id=None):
+        delay = self.reserve(chat_id)
+        if delay > 0:
+            time.sleep(delay)
+
+    def apply_retry_after(self, chat_id, retry_after):
+        """Hold back the bucket Telegram flagged for the server-provided delay"""
+        with self.lock:
+            self.flood_wait_count += 1
+            bucket = self.get_chat_bucket(chat_id) if chat_id is not None else self.global_bucket
+            bucket['blocked_until'] = max(bucket['blocked_until'], time.monotonic() + retry_after)
+
+class TelegramBotAPI:
+    """Shared Bot API client: one keep-alive connection pool, timeouts and retries in one place"""
+
+    DEFAULT_TIMEOUT = 15
+    METHOD_TIMEOUTS = {
+        'getUpdates': 110,
+        'sendDocument': 30,
+        'sendPhoto': 30,
+        'forwardMessage': 30,
+        'copyMessage': 30,
+        'sendInvoice': 30,
+        'getMe': 10,
+        'getFile': 10,
+        'getChatMember': 10,
+        'answerCallbackQuery': 5,
+    }
+    # Methods that post a message into a chat and count against Telegram's flood limits
+    RATE_LIMITED_METHODS = {
+        'sendMessage', 'sendPhoto', 'sendDocument', 'sendVideo', 'sendAudio',
+        'sendAnimation', 'sendVoice', 'sendMediaGroup', 'sendInvoice',
+        'forwardMessage', 'copyMessage',
+    }
+    # Longest server-requested wait absorbed inside call(); beyond this the 429 is returned
+    MAX_RETRY_AFTER = 30
+
+    def __init__(self, token, pool_size=None, max_retries=2):
+        self.base_url = f"https://api.telegram.org/bot{token}/"
+        self.pool_size = pool_size or int(os.environ.get('HTTP_POOL_SIZE', 32))
+        self.rate_limiter = OutboundRateLimiter()
+        # Liveness signals read by HealthMonitor
+        self.last_success_at = None
+        self.last_failure_at = None
+
+        # Only connection failures are retried here; a POST that reached Telegram
+        # may already have been delivered, so read errors are left to the caller.
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=0,
+            status=0,
+            backoff_factor=0.3,
+            allowed_methods=None,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get_timeout(self, method, timeout=None):
+        if timeout is not None:
+            return timeout
+        return self.METHOD_TIMEOUTS.get(method, self.DEFAULT_TIMEOUT)
+
+    def request(self, method, data=None, params=None, timeout=None, http_method='POST'):
+        """Send a raw Bot API request and return the requests.Response"""
+        return self.session.request(
+            http_method,
+            self.base_url + method,
+            data=data,
+            params=params,
+            timeout=self.get_timeout(method, timeout)
+        )
+
+    def call(self, method, data=None, params=None, timeout=None, http_method='POST'):
+        """Call a Bot API method and return the decoded JSON result.
+
+        Message sends are paced by the rate limiter, and a 429 is retried
+        after its retry_after when that wait is short. Network errors
+        (requests.exceptions.*) propagate so callers can decide whether to
+        retry; a non-JSON body is reported as a failed call.
+        """
+        rate_limited = method in self.RATE_LIMITED_METHODS
+        chat_id = (data or {}).get('chat_id') if rate_limited else None
+
+        for attempt in range(3):
+            if rate_limited:
+                self.rate_limiter.acquire(chat_id)
+
+            start_time = time.perf_counter()
+            try:
+                response = self.request(method, data=data, params=params, timeout=timeout, http_method=http_method)
+            except requests.exceptions.RequestException:
+                self.last_failure_at = time.time()
+                self.record_request(method, start_time, 'network_error')
+                raise
+            try:
+                result = response.json()
+            except ValueError:
+                self.last_failure_at = time.time()
+                self.record_request(method, start_time, 'http_error')
+                return {'ok': False, 'error_code': response.status_code, 'description': f'HTTP {response.status_code}'}
+
+            # Any JSON answer, even an API error, shows Telegram is reachable
+            self.last_success_at = time.time()
+            self.record_request(method, start_time, 'ok' if result.get('ok') else 'error')
+            if result.get('error_code') != 429:
+                return result
+
+            retry_after = (result.get('parameters') or {}).get('retry_after', 1)
+            print(f"⏳ Flood control on {method} for chat {chat_id}: retry after {retry_after}s")
+            self.rate_limiter.apply_retry_after(chat_id, retry_after)
+            if retry_after > self.MAX_RETRY_AFTER or not rate_limited:
+                return result
+
+        return result
+
+    @staticmethod
+    def record_request(method, start_time, outcome):
+        labels = (('method', method),)
+        metrics.observe('telegram_api_request_duration_seconds', time.perf_counter() - start_time, labels)
+        metrics.inc('telegram_api_requests_total', labels + (('outcome', outcome),))
+
+    def close(self):
+        self.session.close()
+
 # ==================== GITHUB BACKUP SYSTEM ====================
 
 class GitHubBackupSystem:
+    """Backs the database up to a GitHub repository and restores it.
+
+    Backups are stored as zlib-compressed, fixed-size chunks uploaded as
+    git blobs, plus a manifest.json listing them, all committed through the
+    Git Data API under ``<GITHUB_BACKUP_PATH>.chunks/``. Both directions
+    stream one chunk at a time, so memory use does not grow with the
+    database. The manifest also records the database's logical write
+    counter, which lets startup skip the download when the local copy is
+    not older. Backups written by older versions (a single file through the
+    contents API) can still be restored.
+    """
+    
+    MANIFEST_FORMAT = 'telegram-bot-db-chunked'
+    MANIFEST_VERSION = 1
+    # Retries of a ref update rejected because the branch moved underneath it
+    MAX_SHA_RETRIES = 3
+    READ_BLOCK_SIZE = 1024 * 1024
+    NOT_MODIFIED = object()
+    
     def __init__(self, bot_instance):
         self.bot = bot_instance
+        self.backup_lock = threading.Lock()
+        self.last_manifest = None
         self.setup_github_config()
         print("✅ GitHub Backup system initialized!")
     
@@ -280,6 +1076,9 @@ class GitHubBackupSystem:
         self.repo_name = os.environ.get('GITHUB_REPO_NAME', 'your-repo')
         self.backup_branch = os.environ.get('GITHUB_BACKUP_BRANCH', 'main')
         self.backup_path = os.environ.get('GITHUB_BACKUP_PATH', 'backups/telegram_bot.db')
+        self.chunk_dir = self.backup_path + '.chunks'
+        self.manifest_path = f"{self.chunk_dir}/manifest.json"
+        self.chunk_size = int(float(os.environ.get('BACKUP_CHUNK_MB', 4)) * 1024 * 1024)
         
         self.is_enabled = bool(self.github_token and self.repo_owner and self.repo_name)
         
@@ -295,103 +1094,334 @@ class GitHubBackupSystem:
             db_path = self.bot.get_db_path()
             backup_path = db_path + '.backup'
             
-            import shutil
-            shutil.copy2(db_path, backup_path)
+            # Keep the WAL short; the snapshot itself does not depend on it
+            self.bot.db.checkpoint('PASSIVE')
+            
+            start_time = time.time()
+            size = self.bot.db.snapshot(backup_path)
             
-            print(f"✅ Database backup created: {backup_path}")
+            print(f"✅ Database backup created: {backup_path} ({self.bot.format_file_size(size)} in {time.time() - start_time:.2f}s)")
             return backup_path
         except Exception as e:
             print(f"❌ Database backup error: {e}")
             return None
     
     def backup_database_to_github(self, commit_message="Auto backup: Database update"):
-        """Backup database to GitHub"""
+        """Backup database to GitHub (one backup at a time)"""
         if not self.is_enabled:
             print("⚠️ GitHub backup disabled")
             return False
         
+        with self.backup_lock:
+            return self.upload_backup(commit_message)
+    
+    def api_url(self, path):
+        return f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/{path}"
+    
+    def get_headers(self, raw=False):
+        return {
+            'Authorization': f'token {self.github_token}',
+            'Accept': 'application/vnd.github.v3.raw' if raw else 'application/vnd.github.v3+json'
+        }
+    
+    def upload_backup(self, commit_message):
+        backup_file = None
         try:
             print("🔄 Starting GitHub database backup...")
             
+            start_time = time.perf_counter()
             backup_file = self.create_db_backup()
             if not backup_file:
+                metrics.inc('backups_total', (('outcome', 'failed'),))
                 return False
             
-            with open(backup_file, 'rb') as f:
-                db_content = f.read()
-            
-            db_b64 = base64.b64encode(db_content).decode('utf-8')
-            
-            file_sha = self.get_file_sha()
+            manifest = self.upload_chunks(backup_file)
+            commit_url = self.commit_backup(manifest, commit_message)
+            self.last_manifest = manifest
+            self.save_sync_state(manifest)
+            
+            metrics.inc('backups_total', (('outcome', 'ok'),))
+            metrics.observe('backup_duration_seconds', time.perf_counter() - start_time)
+            metrics.set_gauge('backup_size_bytes', manifest['original_size'], (('form', 'original'),))
+            metrics.set_gauge('backup_size_bytes', manifest['compressed_size'], (('form', 'compressed'),))
+            metrics.set_gauge('backup_last_success_timestamp_seconds', time.time())
+            print(f"✅ Database backed up to GitHub ({len(manifest['chunks'])} chunks, "
+                  f"{self.bot.format_file_size(manifest['compressed_size'])} compressed): {commit_url}")
+            return True
+                
+        except Exception as e:
+            print(f"❌ GitHub backup error: {e}")
+            metrics.inc('backups_total', (('outcome', 'failed'),))
+            return False
+        finally:
+            if backup_file:
+                try:
+                    os.remove(backup_file)
+                except:
+                    pass
+    
+    def iter_compressed_chunks(self, path, digest):
+        """Yield chunk_size pieces of the zlib-compressed file, reading it incrementally"""
+        compressor = zlib.compressobj(6)
+        buffer = bytearray()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(self.READ_BLOCK_SIZE), b''):
+                digest.update(block)
+                buffer += compressor.compress(block)
+                while len(buffer) >= self.chunk_size:
+                    yield bytes(buffer[:self.chunk_size])
+                    del buffer[:self.chunk_size]
+        buffer += compressor.flush()
+        while buffer:
+            yield bytes(buffer[:self.chunk_size])
+            del buffer[:self.chunk_size]
+    
+    def upload_chunks(self, path):
+        """Upload the compressed file as git blobs and return the manifest"""
+        snapshot = sqlite3.connect(path)
+        try:
+            write_counter = DatabaseManager.read_write_counter(snapshot)
+        finally:
+            snapshot.close()
+        
+        digest = hashlib.sha256()
+        chunks = []
+        for index, chunk in enumerate(self.iter_compressed_chunks(path, digest)):
+            response = self.bot.api.session.post(self.api_url('git/blobs'), headers=self.get_headers(), json={
+                'content': base64.b64encode(chunk).decode('ascii'),
+                'encoding': 'base64'
+            }, timeout=60)
+            if response.status_code != 201:
+                raise RuntimeError(f"blob upload failed: {response.status_code} - {response.text[:200]}")
+            chunks.append({
+                'path': f"{self.chunk_dir}/chunk-{index:05d}.zz",
+                'sha': response.json()['sha'],
+                'size': len(chunk)
+            })
+        
+        return {
+            'format': self.MANIFEST_FORMAT,
+            'version': self.MANIFEST_VERSION,
+            'compression': 'zlib',
+            'chunk_size': self.chunk_size,
+            'original_size': os.path.getsize(path),
+            'compressed_size': sum(chunk['size'] for chunk in chunks),
+            'sha256': digest.hexdigest(),
+            'write_counter': write_counter,
+            'created_at': datetime.now().isoformat(),
+            'chunks': chunks
+        }
+    
+    def commit_backup(self, manifest, commit_message):
+        """Commit the chunks and manifest on top of the branch head; returns the commit URL"""
+        previous = self.last_manifest or self.fetch_manifest()[0]
+        new_paths = {chunk['path'] for chunk in manifest['chunks']}
+        stale_paths = [chunk['path'] for chunk in (previous or {}).get('chunks', []) if chunk['path'] not in new_paths]
+        
+        tree_entries = [{'path': chunk['path'], 'mode': '100644', 'type': 'blob', 'sha': chunk['sha']}
+                        for chunk in manifest['chunks']]
+        tree_entries += [{'path': path, 'mode': '100644', 'type': 'blob', 'sha': None} for path in stale_paths]
+        tree_entries.append({'path': self.manifest_path, 'mode': '100644', 'type': 'blob',
+                             'content': json.dumps(manifest, indent=2)})
+        
+        session = self.bot.api.session
+        for attempt in range(self.MAX_SHA_RETRIES + 1):
+            response = session.get(self.api_url(f'git/ref/heads/{self.backup_branch}'), headers=self.get_headers(), timeout=15)
+            if response.status_code != 200:
+                raise RuntimeError(f"branch {self.backup_branch} not found: {response.status_code}")
+            head_sha = response.json()['object']['sha']
             
-            url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/contents/{self.backup_path}"
+            response = session.get(self.api_url(f'git/commits/{head_sha}'), headers=self.get_headers(), timeout=15)
+            base_tree = response.json()['tree']['sha']
             
-            headers = {
-                'Authorization': f'token {self.github_token}',
-                'Accept': 'application/vnd.github.v3+json'
-            }
+            response = session.post(self.api_url('git/trees'), headers=self.get_headers(),
+                                    json={'base_tree': base_tree, 'tree': tree_entries}, timeout=30)
+            if response.status_code != 201:
+                raise RuntimeError(f"tree creation failed: {response.status_code} - {response.text[:200]}")
+            tree_sha = response.json()['sha']
             
-            data = {
+            response = session.post(self.api_url('git/commits'), headers=self.get_headers(), json={
                 'message': commit_message,
-                'content': db_b64,
-                'branch': self.backup_branch
-            }
+                'tree': tree_sha,
+                'parents': [head_sha]
+            }, timeout=30)
+            if response.status_code != 201:
+                raise RuntimeError(f"commit creation failed: {response.status_code} - {response.text[:200]}")
+            commit = response.json()
+            
+            response = session.patch(self.api_url(f'git/refs/heads/{self.backup_branch}'), headers=self.get_headers(),
+                                     json={'sha': commit['sha'], 'force': False}, timeout=15)
+            if response.status_code == 200:
+                return commit.get('html_url', commit['sha'])
             
-            if file_sha:
-                data['sha'] = file_sha
+            # 409/422: someone else moved the branch; rebuild on the new head
+            if response.status_code in [409, 422] and attempt < self.MAX_SHA_RETRIES:
+                print(f"🔄 Backup branch moved ({response.status_code}), retrying commit (attempt {attempt + 1})")
+                continue
+            raise RuntimeError(f"ref update failed: {response.status_code} - {response.text[:200]}")
+    
+    def fetch_manifest(self, etag=None):
+        """Return (manifest, etag) of the latest chunked backup.
+
+        The manifest is None when there is no chunked backup, and
+        NOT_MODIFIED when etag is given and still matches (GitHub answers
+        304 without a body).
+        """
+        headers = self.get_headers(raw=True)
+        if etag:
+            headers['If-None-Match'] = etag
+        response = self.bot.api.session.get(self.api_url(f'contents/{self.manifest_path}'), headers=headers,
+                                            params={'ref': self.backup_branch}, timeout=15)
+        if response.status_code == 304:
+            return self.NOT_MODIFIED, etag
+        if response.status_code != 200:
+            return None, None
+        manifest = json.loads(response.content)
+        if manifest.get('format') != self.MANIFEST_FORMAT or manifest.get('version') != self.MANIFEST_VERSION:
+            print(f"⚠️ Unsupported backup manifest: {manifest.get('format')} v{manifest.get('version')}")
+            return None, None
+        return manifest, response.headers.get('ETag')
+    
+    def get_state_path(self):
+        return self.bot.get_db_path() + '.backup-state.json'
+    
+    def load_sync_state(self):
+        """Fingerprint of the backup the local database was last synced with"""
+        try:
+            with open(self.get_state_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def save_sync_state(self, manifest, etag=None):
+        try:
+            with open(self.get_state_path(), 'w') as f:
+                json.dump({
+                    'etag': etag,
+                    'sha256': manifest['sha256'],
+                    'original_size': manifest['original_size'],
+                    'write_counter': manifest.get('write_counter'),
+                    'created_at': manifest['created_at']
+                }, f)
+        except OSError as e:
+            print(f"⚠️ Could not save backup sync state: {e}")
+    
+    def restore_if_newer(self):
+        """Restore at startup only when the GitHub backup is newer than the local database.
+
+        Compares write counters: the local one from db_meta, the remote one
+        from the manifest. When the local database is still at or past the
+        last synced backup, the manifest is requested with its ETag so an
+        unchanged backup costs a single 304.
+        """
+        if not self.is_enabled:
+            return False
+        
+        try:
+            local_counter = self.bot.db.get_write_counter() if self.bot.db else None
+            state = self.load_sync_state()
+            etag = None
+            if local_counter is not None and local_counter >= (state.get('write_counter') or 0):
+                etag = state.get('etag')
+            
+            manifest, etag = self.fetch_manifest(etag)
+            if manifest is self.NOT_MODIFIED:
+                print(f"✅ GitHub backup unchanged since last sync, keeping local database ({local_counter} writes)")
+                return False
             
-            response = requests.put(url, headers=headers, json=data, timeout=30)
+            if manifest is None:
+                # Legacy single-file backups carry no fingerprint
+                if local_counter:
+                    print(f"ℹ️ Keeping local database ({local_counter} writes), legacy GitHub backup not compared")
+                    return False
+                return self.restore_legacy_backup()
             
-            if response.status_code in [200, 201]:
-                result = response.json()
-                print(f"✅ Database backed up to GitHub: {result['commit']['html_url']}")
-                
-                try:
-                    os.remove(backup_file)
-                except:
-                    pass
-                
-                return True
-            else:
-                print(f"❌ GitHub backup failed: {response.status_code} - {response.text}")
+            remote_counter = manifest.get('write_counter')
+            if remote_counter is not None and local_counter is not None and local_counter >= remote_counter:
+                print(f"✅ Local database is up to date ({local_counter} writes, backup has {remote_counter})")
+                self.save_sync_state(manifest, etag)
                 return False
-                
+            
+            print(f"🔄 GitHub backup is newer ({remote_counter} writes, local has {local_counter})")
+            return self.restore_database_from_github(manifest, etag)
+            
         except Exception as e:
-            print(f"❌ GitHub backup error: {e}")
+            print(f"❌ GitHub backup check error: {e}")
             return False
     
-    def get_file_sha(self):
-        """Get the SHA of the existing backup file on GitHub"""
-        try:
-            url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/contents/{self.backup_path}"
-            headers = {
-                'Authorization': f'token {self.github_token}',
-                'Accept': 'application/vnd.github.v3+json'
-            }
-            
-            response = requests.get(url, headers=headers, timeout=10)
-            if response.status_code == 200:
-                return response.json()['sha']
-            return None
-        except:
-            return None
+    def download_chunks(self, manifest, dest_path):
+        """Stream every chunk through a decompressor into dest_path and verify the checksum"""
+        decompressor = zlib.decompressobj()
+        digest = hashlib.sha256()
+        written = 0
+        with open(dest_path, 'wb') as out:
+            for chunk in manifest['chunks']:
+                response = self.bot.api.session.get(self.api_url(f"git/blobs/{chunk['sha']}"),
+                                                    headers=self.get_headers(raw=True), stream=True, timeout=60)
+                if response.status_code != 200:
+                    raise RuntimeError(f"chunk {chunk['path']} download failed: {response.status_code}")
+                received = 0
+                for block in response.iter_content(self.READ_BLOCK_SIZE):
+                    received += len(block)
+                    data = decompressor.decompress(block)
+                    digest.update(data)
+                    written += len(data)
+                    out.write(data)
+                if received != chunk['size']:
+                    raise RuntimeError(f"chunk {chunk['path']} is {received} bytes, expected {chunk['size']}")
+            data = decompressor.flush()
+            digest.update(data)
+            written += len(data)
+            out.write(data)
+        
+        if written != manifest['original_size'] or digest.hexdigest() != manifest['sha256']:
+            raise RuntimeError("restored database does not match the manifest checksum")
+        return written
     
-    def restore_database_from_github(self):
+    def restore_database_from_github(self, manifest=None, etag=None):
         """Restore database from GitHub backup"""
         if not self.is_enabled:
             print("⚠️ GitHub restore disabled")
             return False
         
+        db_path = self.bot.get_db_path()
+        temp_path = db_path + '.restore'
         try:
             print("🔄 Restoring database from GitHub...")
             
-            url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/contents/{self.backup_path}"
-            headers = {
-                'Authorization': f'token {self.github_token}',
-                'Accept': 'application/vnd.github.v3+json'
-            }
+            if manifest is None:
+                manifest, etag = self.fetch_manifest()
+            if manifest is None:
+                return self.restore_legacy_backup()
+            
+            size = self.download_chunks(manifest, temp_path)
+            
+            # Stale -wal/-shm files would be replayed over the restored copy
+            if self.bot.db:
+                self.bot.db.close()
+            DatabaseManager.remove_database_files(db_path)
+            os.replace(temp_path, db_path)
+            self.last_manifest = manifest
+            self.save_sync_state(manifest, etag)
             
-            response = requests.get(url, headers=headers, timeout=30)
+            print(f"✅ Database restored from GitHub backup ({self.bot.format_file_size(size)}, {len(manifest['chunks'])} chunks)")
+            print(f"📊 Backup date: {manifest['created_at']}")
+            
+            return True
+            
+        except Exception as e:
+            print(f"❌ GitHub restore error: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            if self.bot.db and self.bot.db.closed:
+                self.bot.setup_database()
+            return False
+    
+    def restore_legacy_backup(self):
+        """Restore a single-file backup written through the contents API"""
+        try:
+            response = self.bot.api.session.get(self.api_url(f'contents/{self.backup_path}'),
+                                                headers=self.get_headers(), timeout=30)
             if response.status_code != 200:
                 print(f"❌ No backup found on GitHub: {response.status_code}")
                 return False
@@ -400,16 +1430,19 @@ class GitHubBackupSystem:
             db_content = base64.b64decode(file_data['content'])
             
             db_path = self.bot.get_db_path()
+            if self.bot.db:
+                self.bot.db.close()
+            DatabaseManager.remove_database_files(db_path)
             with open(db_path, 'wb') as f:
                 f.write(db_content)
             
-            print(f"✅ Database restored from GitHub backup")
-            print(f"📊 Backup date: {file_data['commit']['commit']['author']['date']}")
-            
+            print(f"✅ Database restored from legacy GitHub backup")
             return True
             
         except Exception as e:
             print(f"❌ GitHub restore error: {e}")
+            if self.bot.db and self.bot.db.closed:
+                self.bot.setup_database()
             return False
     
     def get_backup_info(self):
@@ -418,15 +1451,10 @@ class GitHubBackupSystem:
             return {"enabled": False}
         
         try:
-            url = f"https://api.github.com/repos/{self.repo_owner}/{self.repo_name}/commits?path={self.backup_path}&per_page=1"
-            headers = {
-                'Authorization': f'token {self.github_token}',
-                'Accept': 'application/vnd.github.v3+json'
-            }
-            
-            response = requests.get(url, headers=headers, timeout=10)
-            if response.status_code == 200:
-                commits = response.json()
+            for path in (self.manifest_path, self.backup_path):
+                url = self.api_url(f"commits?path={path}&sha={self.backup_branch}&per_page=1")
+                response = self.bot.api.session.get(url, headers=self.get_headers(), timeout=10)
+                commits = response.json() if response.status_code == 200 else []
                 if commits:
                     latest_commit = commits[0]
                     return {
@@ -441,6 +1469,157 @@ class GitHubBackupSystem:
         except Exception as e:
             return {"enabled": True, "error": str(e)}
 
+class BackupScheduler:
+    """Coalesces backup triggers into debounced, single-flight GitHub backups.
+
+    Each trigger records a short action description. A single worker waits
+    until no new trigger arrived for BACKUP_DEBOUNCE_SECONDS (but never
+    longer than BACKUP_MAX_DELAY_SECONDS after the first one), then uploads
+    once with a commit message summarizing every coalesced action. Failed
+    backups put their actions back in the queue and are retried with
+    exponential backoff (capped at BACKUP_RETRY_MAX_SECONDS); after
+    BACKUP_MAX_FAILURES consecutive failures the scheduler stops retrying
+    on its own and waits for the next trigger.
+    """
+
+    MAX_LISTED_ACTIONS = 20
+
+    def __init__(self, backup_system):
+        self.backup_system = backup_system
+        self.debounce = float(os.environ.get('BACKUP_DEBOUNCE_SECONDS', 30))
+        self.max_delay = float(os.environ.get('BACKUP_MAX_DELAY_SECONDS', 300))
+        self.max_failures = int(os.environ.get('BACKUP_MAX_FAILURES', 5))
+        self.retry_max_delay = float(os.environ.get('BACKUP_RETRY_MAX_SECONDS', 3600))
+        self.consecutive_failures = 0
+        self.retry_at = 0.0
+        # Set after max_failures in a row; cleared by the next trigger
+        self.parked = False
+        self.stopped = False
+        self.condition = threading.Condition()
+        self.pending = []
+        self.first_trigger_at = None
+        self.last_trigger_at = None
+        self.worker = None
+        self.completed_count = 0
+        self.failed_count = 0
+        self.coalesced_count = 0
+
+    def schedule(self, action):
+        if not self.backup_system.is_enabled or self.stopped:
+            return
+        with self.condition:
+            now = time.monotonic()
+            self.pending.append(action)
+            self.parked = False
+            self.last_trigger_at = now
+            if self.first_trigger_at is None:
+                self.first_trigger_at = now
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self.worker_loop, name="backup-scheduler", daemon=True)
+                self.worker.start()
+            self.condition.notify()
+
+    def take_pending(self):
+        actions = self.pending
+        self.pending = []
+        self.first_trigger_at = None
+        return actions
+
+    def worker_loop(self):
+        while True:
+            with self.condition:
+                while (not self.pending or self.parked) and not self.stopped:
+                    self.condition.wait()
+                while self.pending and not self.parked and not self.stopped:
+                    due = min(self.last_trigger_at + self.debounce, self.first_trigger_at + self.max_delay)
+                    # Backoff after failures overrides both the debounce and the max delay
+                    due = max(due, self.retry_at)
+                    remaining = due - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                if self.stopped:
+                    return
+                if self.parked:
+                    continue
+                actions = self.take_pending()
+            if actions:
+                self.run_backup(actions)
+
+    def stop(self):
+        """Stop the worker; pending actions are dropped, the next change uploads the whole database anyway"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+            worker = self.worker
+        if worker and worker.is_alive() and worker is not threading.current_thread():
+            worker.join(timeout=10)
+
+    def backup_now(self, reason):
+        """Back up immediately, folding in any pending actions"""
+        with self.condition:
+            actions = self.take_pending()
+        return self.run_backup(actions, reason)
+
+    def run_backup(self, actions, reason=None):
+        success = self.backup_system.backup_database_to_github(self.build_commit_message(actions, reason))
+        with self.condition:
+            if success:
+                self.completed_count += 1
+                self.coalesced_count += max(len(actions) - 1, 0)
+                self.consecutive_failures = 0
+                self.retry_at = 0.0
+                self.parked = False
+                print(f"✅ Automatic backup completed for {len(actions)} action(s)")
+            else:
+                self.failed_count += 1
+                self.consecutive_failures += 1
+                now = time.monotonic()
+                retry_delay = min(self.debounce * 2 ** self.consecutive_failures, self.retry_max_delay)
+                self.retry_at = now + retry_delay
+                if actions:
+                    # Retry later together with anything new
+                    self.pending = actions + self.pending
+                    self.last_trigger_at = now
+                    self.first_trigger_at = self.first_trigger_at or now
+                if self.consecutive_failures == self.max_failures:
+                    print(f"🚨 Automatic backup failed {self.consecutive_failures} times in a row; "
+                          f"pausing retries until the next change (check GitHub token and repository access)")
+                if self.consecutive_failures >= self.max_failures:
+                    self.parked = True
+                else:
+                    print(f"⚠️ Automatic backup failed; {len(actions)} action(s) requeued, retrying in {retry_delay:.0f}s")
+                self.condition.notify()
+        return success
+
+    def build_commit_message(self, actions, reason=None):
+        if reason and not actions:
+            return reason
+        if not reason and len(actions) == 1:
+            return f"Auto backup: {actions[0]}"
+        
+        subject = reason or f"Auto backup: {len(actions)} changes"
+        counts = {}
+        for action in actions:
+            action_type = action.split(' - ')[0]
+            counts[action_type] = counts.get(action_type, 0) + 1
+        summary = ", ".join(f"{action_type} x{count}" for action_type, count in counts.items())
+        lines = [f"- {action}" for action in actions[:self.MAX_LISTED_ACTIONS]]
+        if len(actions) > self.MAX_LISTED_ACTIONS:
+            lines.append(f"- ... and {len(actions) - self.MAX_LISTED_ACTIONS} more")
+        return f"{subject}\n\n{summary}\n\n" + "\n".join(lines)
+
+    def get_status(self):
+        with self.condition:
+            return {
+                'pending': len(self.pending),
+                'completed': self.completed_count,
+                'failed': self.failed_count,
+                'consecutive_failures': self.consecutive_failures,
+                'paused': self.parked,
+                'coalesced': self.coalesced_count
+            }
+
 # ==================== REDEPLOY SYSTEM ====================
 
 class RedeploySystem:
@@ -542,6 +1721,9 @@ Choose an option:"""
             def delayed_restart():
                 time.sleep(restart_delay)
                 print(f"🔄 Executing {redeploy_type} redeploy...")
+                self.bot.flush_sessions()
+                if self.bot.backup_scheduler.get_status()['pending']:
+                    self.bot.backup_scheduler.backup_now("Auto backup: before redeploy")
                 os._exit(0)
             
             restart_thread = threading.Thread(target=delayed_restart, daemon=True)
@@ -576,7 +1758,7 @@ Choose an option:"""
                 'Content-Type': 'application/json'
             }
             
-            response = requests.post(redeploy_url, json=webhook_data, headers=headers, timeout=30)
+            response = self.bot.api.session.post(redeploy_url, json=webhook_data, headers=headers, timeout=30)
             
             if response.status_code == 200:
                 print(f"✅ Redeploy webhook triggered successfully")
@@ -671,49 +1853,8 @@ Choose an option:"""
 class TelegramStarsSystem:
     def __init__(self, bot_instance):
         self.bot = bot_instance
-        self.setup_stars_database()
         print("✅ Telegram Stars system initialized!")
         
-    def setup_stars_database(self):
-        """Setup stars payments database"""
-        try:
-            cursor = self.bot.conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS stars_transactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    user_name TEXT,
-                    stars_amount INTEGER,
-                    usd_amount REAL,
-                    description TEXT,
-                    telegram_star_amount INTEGER,
-                    transaction_id TEXT,
-                    payment_status TEXT DEFAULT 'pending',
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    completed_at DATETIME
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS stars_balance (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    total_stars_earned INTEGER DEFAULT 0,
-                    total_usd_earned REAL DEFAULT 0.0,
-                    available_stars INTEGER DEFAULT 0,
-                    available_usd REAL DEFAULT 0.0,
-                    last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            cursor.execute('INSERT OR IGNORE INTO stars_balance (id) VALUES (1)')
-            
-            self.bot.conn.commit()
-            print("✅ Telegram Stars database setup complete!")
-            
-        except Exception as e:
-            print(f"❌ Stars database setup error: {e}")
-    
     def create_stars_invoice(self, user_id, chat_id, stars_amount, description="Donation"):
         """Create Telegram Stars payment invoice"""
         try:
@@ -739,13 +1880,10 @@ class TelegramStarsSystem:
             
             print(f"⭐ Creating Stars invoice for {stars_amount} stars (${usd_amount:.2f})")
             
-            url = self.bot.base_url + "sendInvoice"
-            response = requests.post(url, data=invoice_data, timeout=30)
-            result = response.json()
+            result = self.bot.api.call("sendInvoice", invoice_data)
             
             if result.get('ok'):
-                cursor = self.bot.conn.cursor()
-                cursor.execute('''
+                self.bot.db.execute_write('''
                     INSERT INTO stars_transactions 
                     (user_id, user_name, stars_amount, usd_amount, description, transaction_id, payment_status)
                     VALUES (?, ?, ?, ?, ?, ?, ?)
@@ -758,8 +1896,6 @@ class TelegramStarsSystem:
                     invoice_payload,
                     'pending'
                 ))
-                
-                self.bot.conn.commit()
                 print(f"✅ Stars invoice created for user {user_id}: {stars_amount} stars")
                 return True
             else:
@@ -797,19 +1933,14 @@ class TelegramStarsSystem:
             
             print(f"⭐ Creating premium game invoice: {game_name} for {stars_amount} stars")
             
-            url = self.bot.base_url + "sendInvoice"
-            response = requests.post(url, data=invoice_data, timeout=30)
-            result = response.json()
+            result = self.bot.api.call("sendInvoice", invoice_data)
             
             if result.get('ok'):
-                cursor = self.bot.conn.cursor()
-                cursor.execute('''
+                self.bot.db.execute_write('''
                     INSERT INTO premium_purchases 
                     (user_id, game_id, stars_paid, transaction_id, status)
                     VALUES (?, ?, ?, ?, ?)
                 ''', (user_id, game_id, stars_amount, invoice_payload, 'pending'))
-                
-                self.bot.conn.commit()
                 print(f"✅ Premium game invoice created: {game_name} for user {user_id}")
                 return True
             else:
@@ -860,14 +1991,13 @@ class TelegramStarsSystem:
     def complete_premium_purchase(self, transaction_id):
         """Mark premium purchase as completed"""
         try:
-            cursor = self.bot.conn.cursor()
-            cursor.execute('''
+            self.bot.db.execute_writes([
+                ('''
                 UPDATE premium_purchases 
                 SET status = 'completed' 
                 WHERE transaction_id = ?
-            ''', (transaction_id,))
-            
-            cursor.execute('''
+                ''', (transaction_id,)),
+                ('''
                 UPDATE stars_balance 
                 SET total_stars_earned = total_stars_earned + (
                     SELECT stars_paid FROM premium_purchases WHERE transaction_id = ?
@@ -883,9 +2013,8 @@ class TelegramStarsSystem:
                 ),
                 last_updated = CURRENT_TIMESTAMP
                 WHERE id = 1
-            ''', (transaction_id, transaction_id, transaction_id, transaction_id))
-            
-            self.bot.conn.commit()
+                ''', (transaction_id, transaction_id, transaction_id, transaction_id)),
+            ])
             return True
         except Exception as e:
             print(f"❌ Error completing premium purchase: {e}")
@@ -896,60 +2025,19 @@ class TelegramStarsSystem:
 class GameRequestSystem:
     def __init__(self, bot_instance):
         self.bot = bot_instance
-        self.setup_game_requests_database()
         
-    def setup_game_requests_database(self):
-        """Setup game requests database"""
-        try:
-            cursor = self.bot.conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS game_requests (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    user_name TEXT,
-                    game_name TEXT,
-                    platform TEXT,
-                    status TEXT DEFAULT 'pending',
-                    admin_notes TEXT,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS game_request_replies (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    request_id INTEGER,
-                    admin_id INTEGER,
-                    reply_text TEXT,
-                    photo_file_id TEXT,
-                    reply_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (request_id) REFERENCES game_requests (id)
-                )
-            ''')
-            
-            self.bot.conn.commit()
-            print("✅ Game request system setup complete!")
-            
-        except Exception as e:
-            print(f"❌ Game request database setup error: {e}")
-    
     def submit_game_request(self, user_id, game_name, platform="Unknown"):
         """Submit a new game request"""
         try:
             user_info = self.bot.get_user_info(user_id)
             user_name = user_info.get('first_name', 'Anonymous')
             
-            cursor = self.bot.conn.cursor()
-            cursor.execute('''
+            cursor = self.bot.db.execute_write('''
                 INSERT INTO game_requests 
                 (user_id, user_name, game_name, platform, status)
                 VALUES (?, ?, ?, ?, ?)
             ''', (user_id, user_name, game_name, platform, 'pending'))
             
-            self.bot.conn.commit()
-            
             request_id = cursor.lastrowid
             
             self.notify_admins_about_request(user_id, user_name, game_name, platform, request_id)
@@ -1021,14 +2109,11 @@ class GameRequestSystem:
     def update_request_status(self, request_id, status, admin_notes=""):
         """Update game request status"""
         try:
-            cursor = self.bot.conn.cursor()
-            cursor.execute('''
+            self.bot.db.execute_write('''
                 UPDATE game_requests 
                 SET status = ?, admin_notes = ?, updated_at = CURRENT_TIMESTAMP
                 WHERE id = ?
             ''', (status, admin_notes, request_id))
-            
-            self.bot.conn.commit()
             return True
         except Exception as e:
             print(f"❌ Error updating request status: {e}")
@@ -1037,14 +2122,11 @@ class GameRequestSystem:
     def add_request_reply(self, request_id, admin_id, reply_text, photo_file_id=None):
         """Add a reply to a game request"""
         try:
-            cursor = self.bot.conn.cursor()
-            cursor.execute('''
+            self.bot.db.execute_write('''
                 INSERT INTO game_request_replies 
                 (request_id, admin_id, reply_text, photo_file_id)
                 VALUES (?, ?, ?, ?)
             ''', (request_id, admin_id, reply_text, photo_file_id))
-            
-            self.bot.conn.commit()
             return True
         except Exception as e:
             print(f"❌ Error adding request reply: {e}")
@@ -1096,57 +2178,11 @@ class GameRequestSystem:
 class PremiumGamesSystem:
     def __init__(self, bot_instance):
         self.bot = bot_instance
-        self.setup_premium_games_database()
         
-    def setup_premium_games_database(self):
-        """Setup premium games database"""
+    def add_premium_game(self, game_info):
+        """Add a premium game to database"""
         try:
-            cursor = self.bot.conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS premium_games (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    message_id INTEGER UNIQUE,
-                    file_name TEXT,
-                    file_type TEXT,
-                    file_size INTEGER,
-                    upload_date DATETIME,
-                    category TEXT,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    added_by INTEGER DEFAULT 0,
-                    is_uploaded INTEGER DEFAULT 0,
-                    is_forwarded INTEGER DEFAULT 0,
-                    file_id TEXT,
-                    bot_message_id INTEGER,
-                    stars_price INTEGER DEFAULT 0,
-                    description TEXT,
-                    is_premium INTEGER DEFAULT 1
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS premium_purchases (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    game_id INTEGER,
-                    stars_paid INTEGER,
-                    purchase_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    transaction_id TEXT,
-                    status TEXT DEFAULT 'completed'
-                )
-            ''')
-            
-            self.bot.conn.commit()
-            print("✅ Premium games system setup complete!")
-            
-        except Exception as e:
-            print(f"❌ Premium games database setup error: {e}")
-    
-    def add_premium_game(self, game_info):
-        """Add a premium game to database"""
-        try:
-            cursor = self.bot.conn.cursor()
-            cursor.execute('''
+            cursor = self.bot.db.execute_write('''
                 INSERT INTO premium_games 
                 (message_id, file_name, file_type, file_size, upload_date, category, 
                  added_by, is_uploaded, is_forwarded, file_id, bot_message_id, stars_price, description, is_premium)
@@ -1167,8 +2203,6 @@ class PremiumGamesSystem:
                 game_info.get('description', ''),
                 game_info.get('is_premium', 1)
             ))
-            
-            self.bot.conn.commit()
             return cursor.lastrowid
         except Exception as e:
             print(f"❌ Error adding premium game: {e}")
@@ -1236,19 +2270,1240 @@ class PremiumGamesSystem:
     def record_purchase(self, user_id, game_id, stars_paid, transaction_id):
         """Record a premium game purchase"""
         try:
-            cursor = self.bot.conn.cursor()
-            cursor.execute('''
+            self.bot.db.execute_write('''
                 INSERT INTO premium_purchases 
                 (user_id, game_id, stars_paid, transaction_id, status)
                 VALUES (?, ?, ?, ?, ?)
             ''', (user_id, game_id, stars_paid, transaction_id, 'completed'))
-            
-            self.bot.conn.commit()
             return True
         except Exception as e:
             print(f"❌ Error recording purchase: {e}")
             return False
 
+# ==================== ASYNC UPDATE ENGINE ====================
+
+# Imported only when UPDATE_ENGINE=async asks for them; they are slow to load
+aiohttp = None
+asyncio = None
+
+def load_async_modules():
+    """Import aiohttp and asyncio for the async engine; False if aiohttp is missing"""
+    global aiohttp, asyncio
+    if aiohttp is None:
+        try:
+            import aiohttp as aiohttp_module
+        except ImportError:
+            return False
+        import asyncio as asyncio_module
+        aiohttp, asyncio = aiohttp_module, asyncio_module
+    return True
+
+class AsyncUpdateEngine:
+    """Optional asyncio update loop (UPDATE_ENGINE=async, requires aiohttp).
+
+    At most ASYNC_MAX_PENDING updates are in flight (running or waiting for
+    their user's lock); past that, polling pauses until handlers catch up.
+    """
+
+    def __init__(self, bot_instance, max_concurrency=None, max_pending=None):
+        self.bot = bot_instance
+        self.max_concurrency = max_concurrency or int(os.environ.get('ASYNC_MAX_CONCURRENCY', 32))
+        self.max_pending = max(self.max_concurrency, max_pending or int(os.environ.get('ASYNC_MAX_PENDING', self.max_concurrency * 4)))
+        self.poll_timeout = 100
+        self.max_update_failures = 10
+        self.is_running = False
+        self.offset = 0
+        self.user_locks = {}
+        self.user_pending = {}
+        self.tasks = set()
+        print(f"✅ Async update engine initialized (concurrency: {self.max_concurrency})")
+
+    def run(self):
+        """Run the engine until stopped; blocks the calling thread"""
+        self.is_running = True
+        asyncio.run(self.main())
+
+    def stop(self):
+        self.is_running = False
+
+    async def main(self):
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="update"))
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        timeout = aiohttp.ClientTimeout(total=self.poll_timeout + 10)
+        update_failures = 0
+
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            while self.is_running:
+                try:
+                    updates = await self.fetch_updates(session)
+                    update_failures = 0
+                except Exception as e:
+                    update_failures += 1
+                    print(f"❌ Async get updates error (Failure #{update_failures}): {e}")
+                    if update_failures >= self.max_update_failures:
+                        raise ConnectionError("Too many update failures")
+                    await asyncio.sleep(min(2 ** update_failures, 30))
+                    continue
+
+                for update in updates:
+                    # Backpressure: don't take on more work than the handlers can drain
+                    while len(self.tasks) >= self.max_pending:
+                        await asyncio.wait(set(self.tasks), return_when=asyncio.FIRST_COMPLETED)
+                    self.offset = update['update_id'] + 1
+                    task = asyncio.create_task(self.handle_update(update))
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+
+            if self.tasks:
+                await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def fetch_updates(self, session):
+        """Long-poll getUpdates without blocking the handlers"""
+        params = {"timeout": self.poll_timeout, "offset": self.offset}
+        async with session.get(self.bot.base_url + "getUpdates", params=params) as response:
+            data = await response.json(content_type=None)
+
+        if not data.get('ok'):
+            raise ConnectionError(data.get('description', 'getUpdates failed'))
+
+        self.bot.health_monitor.record_updates()
+        return data.get('result', [])
+
+    async def handle_update(self, update):
+        """Run one update on a worker thread, serialized per user"""
+        key = self.bot.get_update_sender_id(update)
+        lock = self.user_locks.get(key)
+        if lock is None:
+            lock = self.user_locks[key] = asyncio.Lock()
+        self.user_pending[key] = self.user_pending.get(key, 0) + 1
+
+        try:
+            async with lock:
+                async with self.semaphore:
+                    await asyncio.to_thread(self.bot.dispatch_update, update)
+        except Exception as e:
+            print(f"❌ Async update processing error: {e}")
+        finally:
+            self.user_pending[key] -= 1
+            if self.user_pending[key] == 0:
+                del self.user_pending[key]
+                del self.user_locks[key]
+
+# ==================== CONCURRENT UPDATE DISPATCHER ====================
+
+class UpdateDispatcher:
+    """Worker pool between get_updates and the handlers.
+
+    Updates are hash-partitioned by sender id, one bounded queue per worker,
+    so a user's updates always run in order on the same worker while
+    unrelated users are handled in parallel. A partition has at most one
+    worker at a time: start() after stop() waits for the old generation to
+    drain first.
+    """
+
+    def __init__(self, bot_instance, num_workers=None, max_queue_size=None):
+        self.bot = bot_instance
+        self.num_workers = max(1, num_workers or int(os.environ.get('UPDATE_WORKERS', 8)))
+        self.max_queue_size = max_queue_size or int(os.environ.get('UPDATE_QUEUE_SIZE', 100))
+        self.submit_timeout = float(os.environ.get('UPDATE_SUBMIT_TIMEOUT', 2))
+        self.queues = [queue.Queue(maxsize=self.max_queue_size) for _ in range(self.num_workers)]
+        self.workers = []
+        self.stop_event = threading.Event()
+        self.lifecycle_lock = threading.Lock()
+        self.is_running = False
+        self.processed_count = 0
+        # Updates refused while a partition was full; the caller leaves them for Telegram to redeliver
+        self.deferred_count = 0
+
+    def start(self):
+        """Start one worker thread per partition"""
+        with self.lifecycle_lock:
+            if self.is_running:
+                return
+            # Two workers on one queue would run a user's updates concurrently
+            self.join()
+            self.workers = []
+            self.is_running = True
+            # Each generation of workers gets its own event so a restart can't revive old ones
+            self.stop_event = threading.Event()
+            for index, update_queue in enumerate(self.queues):
+                worker = threading.Thread(target=self.worker_loop, args=(update_queue, self.stop_event), name=f"update-worker-{index}", daemon=True)
+                worker.start()
+                self.workers.append(worker)
+        print(f"✅ Update dispatcher started: {self.num_workers} workers, queue limit {self.max_queue_size} per worker")
+
+    def stop(self):
+        """Stop workers after they finish the updates already queued.
+
+        Never blocks: the sentinel is only a wake-up for idle workers, and a
+        worker behind a full queue exits on its own once it has drained it.
+        """
+        if not self.is_running:
+            return
+        self.is_running = False
+        self.stop_event.set()
+        for update_queue in self.queues:
+            try:
+                update_queue.put_nowait(None)
+            except queue.Full:
+                pass
+
+    def join(self, timeout=None):
+        """Wait for stopped workers to finish their queues; True when all have exited"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in self.workers:
+            if worker is threading.current_thread():
+                continue
+            worker.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+        return not any(worker.is_alive() for worker in self.workers if worker is not threading.current_thread())
+
+    def submit(self, update, timeout=None):
+        """Queue an update; blocks while the partition is full (backpressure).
+
+        Returns False when the update was not queued (partition still full
+        after the timeout, or the dispatcher is stopped). The caller must not
+        confirm it to Telegram, so it is delivered again.
+        """
+        if not self.is_running:
+            return False
+        partition = self.bot.get_update_sender_id(update) % self.num_workers
+        timeout = self.submit_timeout if timeout is None else timeout
+        try:
+            self.queues[partition].put(update, timeout=timeout)
+            return True
+        except queue.Full:
+            self.deferred_count += 1
+            print(f"⏳ Update queue {partition} full for {timeout:g}s, leaving update {update.get('update_id')} for redelivery")
+            return False
+
+    def queue_depth(self):
+        return sum(update_queue.qsize() for update_queue in self.queues)
+
+    def worker_loop(self, update_queue, stop_event):
+        while True:
+            try:
+                update = update_queue.get(timeout=1)
+            except queue.Empty:
+                if stop_event.is_set():
+                    break
+                continue
+            try:
+                if update is None:
+                    if stop_event.is_set():
+                        break
+                    # Stale wake-up left by an earlier stop()
+                    continue
+                self.bot.dispatch_update(update)
+                self.processed_count += 1
+            finally:
+                update_queue.task_done()
+
+# ==================== CALLBACK ROUTER ====================
+
+class CallbackContext:
+    """Fields of an incoming callback query that handlers need"""
+
+    def __init__(self, callback_query):
+        message = callback_query['message']
+        self.query_id = callback_query['id']
+        self.data = callback_query['data']
+        self.chat_id = message['chat']['id']
+        self.message_id = message['message_id']
+        self.user_id = callback_query['from']['id']
+        self.first_name = callback_query['from']['first_name']
+        self.arg = ''
+
+class CallbackRouter:
+    """Maps callback_data to handlers.
+
+    Fixed buttons are a dict lookup; parameterized buttons (``send_game_<id>``)
+    are stored in a character trie and matched by longest prefix, with the
+    remainder passed to the handler as ``ctx.arg``. Exact routes win over
+    prefixes, so ``remove_games`` is never taken for ``remove_<type>_<id>``.
+    """
+
+    def __init__(self):
+        self.exact_routes = {}
+        self.prefix_trie = {}
+        self.routes = []
+        self.stats_lock = threading.Lock()
+
+    def add(self, pattern, handler, prefix=False, admin_only=False, on_denied=None, answers_query=False):
+        """Register a handler.
+
+        admin_only routes are refused for non-admins with an alert, or with
+        on_denied(ctx) when given. answers_query routes answer the callback
+        query themselves (Telegram accepts only one answer per query).
+        """
+        route = {
+            'pattern': pattern + ('*' if prefix else ''),
+            'handler': handler,
+            'admin_only': admin_only,
+            'on_denied': on_denied,
+            'answers_query': answers_query,
+            'hits': 0,
+            'errors': 0,
+            'total_time': 0.0,
+            'max_time': 0.0
+        }
+        if prefix:
+            node = self.prefix_trie
+            for char in pattern:
+                node = node.setdefault(char, {})
+            node[None] = route
+        else:
+            self.exact_routes[pattern] = route
+        self.routes.append(route)
+        return route
+
+    def resolve(self, data):
+        """Return (route, argument) for callback data, or (None, '')"""
+        route = self.exact_routes.get(data)
+        if route is not None:
+            return route, ''
+
+        match = (None, '')
+        node = self.prefix_trie
+        for index, char in enumerate(data):
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                match = (node[None], data[index + 1:])
+        return match
+
+    def dispatch(self, route, ctx):
+        """Run a route's handler and record its hit count and latency"""
+        start_time = time.perf_counter()
+        failed = False
+        try:
+            return route['handler'](ctx)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start_time
+            labels = (('route', route['pattern']),)
+            metrics.observe('callback_route_duration_seconds', elapsed, labels)
+            metrics.inc('callback_route_calls_total', labels + (('outcome', 'error' if failed else 'ok'),))
+            with self.stats_lock:
+                route['hits'] += 1
+                route['total_time'] += elapsed
+                if elapsed > route['max_time']:
+                    route['max_time'] = elapsed
+                if failed:
+                    route['errors'] += 1
+
+    def get_stats(self):
+        """Per-route stats, busiest first"""
+        with self.stats_lock:
+            stats = [{
+                'pattern': route['pattern'],
+                'hits': route['hits'],
+                'errors': route['errors'],
+                'avg_ms': route['total_time'] * 1000 / route['hits'] if route['hits'] else 0.0,
+                'max_ms': route['max_time'] * 1000
+            } for route in self.routes if route['hits']]
+        return sorted(stats, key=lambda item: item['hits'], reverse=True)
+
+class GameCallbackCodec:
+    """Compact callback_data for download buttons.
+
+    ``dl:`` followed by base64url of (version, source, row id) packed into
+    6 bytes, e.g. ``dl:AQAAAAAq`` -- well under Telegram's 64-byte limit
+    for any row id, so no file_id ever has to ride in the button.
+    """
+
+    PREFIX = "dl:"
+    VERSION = 1
+    LAYOUT = struct.Struct('>BBI')
+    SOURCE_CHANNEL = 0
+    SOURCE_PREMIUM = 1
+
+    @classmethod
+    def encode(cls, row_id, source=SOURCE_CHANNEL):
+        payload = cls.LAYOUT.pack(cls.VERSION, source, int(row_id))
+        return cls.PREFIX + base64.urlsafe_b64encode(payload).rstrip(b'=').decode('ascii')
+
+    @classmethod
+    def decode(cls, encoded):
+        """Return (source, row_id), or None for unknown versions or bad data"""
+        try:
+            raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            if len(raw) != cls.LAYOUT.size:
+                return None
+            version, source, row_id = cls.LAYOUT.unpack(raw)
+            if version != cls.VERSION:
+                return None
+            return source, row_id
+        except (ValueError, struct.error):
+            return None
+
+# ==================== USER STATE CACHE ====================
+
+class UserStateCache:
+    """LRU-bounded cache of per-user values with a TTL per entry.
+
+    Each user holds a few named fields (``state`` for the verified/joined
+    flags, ``member`` for the last getChatMember answer). Writers invalidate
+    the user after changing the row so reads never outlive a DB update.
+    """
+
+    def __init__(self, max_users=10000):
+        self.max_users = max_users
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, field):
+        """Return the cached value, or None when missing or expired"""
+        with self.lock:
+            fields = self.entries.get(user_id)
+            cached = fields.get(field) if fields else None
+            if cached is None or cached[1] < time.time():
+                self.misses += 1
+                return None
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+            return cached[0]
+
+    def set(self, user_id, field, value, ttl):
+        with self.lock:
+            fields = self.entries.get(user_id)
+            if fields is None:
+                fields = self.entries[user_id] = {}
+            else:
+                self.entries.move_to_end(user_id)
+            fields[field] = (value, time.time() + ttl)
+            while len(self.entries) > self.max_users:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id, field=None):
+        with self.lock:
+            if field is None:
+                self.entries.pop(user_id, None)
+            elif user_id in self.entries:
+                self.entries[user_id].pop(field, None)
+
+    def clear(self):
+        """Forget every user; needed whenever the database underneath is replaced"""
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        with self.lock:
+            return {'users': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+# ==================== SESSION STORE ====================
+
+class SessionStore(MutableMapping):
+    """Dict-like per-user conversation state with a sliding TTL and an LRU cap.
+
+    Reading or writing a key renews its TTL, so an active conversation never
+    expires mid-flow. Expired keys behave as missing and are dropped lazily
+    on access or by sweep(). Values are returned by reference, so in-place
+    updates like ``store[user_id]['stage'] = ...`` keep working.
+
+    A persistent store also records which keys changed since the last
+    drain_changes() so they can be written behind to SQLite. Assignments
+    are always written. Keys that were only read are re-serialized at drain
+    time and written only if the value was mutated in place, or if the
+    renewed expiry has drifted more than half a TTL from the stored one, so
+    read-only lookups cost no writes.
+    """
+
+    def __init__(self, kind, ttl, max_entries, persistent=False):
+        self.kind = kind
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.persistent = persistent
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        self.expired_count = 0
+        self.evicted_count = 0
+        self.changed_keys = set()
+        self.removed_keys = set()
+        self.read_keys = set()
+        # key -> (json data, expires_at) as last written to SQLite
+        self.persisted = {}
+
+    def mark_changed(self, key):
+        if self.persistent:
+            self.changed_keys.add(key)
+            self.removed_keys.discard(key)
+
+    def mark_read(self, key):
+        if self.persistent:
+            self.read_keys.add(key)
+
+    def mark_removed(self, key):
+        if self.persistent:
+            self.removed_keys.add(key)
+            self.changed_keys.discard(key)
+            self.read_keys.discard(key)
+            self.persisted.pop(key, None)
+
+    def __getitem__(self, key):
+        with self.lock:
+            value, expires_at = self.entries[key]
+            now = time.time()
+            if expires_at < now:
+                del self.entries[key]
+                self.expired_count += 1
+                self.mark_removed(key)
+                raise KeyError(key)
+            self.entries[key] = (value, now + self.ttl)
+            self.entries.move_to_end(key)
+            self.mark_read(key)
+            return value
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.time() + self.ttl)
+            self.entries.move_to_end(key)
+            self.mark_changed(key)
+            while len(self.entries) > self.max_entries:
+                evicted_key, _ = self.entries.popitem(last=False)
+                self.evicted_count += 1
+                self.mark_removed(evicted_key)
+
+    def __delitem__(self, key):
+        with self.lock:
+            del self.entries[key]
+            self.mark_removed(key)
+
+    def __contains__(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and entry[1] >= time.time()
+
+    def __iter__(self):
+        now = time.time()
+        with self.lock:
+            live_keys = [key for key, (_, expires_at) in self.entries.items() if expires_at >= now]
+        return iter(live_keys)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def sweep(self):
+        """Drop expired entries; returns how many were removed"""
+        now = time.time()
+        with self.lock:
+            expired = [key for key, (_, expires_at) in self.entries.items() if expires_at < now]
+            for key in expired:
+                del self.entries[key]
+                # The flush deletes expired rows by timestamp, no per-key delete needed
+                self.persisted.pop(key, None)
+                self.read_keys.discard(key)
+                self.changed_keys.discard(key)
+            self.expired_count += len(expired)
+        return len(expired)
+
+    def load(self, key, value, expires_at):
+        """Insert a restored entry without recording it as a change"""
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            if self.persistent:
+                self.persisted[key] = (json.dumps(value), expires_at)
+
+    def reset(self):
+        """Forget every entry and pending change"""
+        with self.lock:
+            self.entries.clear()
+            self.changed_keys.clear()
+            self.removed_keys.clear()
+            self.read_keys.clear()
+            self.persisted.clear()
+
+    def drain_changes(self):
+        """Return ([(key, json_data, expires_at)], [removed keys]) since the last drain"""
+        with self.lock:
+            upserts = []
+            for key in self.changed_keys | self.read_keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                try:
+                    data = json.dumps(entry[0])
+                except (TypeError, ValueError) as e:
+                    print(f"⚠️ Session {self.kind}/{key} is not serializable: {e}")
+                    continue
+                stored = self.persisted.get(key)
+                if (key not in self.changed_keys and stored is not None and stored[0] == data
+                        and entry[1] - stored[1] <= self.ttl / 2):
+                    continue
+                upserts.append((key, data, entry[1]))
+                self.persisted[key] = (data, entry[1])
+            removed = list(self.removed_keys)
+            self.changed_keys.clear()
+            self.removed_keys.clear()
+            self.read_keys.clear()
+            return upserts, removed
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'ttl': self.ttl,
+                'max_entries': self.max_entries,
+                'expired': self.expired_count,
+                'evicted': self.evicted_count
+            }
+
+# ==================== BROADCAST ENGINE ====================
+
+class BroadcastEngine:
+    """Runs admin broadcasts as persisted background jobs.
+
+    Recipients are walked in user_id order in chunks; each chunk is sent
+    through a worker pool and the job's cursor (last user_id handled) and
+    counters are saved before the next chunk, so a restart resumes from the
+    cursor. The engine paces itself below the global Bot API budget to
+    leave room for interactive replies, and edits one progress message on
+    a timer instead of posting a new one.
+
+    Content is staged once: the announcement is posted to a staging chat
+    (BROADCAST_STAGING_CHAT_ID, or the admin's chat) and every recipient
+    gets a copyMessage of it, so each request carries only ids and any
+    media type the admin sends can be broadcast.
+
+    Every recipient's outcome is logged in broadcast_deliveries, committed
+    together with the cursor. Users Telegram reports as unreachable are
+    marked is_active = 0 and skipped by later broadcasts until they /start
+    the bot again.
+    """
+
+    # Error classes after which messaging the user again is pointless
+    UNREACHABLE_ERRORS = {'blocked', 'deactivated', 'chat_not_found'}
+    # Message keys that can be broadcast, and those whose copies take no caption
+    MEDIA_TYPES = ('photo', 'video', 'animation', 'document', 'audio', 'voice', 'video_note', 'sticker')
+    CAPTIONLESS_TYPES = {'video_note', 'sticker'}
+
+    def __init__(self, bot_instance):
+        self.bot = bot_instance
+        self.workers = int(os.environ.get('BROADCAST_WORKERS', 8))
+        self.chunk_size = int(os.environ.get('BROADCAST_CHUNK_SIZE', 100))
+        self.progress_interval = float(os.environ.get('BROADCAST_PROGRESS_INTERVAL', 5))
+        self.pacer = OutboundRateLimiter(global_rate=float(os.environ.get('BROADCAST_RATE_PER_SEC', 25)))
+        self.active_jobs = set()
+        self.job_threads = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.log_retention_days = int(os.environ.get('BROADCAST_LOG_RETENTION_DAYS', 90))
+
+    def create_job(self, admin_id, chat_id, session):
+        """Persist a new job from a broadcast session and return its id"""
+        message, photo = session.get('message', ''), session.get('photo')
+        content_type = session.get('media_type') or ('photo' if photo else 'text')
+        cursor = self.bot.conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM users WHERE is_verified = 1 AND is_active = 1')
+        total_users = cursor.fetchone()[0]
+        cursor = self.bot.db.execute_write('''
+            INSERT INTO broadcast_jobs
+            (admin_id, chat_id, content_type, message, photo, source_chat_id, source_message_id,
+             status, total_users, started_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, 'running', ?, ?)
+        ''', (admin_id, chat_id, content_type, message, photo, session.get('source_chat_id'),
+              session.get('source_message_id'), total_users, time.time()))
+        return cursor.lastrowid
+
+    def load_job(self, job_id):
+        cursor = self.bot.conn.cursor()
+        cursor.execute('SELECT * FROM broadcast_jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return dict(zip([column[0] for column in cursor.description], row))
+
+    def start_job(self, job_id):
+        with self.lock:
+            if job_id in self.active_jobs or self.stop_event.is_set():
+                return False
+            self.active_jobs.add(job_id)
+            job_thread = threading.Thread(target=self.run_job, args=(job_id,), name=f"broadcast-job-{job_id}", daemon=True)
+            self.job_threads[job_id] = job_thread
+        job_thread.start()
+        return True
+
+    def stop(self, timeout=30):
+        """Pause running jobs after their current chunk; they stay 'running' and resume on the next start"""
+        self.stop_event.set()
+        with self.lock:
+            job_threads = list(self.job_threads.values())
+        deadline = time.time() + timeout
+        for job_thread in job_threads:
+            job_thread.join(timeout=max(deadline - time.time(), 0))
+
+    def resume_jobs(self):
+        """Restart jobs that were still running when the process stopped"""
+        try:
+            cursor = self.bot.conn.cursor()
+            cursor.execute("SELECT id, processed_count, total_users FROM broadcast_jobs WHERE status = 'running'")
+            for job_id, processed, total in cursor.fetchall():
+                print(f"📢 Resuming broadcast #{job_id} at {processed}/{total} users")
+                self.start_job(job_id)
+        except Exception as e:
+            print(f"❌ Broadcast resume error: {e}")
+
+    def get_recipients(self, after_user_id):
+        cursor = self.bot.conn.cursor()
+        cursor.execute('''
+            SELECT user_id FROM users
+            WHERE is_verified = 1 AND is_active = 1 AND user_id > ?
+            ORDER BY user_id LIMIT ?
+        ''', (after_user_id, self.chunk_size))
+        return [row[0] for row in cursor.fetchall()]
+
+    def format_message(self, job):
+        return f"📢 <b>Announcement from Admin</b>\n\n{job['message']}\n\n────────────────────\n<i>This is an automated broadcast message</i>"
+
+    def stage_content(self, job):
+        """Post the announcement once to the staging chat; returns True when staged"""
+        staging_chat_id = os.environ.get('BROADCAST_STAGING_CHAT_ID') or job['chat_id']
+        try:
+            if job['content_type'] == 'text':
+                result = self.bot.api.call("sendMessage", {
+                    "chat_id": staging_chat_id,
+                    "text": self.format_message(job),
+                    "parse_mode": "HTML"
+                })
+            elif job['content_type'] == 'photo' and job['photo']:
+                result = self.bot.api.call("sendPhoto", {
+                    "chat_id": staging_chat_id,
+                    "photo": job['photo'],
+                    "caption": self.format_message(job),
+                    "parse_mode": "HTML"
+                })
+            else:
+                data = {
+                    "chat_id": staging_chat_id,
+                    "from_chat_id": job['source_chat_id'],
+                    "message_id": job['source_message_id']
+                }
+                if job['content_type'] not in self.CAPTIONLESS_TYPES:
+                    data["caption"] = self.format_message(job)
+                    data["parse_mode"] = "HTML"
+                result = self.bot.api.call("copyMessage", data)
+        except Exception as e:
+            print(f"❌ Broadcast #{job['id']} staging error: {e}")
+            return False
+        
+        if not result.get('ok'):
+            print(f"❌ Broadcast #{job['id']} staging failed: {result.get('description')}")
+            return False
+        
+        job['staging_chat_id'] = staging_chat_id
+        job['staging_message_id'] = result['result']['message_id']
+        self.bot.db.execute_write('UPDATE broadcast_jobs SET staging_chat_id = ?, staging_message_id = ? WHERE id = ?',
+                                  (str(staging_chat_id), job['staging_message_id'], job['id']))
+        print(f"📌 Broadcast #{job['id']} staged as message {job['staging_message_id']} in {staging_chat_id}")
+        return True
+
+    def fail_job(self, job, reason):
+        self.bot.db.execute_write("UPDATE broadcast_jobs SET status = 'failed', updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                                  (job['id'],))
+        self.bot.robust_send_message(job['chat_id'], f"❌ Broadcast failed: {reason}")
+
+    @staticmethod
+    def classify_error(result):
+        """Map a failed Bot API result to a short error class"""
+        description = result.get('description', '').lower()
+        error_code = result.get('error_code', 0)
+        if 'bot was blocked' in description:
+            return 'blocked'
+        if 'user is deactivated' in description:
+            return 'deactivated'
+        if 'chat not found' in description or 'user not found' in description:
+            return 'chat_not_found'
+        if error_code == 429:
+            return 'flood'
+        if error_code == 403:
+            return 'forbidden'
+        if error_code == 400:
+            return 'bad_request'
+        if error_code >= 500:
+            return 'server'
+        return 'other'
+
+    def send_to_recipient(self, job, user_id):
+        """Send to one user; returns (ok, error_class, error_code)"""
+        self.pacer.acquire()
+        try:
+            if job['staging_message_id']:
+                result = self.bot.api.call("copyMessage", {
+                    "chat_id": user_id,
+                    "from_chat_id": job['staging_chat_id'],
+                    "message_id": job['staging_message_id']
+                })
+            elif job['photo']:
+                result = self.bot.api.call("sendPhoto", {
+                    "chat_id": user_id,
+                    "photo": job['photo'],
+                    "caption": self.format_message(job),
+                    "parse_mode": "HTML"
+                })
+            else:
+                result = self.bot.api.call("sendMessage", {
+                    "chat_id": user_id,
+                    "text": self.format_message(job),
+                    "parse_mode": "HTML"
+                })
+            if result.get('ok'):
+                return True, None, None
+            return False, self.classify_error(result), result.get('error_code')
+        except Exception as e:
+            print(f"❌ Broadcast error for user {user_id}: {e}")
+            return False, 'network', None
+
+    def record_chunk(self, job, recipients, outcomes):
+        """Log deliveries, deactivate unreachable users and advance the cursor in one transaction"""
+        statements = [
+            ('''
+                INSERT OR REPLACE INTO broadcast_deliveries (job_id, user_id, status, error_class, error_code)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (job['id'], user_id, 'sent' if ok else 'failed', error_class, error_code))
+            for user_id, (ok, error_class, error_code) in zip(recipients, outcomes)
+        ]
+        unreachable = [user_id for user_id, (ok, error_class, _) in zip(recipients, outcomes)
+                       if not ok and error_class in self.UNREACHABLE_ERRORS]
+        statements.extend(('UPDATE users SET is_active = 0 WHERE user_id = ?', (user_id,)) for user_id in unreachable)
+        statements.append(('''
+            UPDATE broadcast_jobs
+            SET cursor = ?, processed_count = ?, success_count = ?, failed_count = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (job['cursor'], job['processed_count'], job['success_count'], job['failed_count'], job['id'])))
+        self.bot.db.execute_writes(statements)
+        delivered = sum(1 for ok, _, _ in outcomes if ok)
+        metrics.inc('broadcast_deliveries_total', (('outcome', 'sent'),), delivered)
+        metrics.inc('broadcast_deliveries_total', (('outcome', 'failed'),), len(outcomes) - delivered)
+        if unreachable:
+            print(f"🚫 Broadcast #{job['id']}: marked {len(unreachable)} unreachable users inactive")
+
+    def run_job(self, job_id):
+        try:
+            job = self.load_job(job_id)
+            if not job or job['status'] != 'running':
+                return
+            
+            if not job['progress_message_id']:
+                result = self.bot.api.call("sendMessage", {
+                    "chat_id": job['chat_id'],
+                    "text": f"📤 Starting broadcast...\n📊 Total users: {job['total_users']}\n⏳ Sending messages...",
+                    "parse_mode": "HTML"
+                })
+                if result.get('ok'):
+                    job['progress_message_id'] = result['result']['message_id']
+                    self.bot.db.execute_write('UPDATE broadcast_jobs SET progress_message_id = ? WHERE id = ?',
+                                              (job['progress_message_id'], job_id))
+            
+            # Text and photos can still be sent directly if staging fails; other media cannot
+            if not job['staging_message_id'] and not self.stage_content(job):
+                if job['content_type'] not in ('text', 'photo'):
+                    self.fail_job(job, "could not stage the message for copying")
+                    return
+            
+            last_progress = time.time()
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"broadcast-{job_id}") as pool:
+                while not self.stop_event.is_set():
+                    recipients = self.get_recipients(job['cursor'])
+                    if not recipients:
+                        break
+                    
+                    outcomes = list(pool.map(lambda user_id: self.send_to_recipient(job, user_id), recipients))
+                    delivered = sum(1 for ok, _, _ in outcomes if ok)
+                    job['cursor'] = recipients[-1]
+                    job['processed_count'] += len(recipients)
+                    job['success_count'] += delivered
+                    job['failed_count'] += len(outcomes) - delivered
+                    self.record_chunk(job, recipients, outcomes)
+                    
+                    if time.time() - last_progress >= self.progress_interval:
+                        self.update_progress(job)
+                        last_progress = time.time()
+            
+            if self.stop_event.is_set():
+                print(f"⏸️ Broadcast #{job_id} paused at {job['processed_count']}/{job['total_users']} users")
+                return
+            self.finish_job(job)
+        except Exception as e:
+            print(f"❌ Broadcast job #{job_id} error: {e}")
+            traceback.print_exc()
+        finally:
+            with self.lock:
+                self.active_jobs.discard(job_id)
+                self.job_threads.pop(job_id, None)
+
+    def update_progress(self, job):
+        total_users = max(job['total_users'], job['processed_count'], 1)
+        processed = job['processed_count']
+        progress = int(processed * 100 / total_users)
+        elapsed = time.time() - job['started_at']
+        eta = (elapsed / processed) * (total_users - processed) if processed > 0 else 0
+        
+        progress_text = f"""📤 <b>Broadcast Progress</b>
+
+📊 Progress: {processed}/{total_users} users
+{self.bot.create_progress_bar(progress)} {progress}%
+
+✅ Successful: {job['success_count']}
+❌ Failed: {job['failed_count']}
+⏱️ Elapsed: {elapsed:.1f}s
+⏳ ETA: {eta:.1f}s
+
+Sending messages..."""
+        
+        if job['progress_message_id']:
+            self.bot.edit_message(job['chat_id'], job['progress_message_id'], progress_text)
+
+    def finish_job(self, job):
+        self.bot.db.execute_writes([
+            ('''
+                UPDATE broadcast_jobs SET status = 'completed', completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (job['id'],)),
+            ("DELETE FROM broadcast_deliveries WHERE delivered_at < datetime('now', ?)",
+             (f'-{self.log_retention_days} days',)),
+        ])
+        
+        total_users = job['processed_count']
+        elapsed_total = max(time.time() - job['started_at'], 0.001)
+        success_rate = (job['success_count'] / total_users) * 100 if total_users > 0 else 0
+        broadcast_type = job['content_type'].replace('_', ' ').title()
+        
+        stats_text = f"""✅ <b>Broadcast Completed!</b>
+
+📊 Final Statistics:
+• 📤 Total users: {total_users}
+• ✅ Successful: {job['success_count']}
+• ❌ Failed: {job['failed_count']}
+• 📈 Success rate: {success_rate:.1f}%
+• ⏱️ Total time: {elapsed_total:.1f}s
+• 🚀 Speed: {total_users/elapsed_total:.1f} users/second
+• 📝 Type: {broadcast_type} Broadcast
+
+📝 Message sent to {job['success_count']} users successfully."""
+        
+        if not (job['progress_message_id'] and self.bot.edit_message(job['chat_id'], job['progress_message_id'], stats_text)):
+            self.bot.robust_send_message(job['chat_id'], stats_text)
+        print(f"✅ Broadcast #{job['id']} completed: {job['success_count']}/{total_users} delivered")
+
+    def get_totals(self):
+        cursor = self.bot.conn.cursor()
+        cursor.execute('''
+            SELECT COUNT(*), COALESCE(SUM(content_type = 'text'), 0), COALESCE(SUM(content_type = 'photo'), 0)
+            FROM broadcast_jobs
+        ''')
+        total, text_count, photo_count = cursor.fetchone()
+        media_count = total - text_count - photo_count
+        cursor.execute('''
+            SELECT COALESCE(SUM(status = 'sent'), 0), COALESCE(SUM(status = 'failed'), 0),
+                   COUNT(DISTINCT CASE WHEN status = 'sent' THEN user_id END)
+            FROM broadcast_deliveries
+        ''')
+        sent, failed, reached = cursor.fetchone()
+        cursor.execute('''
+            SELECT error_class, COUNT(*) FROM broadcast_deliveries
+            WHERE status = 'failed' GROUP BY error_class ORDER BY COUNT(*) DESC
+        ''')
+        errors = cursor.fetchall()
+        cursor.execute('SELECT COUNT(*) FROM users WHERE is_verified = 1 AND is_active = 0')
+        inactive = cursor.fetchone()[0]
+        return {'total': total, 'sent': sent, 'failed': failed, 'reached': reached, 'text': text_count,
+                'photo': photo_count, 'media': media_count, 'errors': errors, 'inactive': inactive}
+
+    def get_recent_jobs(self, limit=5):
+        cursor = self.bot.conn.cursor()
+        cursor.execute('''
+            SELECT id, created_at, content_type, status, success_count, total_users
+            FROM broadcast_jobs ORDER BY id DESC LIMIT ?
+        ''', (limit,))
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+# ==================== FILE VERIFICATION ====================
+
+class FileVerificationJob:
+    """Checks in the background that uploaded game files are still reachable.
+
+    Each pass picks the uploaded rows of channel_games and premium_games
+    that were never verified or were last verified more than
+    FILE_VERIFY_INTERVAL_HOURS ago, oldest first, and runs getFile for them
+    on a small worker pool. The calls are paced by their own token bucket so
+    verification never competes with replies for the Bot API budget. Results
+    are written to last_verified_at / is_accessible per row; transient
+    failures (network errors, flood control, 5xx) leave the row due for the
+    next pass.
+    """
+
+    TABLES = ('channel_games', 'premium_games')
+
+    def __init__(self, bot_instance):
+        self.bot = bot_instance
+        self.workers = int(os.environ.get('FILE_VERIFY_WORKERS', 4))
+        self.batch_size = int(os.environ.get('FILE_VERIFY_BATCH_SIZE', 100))
+        self.interval_hours = float(os.environ.get('FILE_VERIFY_INTERVAL_HOURS', 24))
+        self.poll_interval = float(os.environ.get('FILE_VERIFY_POLL_SECONDS', 600))
+        self.start_delay = float(os.environ.get('FILE_VERIFY_START_DELAY', 15))
+        self.pacer = OutboundRateLimiter(global_rate=float(os.environ.get('FILE_VERIFY_RATE_PER_SEC', 5)))
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.last_pass = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return False
+        if self.stop_event.is_set():
+            return False
+        self.thread = threading.Thread(target=self.worker_loop, name="file-verifier", daemon=True)
+        self.thread.start()
+        print(f"🔍 File verification scheduled (every {self.interval_hours:g}h per file, {self.workers} workers)")
+        return True
+
+    def stop(self, timeout=10):
+        self.stop_event.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+
+    def worker_loop(self):
+        if self.stop_event.wait(self.start_delay):
+            return
+        while True:
+            try:
+                self.run_pass()
+            except Exception as e:
+                print(f"❌ File verification error: {e}")
+            if self.stop_event.wait(self.poll_interval):
+                return
+
+    def get_due_files(self, limit):
+        """Oldest-verified uploaded files first; never-verified rows sort ahead of all others"""
+        cursor = self.bot.conn.cursor()
+        cutoff = f'-{self.interval_hours} hours'
+        due = []
+        for table in self.TABLES:
+            cursor.execute(f'''
+                SELECT id, file_name, file_id, last_verified_at FROM {table}
+                WHERE is_uploaded = 1 AND bot_message_id IS NOT NULL AND file_id IS NOT NULL
+                  AND (last_verified_at IS NULL OR last_verified_at < datetime('now', ?))
+                ORDER BY last_verified_at
+                LIMIT ?
+            ''', (cutoff, limit))
+            due.extend((table, row_id, file_name, file_id, verified_at)
+                       for row_id, file_name, file_id, verified_at in cursor.fetchall())
+        due.sort(key=lambda row: row[4] or '')
+        return due[:limit]
+
+    def check_file(self, file_id):
+        """True/False when Telegram answered, None when the answer was inconclusive"""
+        self.pacer.acquire()
+        try:
+            result = self.bot.api.call("getFile", {"file_id": file_id})
+        except requests.exceptions.RequestException:
+            return None
+        if result.get('ok'):
+            return True
+        error_code = result.get('error_code') or 0
+        if error_code == 429 or error_code >= 500:
+            return None
+        return False
+
+    def run_pass(self):
+        """Verify every due file, a batch at a time; returns (checked, inaccessible)"""
+        checked = inaccessible = 0
+        started = time.time()
+        # Inconclusive rows stay due; skip them for the rest of this pass
+        skipped = set()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="file-verify") as pool:
+            while not self.stop_event.is_set():
+                files = [row for row in self.get_due_files(self.batch_size + len(skipped))
+                         if row[:2] not in skipped][:self.batch_size]
+                if not files:
+                    break
+                results = list(pool.map(lambda row: self.check_file(row[3]), files))
+                statements = [
+                    (f'UPDATE {table} SET last_verified_at = CURRENT_TIMESTAMP, is_accessible = ? WHERE id = ?',
+                     (1 if ok else 0, row_id))
+                    for (table, row_id, _, _, _), ok in zip(files, results) if ok is not None
+                ]
+                if statements:
+                    self.bot.db.execute_writes(statements)
+                for (_, _, file_name, _, _), ok in zip(files, results):
+                    if ok is False:
+                        print(f"⚠️ Uploaded file is no longer accessible: {file_name}")
+                skipped.update(row[:2] for row, ok in zip(files, results) if ok is None)
+                checked += len(statements)
+                inaccessible += sum(1 for ok in results if ok is False)
+        
+        self.last_pass = {'finished_at': time.time(), 'duration': time.time() - started,
+                          'checked': checked, 'inaccessible': inaccessible}
+        if checked:
+            print(f"✅ File verification pass: {checked} files checked, {inaccessible} inaccessible "
+                  f"({self.last_pass['duration']:.1f}s)")
+        return checked, inaccessible
+
+    def get_stats(self):
+        cursor = self.bot.conn.cursor()
+        stats = {'total': 0, 'accessible': 0, 'inaccessible': 0, 'unverified': 0}
+        for table in self.TABLES:
+            cursor.execute(f'''
+                SELECT COUNT(*),
+                       SUM(CASE WHEN last_verified_at IS NOT NULL AND is_accessible = 1 THEN 1 ELSE 0 END),
+                       SUM(CASE WHEN last_verified_at IS NOT NULL AND is_accessible = 0 THEN 1 ELSE 0 END),
+                       SUM(CASE WHEN last_verified_at IS NULL THEN 1 ELSE 0 END)
+                FROM {table}
+                WHERE is_uploaded = 1 AND bot_message_id IS NOT NULL
+            ''')
+            total, accessible, missing, unverified = cursor.fetchone()
+            stats['total'] += total
+            stats['accessible'] += accessible or 0
+            stats['inaccessible'] += missing or 0
+            stats['unverified'] += unverified or 0
+        stats['last_pass'] = self.last_pass
+        return stats
+
+# ==================== HEALTH MONITOR ====================
+
+class HealthMonitor:
+    """Liveness signals behind /health.
+
+    The request path only reads cached values: when updates last arrived
+    (a getUpdates that returned, or a webhook delivery), when the Bot API
+    last answered, the update queue depth, and the result of the last
+    database ping. A background refresher pings the database every
+    HEALTH_REFRESH_SECONDS and calls getMe only when no other API call has
+    succeeded recently, so probes never generate Telegram traffic and never
+    wait on it. Stale Telegram-side signals report "degraded" with a 200;
+    only a failing database or a saturated update queue returns 503.
+    """
+
+    def __init__(self, bot_instance):
+        self.bot = bot_instance
+        self.refresh_interval = float(os.environ.get('HEALTH_REFRESH_SECONDS', 15))
+        self.api_ping_after = float(os.environ.get('HEALTH_API_PING_SECONDS', 120))
+        self.stale_after = float(os.environ.get('HEALTH_STALE_SECONDS', 300))
+        self.mode = 'polling'
+        self.started_at = None
+        self.last_update_at = None
+        self.last_refresh_at = None
+        self.db_ok = None
+        self.db_latency_ms = None
+        self.db_error = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def record_updates(self):
+        """Called whenever updates arrive or a long poll returns cleanly"""
+        self.last_update_at = time.time()
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.started_at = time.time()
+        self.refresh()
+        self.thread = threading.Thread(target=self.refresh_loop, name="health-refresher", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5):
+        self.stop_event.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+
+    def refresh_loop(self):
+        while not self.stop_event.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"❌ Health refresh error: {e}")
+
+    def refresh(self):
+        start_time = time.perf_counter()
+        try:
+            self.bot.conn.execute('SELECT 1').fetchone()
+            self.db_ok, self.db_error = True, None
+        except Exception as e:
+            self.db_ok, self.db_error = False, str(e)
+        self.db_latency_ms = (time.perf_counter() - start_time) * 1000
+        
+        last_success = self.bot.api.last_success_at
+        if last_success is None or time.time() - last_success > self.api_ping_after:
+            try:
+                self.bot.api.call("getMe", http_method='GET')
+            except Exception as e:
+                print(f"⚠️ Health getMe failed: {e}")
+        self.last_refresh_at = time.time()
+
+    @staticmethod
+    def age(timestamp, now):
+        return round(now - timestamp, 1) if timestamp else None
+
+    def get_health(self):
+        """Return (payload, HTTP status) from cached signals only"""
+        now = time.time()
+        if self.started_at is None:
+            return {'status': 'starting', 'timestamp': now, 'service': 'telegram-game-bot',
+                    'version': '1.0.0', 'bot_status': 'starting'}, 200
+        
+        # Signals get a grace period after startup before they can be stale
+        def fresh(timestamp):
+            return now - (timestamp or self.started_at) <= self.stale_after
+        
+        dispatcher = self.bot.update_dispatcher
+        queue_depth = dispatcher.queue_depth()
+        queue_capacity = dispatcher.num_workers * dispatcher.max_queue_size
+        api_ok = fresh(self.bot.api.last_success_at)
+        updates_ok = self.mode == 'webhook' or fresh(self.last_update_at)
+        refresher_ok = now - (self.last_refresh_at or 0) <= 3 * self.refresh_interval + 5
+        db_ok = bool(self.db_ok) and refresher_ok
+        queue_ok = queue_depth < queue_capacity * 0.9
+        
+        checks = {
+            'updates': {
+                'status': 'healthy' if updates_ok else 'degraded',
+                'mode': self.mode,
+                'last_update_age': self.age(self.last_update_at, now)
+            },
+            'telegram_api': {
+                'status': 'healthy' if api_ok else 'degraded',
+                'last_success_age': self.age(self.bot.api.last_success_at, now),
+                'last_failure_age': self.age(self.bot.api.last_failure_at, now)
+            },
+            'database': {
+                'status': 'healthy' if db_ok else 'unhealthy',
+                'latency_ms': round(self.db_latency_ms, 2) if self.db_latency_ms is not None else None,
+                'checked_age': self.age(self.last_refresh_at, now),
+                'error': self.db_error
+            },
+            'update_queue': {
+                'status': 'healthy' if queue_ok else 'unhealthy',
+                'depth': queue_depth,
+                'capacity': queue_capacity
+            }
+        }
+        
+        # Only local faults fail the probe: a restart cannot fix a Telegram outage,
+        # and the keep-alive restarts the process after repeated non-200 answers
+        if not (db_ok and queue_ok):
+            status, status_code = 'unhealthy', 503
+        elif not (updates_ok and api_ok):
+            status, status_code = 'degraded', 200
+        else:
+            status, status_code = 'healthy', 200
+        
+        return {
+            'status': status,
+            'timestamp': now,
+            'service': 'telegram-game-bot',
+            'version': '1.0.0',
+            'bot_status': status,
+            'uptime': round(now - self.started_at, 1),
+            'checks': checks
+        }, status_code
+
 # ==================== MAIN BOT CLASS ====================
 
 class CrossPlatformBot:
@@ -1262,6 +3517,7 @@ class CrossPlatformBot:
         
         self.token = token
         self.base_url = f"https://api.telegram.org/bot{token}/"
+        self.api = TelegramBotAPI(token)
         
         # YOUR CHANNEL DETAILS
         self.REQUIRED_CHANNEL = "@pspgamers5"
@@ -1270,26 +3526,31 @@ class CrossPlatformBot:
         # ADMIN USER IDs
         self.ADMIN_IDS = [7475473197, 7713987088]
         
+        # Per-user conversation state, bounded by SESSION_KINDS TTLs and caps
+        self.session_stores = {}
+        self.SESSION_MAX_ENTRIES = int(os.environ.get('SESSION_MAX_ENTRIES', 5000))
+        
         # Mini-games state management
-        self.guess_games = {}
-        self.spin_games = {}
+        self.guess_games = self.create_session_store('guess_games')
+        self.spin_games = self.create_session_store('spin_games')
         
         # Broadcast system
-        self.broadcast_sessions = {}
-        self.broadcast_stats = {}
-        
-        # Stars, request, redeploy, and backup systems
-        self.stars_system = TelegramStarsSystem(self)
-        self.game_request_system = GameRequestSystem(self)
-        self.premium_games_system = PremiumGamesSystem(self)
-        self.redeploy_system = RedeploySystem(self)
+        self.broadcast_sessions = self.create_session_store('broadcast_sessions')
+        self.broadcast_engine = BroadcastEngine(self)
+        self.file_verifier = FileVerificationJob(self)
+        
+        # Stars, request, premium and redeploy systems are built on first use
+        # (see get_subsystem); backup is needed right away for the restore check
+        self.subsystems = {}
+        self.subsystems_lock = threading.Lock()
         self.github_backup = GitHubBackupSystem(self)
+        self.backup_scheduler = BackupScheduler(self.github_backup)
         
         # Session management
-        self.stars_sessions = {}
-        self.request_sessions = {}
-        self.upload_sessions = {}
-        self.reply_sessions = {}
+        self.stars_sessions = self.create_session_store('stars_sessions')
+        self.request_sessions = self.create_session_store('request_sessions')
+        self.upload_sessions = self.create_session_store('upload_sessions')
+        self.reply_sessions = self.create_session_store('reply_sessions')
         
         # CRASH PROTECTION
         self.last_restart = time.time()
@@ -1302,13 +3563,41 @@ class CrossPlatformBot:
         # Keep-alive service
         self.keep_alive = None
         
+        # Set by shutdown(); every background loop of this instance watches it
+        self.stop_event = threading.Event()
+        
+        # Update dispatching (per-user ordered worker pool)
+        self.update_dispatcher = UpdateDispatcher(self)
+        self.health_monitor = HealthMonitor(self)
+        metrics.register_collector('bot', self.collect_metrics)
+        
+        # Inline button routing
+        self.callback_router = CallbackRouter()
+        self.setup_callback_routes()
+        
+        # Game search (games_fts is created in setup_database when SQLite supports it)
+        self.fts_enabled = False
+        self.SEARCH_RESULT_LIMIT = int(os.environ.get('SEARCH_MAX_RESULTS', 50))
+        
+        # Verified/joined flags and channel membership, cached per user
+        self.user_state_cache = UserStateCache(int(os.environ.get('USER_CACHE_SIZE', 10000)))
+        self.USER_STATE_TTL = int(os.environ.get('USER_STATE_TTL', 300))
+        self.MEMBERSHIP_TTL = int(os.environ.get('MEMBERSHIP_CACHE_TTL', 300))
+        self.MEMBERSHIP_NEGATIVE_TTL = 30
+        
+        # SQLite access (WAL, per-thread readers, single writer thread)
+        self.db = None
+        startup_profiler.mark('bot state')
         self.setup_database()
-        self.verify_database_schema()
-        self.games_cache = {}
+        startup_profiler.mark('database')
+        # Buckets exist from the start so incremental adds work before the first rebuild
+        self.games_cache = {bucket: {} for bucket in self.GAME_CACHE_BUCKETS}
+        self.game_file_refs = {}
+        self.games_cache_lock = threading.RLock()
         self.premium_games_cache = {}
         self.is_scanning = False
-        self.search_sessions = {}
-        self.search_results = {}
+        self.search_sessions = self.create_session_store('search_sessions')
+        self.search_results = self.create_session_store('search_results')
         
         print("✅ Bot system ready!")
         print(f"📊 Monitoring channel: {self.REQUIRED_CHANNEL}")
@@ -1330,6 +3619,48 @@ class CrossPlatformBot:
         print("🔋 Enhanced keep-alive system ready")
         print("💾 Persistent data recovery enabled")
     
+    def collect_metrics(self):
+        """Gauges read at scrape time for /metrics"""
+        yield 'update_queue_depth', (), self.update_dispatcher.queue_depth()
+        if self.db and not self.db.closed:
+            yield 'sqlite_write_queue_depth', (), self.db.write_queue.qsize()
+        yield 'broadcast_active_jobs', (), len(self.broadcast_engine.active_jobs)
+        for kind, store in self.session_stores.items():
+            yield 'session_store_entries', (('kind', kind),), len(store)
+        yield 'user_state_cache_entries', (), self.user_state_cache.get_stats()['users']
+        yield 'telegram_api_throttled_total', (), self.api.rate_limiter.throttled_count
+        yield 'telegram_api_flood_waits_total', (), self.api.rate_limiter.flood_wait_count
+        yield 'bot_errors', (), self.error_count
+        yield 'bot_consecutive_errors', (), self.consecutive_errors
+        if self.keep_alive:
+            yield 'keepalive_pings_total', (), self.keep_alive.ping_count
+    
+    def get_subsystem(self, name, factory):
+        """Build a subsystem on first use; most runs never touch most of them"""
+        subsystem = self.subsystems.get(name)
+        if subsystem is None:
+            with self.subsystems_lock:
+                subsystem = self.subsystems.get(name)
+                if subsystem is None:
+                    subsystem = self.subsystems[name] = factory(self)
+        return subsystem
+    
+    @property
+    def stars_system(self):
+        return self.get_subsystem('stars_system', TelegramStarsSystem)
+    
+    @property
+    def game_request_system(self):
+        return self.get_subsystem('game_request_system', GameRequestSystem)
+    
+    @property
+    def premium_games_system(self):
+        return self.get_subsystem('premium_games_system', PremiumGamesSystem)
+    
+    @property
+    def redeploy_system(self):
+        return self.get_subsystem('redeploy_system', RedeploySystem)
+    
     def get_db_path(self):
         """Get fixed database path that persists across restarts"""
         db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'telegram_bot.db')
@@ -1347,37 +3678,53 @@ class CrossPlatformBot:
                 os.makedirs(db_dir, exist_ok=True)
             
             # Try to restore from GitHub first
+            restored = False
             if self.github_backup.is_enabled:
                 print("🔍 Checking for GitHub backup...")
-                if self.github_backup.restore_database_from_github():
+                restored = self.github_backup.restore_if_newer()
+                if restored:
                     print("✅ Database restored from GitHub")
                 else:
-                    print("ℹ️ No GitHub backup found or restore failed, using local database")
+                    print("ℹ️ Using local database")
             
-            # Ensure database is properly set up
-            self.setup_database()
-            self.verify_database_schema()
+            # Reopen on the restored file (the local database is already open otherwise)
+            if restored or not self.db or self.db.closed:
+                self.setup_database()
+            startup_profiler.mark('backup check')
             
             # Recover games cache
             self.update_games_cache()
+            self.start_games_cache_checker()
+            self.start_session_sweeper()
+            self.start_session_flusher()
+            startup_profiler.mark('games cache')
             
-            # Recover uploaded files
+            # Verify uploaded files in the background; polling does not wait for it
             self.recover_uploaded_files()
             
             # Recover sessions from database
             self.recover_persistent_sessions()
             
+            # Pick up broadcasts interrupted by a restart
+            self.broadcast_engine.resume_jobs()
+            startup_profiler.mark('sessions and jobs')
+            
             # Test bot connection
             if not self.test_bot_connection():
                 print("❌ Bot connection failed during initialization")
                 return False
+            startup_profiler.mark('getMe')
                 
             # Start keep-alive service
             if not self.start_keep_alive():
                 print("❌ Keep-alive service failed to start")
                 return False
+            startup_profiler.mark('keep-alive')
+            
+            self.health_monitor.start()
                 
             print("✅ Bot initialization with persistence completed successfully!")
+            startup_profiler.report()
             return True
             
         except Exception as e:
@@ -1387,77 +3734,111 @@ class CrossPlatformBot:
     def recover_persistent_sessions(self):
         """Recover persistent sessions from database"""
         try:
-            self.guess_games = {}
-            self.spin_games = {}
-            self.broadcast_sessions = {}
-            self.stars_sessions = {}
-            self.request_sessions = {}
-            self.upload_sessions = {}
-            self.reply_sessions = {}
-            self.search_sessions = {}
-            self.search_results = {}
-            
-            print("✅ Sessions reset for fresh start")
+            for store in self.session_stores.values():
+                store.reset()
+            
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT kind, user_id, data, expires_at FROM sessions WHERE expires_at >= ?', (time.time(),))
+            restored = 0
+            for kind, user_id, data, expires_at in cursor.fetchall():
+                store = self.session_stores.get(kind)
+                if store is None or not store.persistent:
+                    continue
+                store.load(user_id, json.loads(data), expires_at)
+                restored += 1
+            
+            self.db.execute_write('DELETE FROM sessions WHERE expires_at < ?', (time.time(),))
+            print(f"✅ Recovered {restored} active sessions")
         except Exception as e:
             print(f"❌ Session recovery error: {e}")
 
-    def recover_uploaded_files(self):
-        """Recover and verify all uploaded files after restart"""
+    # (ttl seconds, max entries or None for SESSION_MAX_ENTRIES, persisted to SQLite) per session kind
+    SESSION_KINDS = {
+        'guess_games': (3600, None, True),
+        'spin_games': (86400, None, True),
+        'broadcast_sessions': (3600, None, True),
+        'stars_sessions': (1800, None, True),
+        'request_sessions': (1800, None, True),
+        'upload_sessions': (3600, None, True),
+        'reply_sessions': (3600, None, True),
+        'search_sessions': (1800, None, True),
+        'search_results': (1800, 1000, False),
+    }
+    
+    def create_session_store(self, kind):
+        ttl, max_entries, persistent = self.SESSION_KINDS[kind]
+        store = SessionStore(kind, ttl, max_entries or self.SESSION_MAX_ENTRIES, persistent)
+        self.session_stores[kind] = store
+        return store
+    
+    def flush_sessions(self):
+        """Write changed sessions to SQLite in one transaction (write-behind)"""
         try:
-            if not hasattr(self, 'conn') or not self.conn:
-                self.setup_database()
-            
-            print("🔄 Recovering uploaded files...")
-            
-            cursor = self.conn.cursor()
-            
-            # Check bot-uploaded files
-            cursor.execute('''
-                SELECT message_id, file_name, bot_message_id, file_id 
-                FROM channel_games 
-                WHERE is_uploaded = 1 AND bot_message_id IS NOT NULL
-            ''')
-            bot_files = cursor.fetchall()
-            
-            recovered_count = 0
-            for message_id, file_name, bot_message_id, file_id in bot_files:
-                if self.verify_file_accessible(bot_message_id, file_id, True):
-                    recovered_count += 1
-                    print(f"✅ Recovered bot file: {file_name}")
-                else:
-                    print(f"⚠️ Bot file may be inaccessible: {file_name}")
-            
-            # Check premium games
-            cursor.execute('''
-                SELECT id, file_name, bot_message_id, file_id 
-                FROM premium_games 
-                WHERE is_uploaded = 1 AND bot_message_id IS NOT NULL
-            ''')
-            premium_files = cursor.fetchall()
-            
-            for game_id, file_name, bot_message_id, file_id in premium_files:
-                if self.verify_file_accessible(bot_message_id, file_id, True):
-                    recovered_count += 1
-                    print(f"✅ Recovered premium file: {file_name}")
-                else:
-                    print(f"⚠️ Premium file may be inaccessible: {file_name}")
-            
-            print(f"✅ File recovery complete: {recovered_count} files verified")
-            return recovered_count
-            
+            statements = []
+            for kind, store in self.session_stores.items():
+                if not store.persistent:
+                    continue
+                upserts, removed = store.drain_changes()
+                statements.extend(
+                    ('INSERT OR REPLACE INTO sessions (kind, user_id, data, expires_at) VALUES (?, ?, ?, ?)',
+                     (kind, key, data, expires_at))
+                    for key, data, expires_at in upserts
+                )
+                statements.extend(
+                    ('DELETE FROM sessions WHERE kind = ? AND user_id = ?', (kind, key))
+                    for key in removed
+                )
+            if not statements:
+                return 0
+            statements.append(('DELETE FROM sessions WHERE expires_at < ?', (time.time(),)))
+            self.db.execute_writes(statements)
+            return len(statements) - 1
         except Exception as e:
-            print(f"❌ File recovery error: {e}")
+            print(f"❌ Session flush error: {e}")
             return 0
-
-    def verify_file_accessible(self, message_id, file_id, is_bot_file):
-        """Verify if a file is still accessible"""
+    
+    def start_session_flusher(self):
+        """Persist session changes every SESSION_FLUSH_INTERVAL seconds"""
+        interval = float(os.environ.get('SESSION_FLUSH_INTERVAL', 2))
+        
+        def flusher_loop():
+            while not self.stop_event.wait(interval):
+                self.flush_sessions()
+        
+        flusher_thread = threading.Thread(target=flusher_loop, name="session-flusher", daemon=True)
+        flusher_thread.start()
+        print(f"✅ Session write-behind every {interval:g}s")
+    
+    def sweep_sessions(self):
+        """Drop expired entries from every session store"""
+        removed = 0
+        for store in self.session_stores.values():
+            removed += store.sweep()
+        if removed:
+            print(f"🧹 Expired {removed} idle sessions")
+        return removed
+    
+    def start_session_sweeper(self):
+        """Run sweep_sessions periodically in the background"""
+        interval = int(os.environ.get('SESSION_SWEEP_INTERVAL', 60))
+        
+        def sweeper_loop():
+            while not self.stop_event.wait(interval):
+                try:
+                    self.sweep_sessions()
+                except Exception as e:
+                    print(f"❌ Session sweep error: {e}")
+        
+        sweeper_thread = threading.Thread(target=sweeper_loop, name="session-sweeper", daemon=True)
+        sweeper_thread.start()
+        print(f"✅ Session sweeper running every {interval}s")
+    
+    def recover_uploaded_files(self):
+        """Start background verification of uploaded files after restart"""
         try:
-            url = self.base_url + "getFile"
-            data = {"file_id": file_id}
-            response = requests.post(url, data=data, timeout=10)
-            result = response.json()
-            return result.get('ok', False)
-        except:
+            return self.file_verifier.start()
+        except Exception as e:
+            print(f"❌ File recovery error: {e}")
             return False
 
     def start_keep_alive(self):
@@ -1480,26 +3861,9 @@ class CrossPlatformBot:
     # ==================== GITHUB BACKUP INTEGRATION ====================
 
     def backup_after_game_action(self, action_type, game_name=""):
-        """Trigger backup after game-related actions"""
-        if not self.github_backup.is_enabled:
-            return
-        
-        def async_backup():
-            try:
-                commit_message = f"Auto backup: {action_type}"
-                if game_name:
-                    commit_message += f" - {game_name}"
-                
-                success = self.github_backup.backup_database_to_github(commit_message)
-                if success:
-                    print(f"✅ Automatic backup completed for: {action_type}")
-                else:
-                    print(f"⚠️ Automatic backup failed for: {action_type}")
-            except Exception as e:
-                print(f"❌ Backup thread error: {e}")
-        
-        backup_thread = threading.Thread(target=async_backup, daemon=True)
-        backup_thread.start()
+        """Schedule a (coalesced) backup after game-related actions"""
+        action = f"{action_type} - {game_name}" if game_name else action_type
+        self.backup_scheduler.schedule(action)
 
     def show_backup_menu(self, user_id, chat_id, message_id):
         """Show backup management menu for admins"""
@@ -1524,6 +3888,8 @@ class CrossPlatformBot:
 • Games are removed  
 • All games are cleared
 • Manual backup triggered"""
+                scheduler_status = self.backup_scheduler.get_status()
+                status_text += f"\n\n⏳ Pending changes: {scheduler_status['pending']} (batched every {self.backup_scheduler.debounce:.0f}s of quiet)"
             else:
                 status_text = f"""💾 <b>GitHub Backup System</b>
 
@@ -1569,7 +3935,7 @@ To enable GitHub backups, set these environment variables:
         self.edit_message(chat_id, message_id, "💾 Creating manual backup...", None)
         
         def backup_operation():
-            success = self.github_backup.backup_database_to_github("Manual backup: Admin triggered")
+            success = self.backup_scheduler.backup_now("Manual backup: Admin triggered")
             
             if success:
                 result_text = "✅ <b>Backup Created Successfully!</b>\n\nYour database has been backed up to GitHub."
@@ -1634,7 +4000,6 @@ Are you sure you want to continue?"""
             
             if success:
                 self.setup_database()
-                self.verify_database_schema()
                 self.update_games_cache()
                 
                 result_text = """✅ <b>Database Restored Successfully!</b>
@@ -1918,270 +4283,274 @@ If the issue persists, please contact the admins directly."""
 
     def handle_callback_query(self, callback_query):
         try:
-            data = callback_query['data']
-            message = callback_query['message']
-            chat_id = message['chat']['id']
-            message_id = message['message_id']
-            user_id = callback_query['from']['id']
-            first_name = callback_query['from']['first_name']
-            
-            print(f"📨 Callback: {data} from {first_name} ({user_id})")
+            ctx = CallbackContext(callback_query)
             
-            self.answer_callback_query(callback_query['id'])
+            print(f"📨 Callback: {ctx.data} from {ctx.first_name} ({ctx.user_id})")
             
-            # Backup System Callbacks
-            if data == "backup_menu":
-                if not self.is_admin(user_id):
-                    self.answer_callback_query(callback_query['id'], "❌ Access denied. Admin only.", True)
-                    return
-                self.show_backup_menu(user_id, chat_id, message_id)
-                return
-                
-            elif data == "create_backup":
-                if not self.is_admin(user_id):
-                    self.answer_callback_query(callback_query['id'], "❌ Access denied. Admin only.", True)
-                    return
-                self.handle_create_backup(user_id, chat_id, message_id)
-                return
-                
-            elif data == "restore_backup":
-                if not self.is_admin(user_id):
-                    self.answer_callback_query(callback_query['id'], "❌ Access denied. Admin only.", True)
-                    return
-                self.handle_restore_backup(user_id, chat_id, message_id)
+            route, ctx.arg = self.callback_router.resolve(ctx.data)
+            if route is None:
+                self.answer_callback_query(ctx.query_id)
+                print(f"⚠️ Unknown callback data: {ctx.data}")
                 return
-                
-            elif data == "confirm_restore_backup":
-                if not self.is_admin(user_id):
-                    self.answer_callback_query(callback_query['id'], "❌ Access denied. Admin only.", True)
-                    return
-                self.handle_confirm_restore(user_id, chat_id, message_id)
-                return
-                
-            elif data == "backup_info":
-                if not self.is_admin(user_id):
-                    self.answer_callback_query(callback_query['id'], "❌ Access denied. Admin only.", True)
-                    return
-                self.show_backup_menu(user_id, chat_id, message_id)
-                return
-
-            # Redeploy System Callbacks
-            if data == "redeploy_panel":
-                if not self.is_admin(user_id):
-                    self.answer_callback_query(callback_query['id'], "❌ Access denied. Admin only.", True)
-                    return
-                self.redeploy_system.show_redeploy_menu(user_id, chat_id, message_id)
-                return
-                
-            elif data == "user_redeploy":
-                self.handle_user_redeploy_request(user_id, chat_id, message_id)
-                return
-                
-            elif data.startswith("redeploy_"):
-                if not self.is_admin(user_id):
-                    self.answer_callback_query(callback_query['id'], "❌ Access denied. Admin only.", True)
-                    return
-                
-                redeploy_type = data.replace("redeploy_", "")
-                if redeploy_type in ["soft", "force"]:
-                    self.redeploy_system.initiate_redeploy(user_id, chat_id, redeploy_type)
-                return
-                
-            elif data == "system_status":
-                if not self.is_admin(user_id):
-                    self.answer_callback_query(callback_query['id'], "❌ Access denied. Admin only.", True)
-                    return
-                self.redeploy_system.show_system_status(user_id, chat_id, message_id)
-                return
-
-            # Game Removal System Callbacks
-            if data == "remove_games":
-                self.show_remove_game_menu(user_id, chat_id, message_id)
-                return
-                
-            elif data == "search_remove_game":
-                self.start_remove_game_search(user_id, chat_id)
-                return
-                
-            elif data.startswith("confirm_remove_"):
-                parts = data.replace("confirm_remove_", "").split("_")
-                if len(parts) >= 2:
-                    game_type = parts[0]
-                    game_id = parts[1]
-                    self.show_remove_confirmation(user_id, chat_id, message_id, game_type, game_id)
-                return
-
-            elif data.startswith("remove_"):
-                parts = data.replace("remove_", "").split("_")
-                if len(parts) >= 2:
-                    game_type = parts[0]
-                    game_id = parts[1]
-                    self.remove_game(user_id, chat_id, game_type, game_id, message_id)
-                return
-
-            elif data == "cancel_remove":
-                self.show_remove_game_menu(user_id, chat_id, message_id)
-                return
-
-            elif data == "view_recent_uploads":
-                cursor = self.conn.cursor()
-                cursor.execute('''
-                    SELECT message_id, file_name, file_type, file_size, upload_date, is_uploaded 
-                    FROM channel_games 
-                    WHERE is_uploaded = 1 
-                    ORDER BY created_at DESC 
-                    LIMIT 10
-                ''')
-                recent_uploads = cursor.fetchall()
-                
-                if not recent_uploads:
-                    self.edit_message(chat_id, message_id, "❌ No recent uploads found.", self.create_admin_buttons())
-                    return
-                
-                uploads_text = "📋 <b>Recent Admin Uploads</b>\n\n"
-                uploads_text += "Click 'Remove' to delete any game:\n\n"
-                
-                keyboard_buttons = []
-                for upload in recent_uploads:
-                    msg_id, file_name, file_type, file_size, upload_date, is_uploaded = upload
-                    size = self.format_file_size(file_size)
-                    
-                    uploads_text += f"📁 <b>{file_name}</b>\n"
-                    uploads_text += f"📦 {file_type} | 📏 {size} | 📅 {upload_date[:10]}\n"
-                    uploads_text += f"🆔 {msg_id}\n\n"
-                    
-                    keyboard_buttons.append([{
-                        "text": f"🗑️ Remove {file_name[:20]}{'...' if len(file_name) > 20 else ''}",
-                        "callback_data": f"confirm_remove_R_{msg_id}"
-                    }])
-                
-                keyboard_buttons.append([{"text": "🔙 Back", "callback_data": "remove_games"}])
-                keyboard = {"inline_keyboard": keyboard_buttons}
-                
-                self.edit_message(chat_id, message_id, uploads_text, keyboard)
-                return
-
-            # Premium games callbacks
-            if data == "premium_games":
-                self.show_premium_games_menu(user_id, chat_id, message_id)
-                return
-                
-            elif data.startswith("purchase_premium_"):
-                game_id = int(data.replace("purchase_premium_", ""))
-                self.purchase_premium_game(user_id, chat_id, game_id, message_id)
-                return
-                
-            elif data.startswith("download_premium_"):
-                game_id = int(data.replace("download_premium_", ""))
-                self.send_premium_game_file(user_id, chat_id, game_id)
+            
+            if route['admin_only'] and not self.is_admin(ctx.user_id):
+                if route['on_denied']:
+                    self.answer_callback_query(ctx.query_id)
+                    route['on_denied'](ctx)
+                else:
+                    self.answer_callback_query(ctx.query_id, "❌ Access denied. Admin only.", True)
                 return
+            
+            if not route['answers_query']:
+                self.answer_callback_query(ctx.query_id)
+            
+            self.callback_router.dispatch(route, ctx)
                 
-            elif data.startswith("premium_details_"):
-                game_id = int(data.replace("premium_details_", ""))
-                self.show_premium_game_details(user_id, chat_id, game_id, message_id)
-                return
+        except Exception as e:
+            print(f"Callback error: {e}")
+            traceback.print_exc()
 
-            # Upload system callbacks
-            elif data == "upload_options":
-                self.show_upload_options(user_id, chat_id, message_id)
-                return
-                
-            elif data == "upload_regular":
-                self.robust_send_message(chat_id,
-                    "🆓 <b>Regular Game Upload</b>\n\n"
-                    "Please upload the game file now.\n\n"
-                    "📁 Supported formats: ZIP, 7Z, ISO, APK, RAR, PKG, CSO, PBP\n\n"
-                    "💡 The file will be available for free to all users."
-                )
-                return
-                
-            elif data == "upload_premium":
-                self.start_premium_upload(user_id, chat_id)
-                return
+    def setup_callback_routes(self):
+        """Register every inline button handler with the callback router"""
+        router = self.callback_router
+        
+        # Backup System Callbacks
+        router.add("backup_menu", lambda ctx: self.show_backup_menu(ctx.user_id, ctx.chat_id, ctx.message_id), admin_only=True)
+        router.add("create_backup", lambda ctx: self.handle_create_backup(ctx.user_id, ctx.chat_id, ctx.message_id), admin_only=True)
+        router.add("restore_backup", lambda ctx: self.handle_restore_backup(ctx.user_id, ctx.chat_id, ctx.message_id), admin_only=True)
+        router.add("confirm_restore_backup", lambda ctx: self.handle_confirm_restore(ctx.user_id, ctx.chat_id, ctx.message_id), admin_only=True)
+        router.add("backup_info", lambda ctx: self.show_backup_menu(ctx.user_id, ctx.chat_id, ctx.message_id), admin_only=True)
+        
+        # Redeploy System Callbacks
+        router.add("redeploy_panel", lambda ctx: self.redeploy_system.show_redeploy_menu(ctx.user_id, ctx.chat_id, ctx.message_id), admin_only=True)
+        router.add("user_redeploy", lambda ctx: self.handle_user_redeploy_request(ctx.user_id, ctx.chat_id, ctx.message_id))
+        router.add("redeploy_", self.callback_redeploy, prefix=True, admin_only=True)
+        router.add("system_status", lambda ctx: self.redeploy_system.show_system_status(ctx.user_id, ctx.chat_id, ctx.message_id), admin_only=True)
+        
+        # Game Removal System Callbacks
+        router.add("remove_games", lambda ctx: self.show_remove_game_menu(ctx.user_id, ctx.chat_id, ctx.message_id))
+        router.add("search_remove_game", lambda ctx: self.start_remove_game_search(ctx.user_id, ctx.chat_id))
+        router.add("confirm_remove_", self.callback_confirm_remove, prefix=True)
+        router.add("remove_", self.callback_remove_game, prefix=True)
+        router.add("cancel_remove", lambda ctx: self.show_remove_game_menu(ctx.user_id, ctx.chat_id, ctx.message_id))
+        router.add("view_recent_uploads", self.callback_view_recent_uploads)
+        
+        # Premium games callbacks
+        router.add("premium_games", lambda ctx: self.show_premium_games_menu(ctx.user_id, ctx.chat_id, ctx.message_id))
+        router.add("purchase_premium_", lambda ctx: self.purchase_premium_game(ctx.user_id, ctx.chat_id, int(ctx.arg), ctx.message_id), prefix=True)
+        router.add("download_premium_", lambda ctx: self.send_premium_game_file(ctx.user_id, ctx.chat_id, int(ctx.arg)), prefix=True)
+        router.add("premium_details_", lambda ctx: self.show_premium_game_details(ctx.user_id, ctx.chat_id, int(ctx.arg), ctx.message_id), prefix=True)
+        
+        # Upload system callbacks
+        router.add("upload_options", lambda ctx: self.show_upload_options(ctx.user_id, ctx.chat_id, ctx.message_id))
+        router.add("upload_regular", self.callback_upload_regular)
+        router.add("upload_premium", lambda ctx: self.start_premium_upload(ctx.user_id, ctx.chat_id))
+        
+        # Game request management callbacks
+        router.add("manage_requests", lambda ctx: self.show_request_management(ctx.user_id, ctx.chat_id, ctx.message_id))
+        router.add("reply_request_", lambda ctx: self.start_request_reply(ctx.user_id, ctx.chat_id, int(ctx.arg)), prefix=True)
+        router.add("complete_request_", self.callback_complete_request, prefix=True, answers_query=True)
+        router.add("reply_with_photo_", self.callback_reply_with_photo, prefix=True)
+        router.add("cancel_reply", self.callback_cancel_reply)
+        
+        # Stars system callbacks
+        router.add("stars_menu", lambda ctx: self.show_stars_menu(ctx.user_id, ctx.chat_id, ctx.message_id))
+        router.add("stars_", self.callback_stars, prefix=True)
+        
+        # Game request system callbacks
+        router.add("request_game", lambda ctx: self.start_game_request(ctx.user_id, ctx.chat_id))
+        router.add("my_requests", lambda ctx: self.show_user_requests(ctx.user_id, ctx.chat_id, ctx.message_id))
+        router.add("admin_requests_panel", lambda ctx: self.show_admin_requests_panel(ctx.user_id, ctx.chat_id, ctx.message_id))
+        
+        # Broadcast system callbacks
+        router.add("broadcast_panel", self.callback_broadcast_panel, admin_only=True)
+        router.add("start_broadcast", lambda ctx: self.start_broadcast_with_photo(ctx.user_id, ctx.chat_id), admin_only=True)
+        router.add("broadcast_stats", lambda ctx: self.get_broadcast_stats(ctx.user_id, ctx.chat_id, ctx.message_id), admin_only=True)
+        router.add("confirm_broadcast", lambda ctx: self.send_broadcast_to_all_enhanced(ctx.user_id, ctx.chat_id), admin_only=True)
+        router.add("cancel_broadcast", lambda ctx: self.cancel_broadcast(ctx.user_id, ctx.chat_id, ctx.message_id), admin_only=True)
+        router.add("edit_broadcast", self.callback_edit_broadcast, admin_only=True)
+        
+        # Mini-games callbacks
+        router.add("game_guess", lambda ctx: self.start_number_guess_game(ctx.user_id, ctx.chat_id))
+        router.add("game_random", lambda ctx: self.generate_random_number(ctx.user_id, ctx.chat_id))
+        router.add("game_spin", lambda ctx: self.lucky_spin(ctx.user_id, ctx.chat_id))
+        router.add("big_spin", lambda ctx: self.big_spin(ctx.user_id, ctx.chat_id))
+        router.add("random_", lambda ctx: self.generate_custom_random(ctx.user_id, ctx.chat_id, ctx.arg), prefix=True)
+        router.add("mini_stats", lambda ctx: self.show_mini_games_stats(ctx.user_id, ctx.chat_id, ctx.message_id))
+        router.add("quick_guess_", lambda ctx: self.handle_guess_input(ctx.user_id, ctx.chat_id, str(int(ctx.arg))), prefix=True)
+        router.add("quick_numbers", self.callback_quick_numbers)
+        
+        # Admin management callbacks
+        router.add("clear_all_games", lambda ctx: self.clear_all_games(ctx.user_id, ctx.chat_id, ctx.message_id))
+        router.add("scan_bot_games", self.callback_scan_bot_games, admin_only=True)
+        
+        # Game file sending and search paging
+        router.add(GameCallbackCodec.PREFIX, self.callback_download_game, prefix=True, answers_query=True)
+        # Legacy download buttons still present in older chats
+        router.add("send_game_", self.callback_send_game, prefix=True, answers_query=True)
+        router.add("search_page_", self.callback_search_page, prefix=True)
+        
+        # Menus and game browsing
+        router.add("profile", lambda ctx: self.handle_profile(ctx.chat_id, ctx.message_id, ctx.user_id, ctx.first_name))
+        router.add("time", self.callback_time)
+        router.add("channel_info", self.callback_channel_info)
+        router.add("games", self.callback_games)
+        router.add("game_files", self.callback_game_files)
+        router.add("mini_games", self.callback_mini_games)
+        router.add("search_games", self.callback_search_games)
+        router.add("game_zip", lambda ctx: self.callback_game_list(ctx, ['zip'], "ZIP"))
+        router.add("game_7z", lambda ctx: self.callback_game_list(ctx, ['7z'], "7Z"))
+        router.add("game_iso", lambda ctx: self.callback_game_list(ctx, ['iso'], "ISO"))
+        router.add("game_apk", lambda ctx: self.callback_game_list(ctx, ['apk'], "APK"))
+        router.add("game_psp", lambda ctx: self.callback_game_list(ctx, ['cso', 'pbp'], "PSP"))
+        router.add("game_all", lambda ctx: self.callback_game_list(ctx, ['all'], "ALL"))
+        router.add("rescan_games", self.callback_rescan_games)
+        router.add("back_to_menu", self.callback_back_to_menu)
+        router.add("verify_channel", self.callback_verify_channel)
+        router.add("admin_panel", self.callback_admin_panel, admin_only=True,
+                   on_denied=lambda ctx: self.edit_message(ctx.chat_id, ctx.message_id, "❌ Access denied. Admin only.", self.create_main_menu_buttons()))
+        router.add("upload_stats", lambda ctx: self.handle_upload_stats(ctx.chat_id, ctx.message_id, ctx.user_id, ctx.first_name), admin_only=True)
+        router.add("update_cache", self.callback_update_cache, admin_only=True)
+
+    def show_callback_route_stats(self, chat_id):
+        """Send per-button hit counts and handler latency to an admin"""
+        stats = self.callback_router.get_stats()
+        if not stats:
+            self.robust_send_message(chat_id, "📊 No button presses recorded since startup.")
+            return
+        
+        stats_text = "📊 <b>Button Route Stats</b>\n\n"
+        for item in stats[:25]:
+            stats_text += f"<code>{item['pattern']}</code>\n"
+            stats_text += f"   👆 {item['hits']} hits | ⏱️ avg {item['avg_ms']:.0f}ms | max {item['max_ms']:.0f}ms"
+            if item['errors']:
+                stats_text += f" | ❌ {item['errors']}"
+            stats_text += "\n"
+        self.robust_send_message(chat_id, stats_text)
 
-            # Game request management callbacks
-            elif data == "manage_requests":
-                self.show_request_management(user_id, chat_id, message_id)
-                return
-                
-            elif data.startswith("reply_request_"):
-                request_id = int(data.replace("reply_request_", ""))
-                self.start_request_reply(user_id, chat_id, request_id)
-                return
-                
-            elif data.startswith("complete_request_"):
-                request_id = int(data.replace("complete_request_", ""))
-                if self.game_request_system.update_request_status(request_id, "completed", "Request completed by admin"):
-                    self.answer_callback_query(callback_query['id'], "✅ Request marked as completed!", True)
-                else:
-                    self.answer_callback_query(callback_query['id'], "❌ Failed to update request.", True)
-                return
-                
-            elif data.startswith("reply_with_photo_"):
-                request_id = int(data.replace("reply_with_photo_", ""))
-                if user_id not in self.reply_sessions:
-                    self.reply_sessions[user_id] = {}
-                self.reply_sessions[user_id] = {
-                    'stage': 'waiting_photo',
-                    'request_id': request_id,
-                    'type': 'photo',
-                    'chat_id': chat_id
-                }
-                self.robust_send_message(chat_id, "📎 Please send the photo for your reply (with optional caption):")
-                return
-                
-            elif data == "cancel_reply":
-                if user_id in self.reply_sessions:
-                    del self.reply_sessions[user_id]
-                self.robust_send_message(chat_id, "❌ Reply cancelled.")
-                return
+    # ==================== CALLBACK HANDLERS ====================
+
+    def callback_redeploy(self, ctx):
+        """Admin soft/force redeploy buttons"""
+        if ctx.arg in ["soft", "force"]:
+            self.redeploy_system.initiate_redeploy(ctx.user_id, ctx.chat_id, ctx.arg)
+
+    def callback_confirm_remove(self, ctx):
+        """Ask for confirmation before removing a game"""
+        parts = ctx.arg.split("_")
+        if len(parts) >= 2:
+            game_type = parts[0]
+            game_id = parts[1]
+            self.show_remove_confirmation(ctx.user_id, ctx.chat_id, ctx.message_id, game_type, game_id)
+
+    def callback_remove_game(self, ctx):
+        """Remove a game after confirmation"""
+        parts = ctx.arg.split("_")
+        if len(parts) >= 2:
+            game_type = parts[0]
+            game_id = parts[1]
+            self.remove_game(ctx.user_id, ctx.chat_id, game_type, game_id, ctx.message_id)
+
+    def callback_view_recent_uploads(self, ctx):
+        """List recent admin uploads with remove buttons"""
+        chat_id, message_id = ctx.chat_id, ctx.message_id
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT message_id, file_name, file_type, file_size, upload_date, is_uploaded 
+            FROM channel_games 
+            WHERE is_uploaded = 1 
+            ORDER BY created_at DESC 
+            LIMIT 10
+        ''')
+        recent_uploads = cursor.fetchall()
+        
+        if not recent_uploads:
+            self.edit_message(chat_id, message_id, "❌ No recent uploads found.", self.create_admin_buttons())
+            return
+        
+        uploads_text = "📋 <b>Recent Admin Uploads</b>\n\n"
+        uploads_text += "Click 'Remove' to delete any game:\n\n"
+        
+        keyboard_buttons = []
+        for upload in recent_uploads:
+            msg_id, file_name, file_type, file_size, upload_date, is_uploaded = upload
+            size = self.format_file_size(file_size)
+            
+            uploads_text += f"📁 <b>{file_name}</b>\n"
+            uploads_text += f"📦 {file_type} | 📏 {size} | 📅 {upload_date[:10]}\n"
+            uploads_text += f"🆔 {msg_id}\n\n"
+            
+            keyboard_buttons.append([{
+                "text": f"🗑️ Remove {file_name[:20]}{'...' if len(file_name) > 20 else ''}",
+                "callback_data": f"confirm_remove_R_{msg_id}"
+            }])
+        
+        keyboard_buttons.append([{"text": "🔙 Back", "callback_data": "remove_games"}])
+        keyboard = {"inline_keyboard": keyboard_buttons}
+        
+        self.edit_message(chat_id, message_id, uploads_text, keyboard)
 
-            # Stars system callbacks
-            if data == "stars_menu":
-                self.show_stars_menu(user_id, chat_id, message_id)
-                return
-                
-            elif data.startswith("stars_"):
-                if data == "stars_custom":
-                    self.stars_sessions[user_id] = {}
-                    self.robust_send_message(chat_id, 
-                        "💫 <b>Custom Stars Amount</b>\n\n"
-                        "Please enter the number of Stars you'd like to donate:\n\n"
-                        "💡 <i>Enter a number (e.g., 250 for 250 Stars ≈ $2.50)</i>"
-                    )
-                elif data == "stars_stats":
-                    self.show_stars_stats(user_id, chat_id, message_id)
-                    return
-                else:
-                    stars_str = data.replace("stars_", "")
-                    try:
-                        stars_amount = int(stars_str)
-                        self.process_stars_donation(user_id, chat_id, stars_amount)
-                    except ValueError:
-                        self.robust_send_message(chat_id, "❌ Invalid stars amount.")
-                return
+    def callback_upload_regular(self, ctx):
+        """Prompt admin to upload a regular game file"""
+        self.robust_send_message(ctx.chat_id,
+            "🆓 <b>Regular Game Upload</b>\n\n"
+            "Please upload the game file now.\n\n"
+            "📁 Supported formats: ZIP, 7Z, ISO, APK, RAR, PKG, CSO, PBP\n\n"
+            "💡 The file will be available for free to all users."
+        )
 
-            # Game request system callbacks
-            elif data == "request_game":
-                self.start_game_request(user_id, chat_id)
-                return
-                
-            elif data == "my_requests":
-                self.show_user_requests(user_id, chat_id, message_id)
-                return
+    def callback_complete_request(self, ctx):
+        """Mark a game request as completed"""
+        request_id = int(ctx.arg)
+        if self.game_request_system.update_request_status(request_id, "completed", "Request completed by admin"):
+            self.answer_callback_query(ctx.query_id, "✅ Request marked as completed!", True)
+        else:
+            self.answer_callback_query(ctx.query_id, "❌ Failed to update request.", True)
 
-            # Admin game request management
-            elif data == "admin_requests_panel":
-                self.show_admin_requests_panel(user_id, chat_id, message_id)
-                return
+    def callback_reply_with_photo(self, ctx):
+        """Start a photo reply to a game request"""
+        user_id, chat_id = ctx.user_id, ctx.chat_id
+        request_id = int(ctx.arg)
+        if user_id not in self.reply_sessions:
+            self.reply_sessions[user_id] = {}
+        self.reply_sessions[user_id] = {
+            'stage': 'waiting_photo',
+            'request_id': request_id,
+            'type': 'photo',
+            'chat_id': chat_id
+        }
+        self.robust_send_message(chat_id, "📎 Please send the photo for your reply (with optional caption):")
 
-            # Broadcast system callbacks
-            if data == "broadcast_panel":
-                if not self.is_admin(user_id):
-                    self.answer_callback_query(callback_query['id'], "❌ Access denied. Admin only.", True)
-                    return
-                
-                broadcast_info = """📢 <b>Admin Broadcast System</b>
+    def callback_cancel_reply(self, ctx):
+        """Cancel a pending request reply"""
+        user_id, chat_id = ctx.user_id, ctx.chat_id
+        if user_id in self.reply_sessions:
+            del self.reply_sessions[user_id]
+        self.robust_send_message(chat_id, "❌ Reply cancelled.")
+
+    def callback_stars(self, ctx):
+        """Stars donation amount, custom amount and stats buttons"""
+        user_id, chat_id, message_id = ctx.user_id, ctx.chat_id, ctx.message_id
+        if ctx.arg == "custom":
+            self.stars_sessions[user_id] = {}
+            self.robust_send_message(chat_id, 
+                "💫 <b>Custom Stars Amount</b>\n\n"
+                "Please enter the number of Stars you'd like to donate:\n\n"
+                "💡 <i>Enter a number (e.g., 250 for 250 Stars ≈ $2.50)</i>"
+            )
+        elif ctx.arg == "stats":
+            self.show_stars_stats(user_id, chat_id, message_id)
+        else:
+            try:
+                stars_amount = int(ctx.arg)
+                self.process_stars_donation(user_id, chat_id, stars_amount)
+            except ValueError:
+                self.robust_send_message(chat_id, "❌ Invalid stars amount.")
+
+    def callback_broadcast_panel(self, ctx):
+        """Show the admin broadcast panel"""
+        chat_id, message_id = ctx.chat_id, ctx.message_id
+        broadcast_info = """📢 <b>Admin Broadcast System</b>
 
 Send messages to all bot subscribers.
 
@@ -2194,163 +4563,117 @@ Send messages to all bot subscribers.
 • Progress tracking
 
 Choose an option:"""
-                self.edit_message(chat_id, message_id, broadcast_info, self.create_broadcast_panel_buttons())
-                return
-                
-            elif data == "start_broadcast":
-                if not self.is_admin(user_id):
-                    self.answer_callback_query(callback_query['id'], "❌ Access denied. Admin only.", True)
-                    return
-                self.start_broadcast_with_photo(user_id, chat_id)
-                return
-                
-            elif data == "broadcast_stats":
-                if not self.is_admin(user_id):
-                    self.answer_callback_query(callback_query['id'], "❌ Access denied. Admin only.", True)
-                    return
-                self.get_broadcast_stats(user_id, chat_id, message_id)
-                return
-                
-            elif data == "confirm_broadcast":
-                if not self.is_admin(user_id):
-                    self.answer_callback_query(callback_query['id'], "❌ Access denied. Admin only.", True)
-                    return
-                self.send_broadcast_to_all_enhanced(user_id, chat_id)
-                return
-                
-            elif data == "cancel_broadcast":
-                if not self.is_admin(user_id):
-                    self.answer_callback_query(callback_query['id'], "❌ Access denied. Admin only.", True)
-                    return
-                self.cancel_broadcast(user_id, chat_id, message_id)
-                return
-                
-            elif data == "edit_broadcast":
-                if not self.is_admin(user_id):
-                    self.answer_callback_query(callback_query['id'], "❌ Access denied. Admin only.", True)
-                    return
-                if user_id in self.broadcast_sessions:
-                    self.broadcast_sessions[user_id]['stage'] = 'waiting_message_or_photo'
-                    self.edit_message(chat_id, message_id, "✏️ Please type your new broadcast message or send a photo:", self.create_broadcast_panel_buttons())
-                return
-
-            # Mini-games callbacks
-            if data == "game_guess":
-                self.start_number_guess_game(user_id, chat_id)
-                return
-                
-            elif data == "game_random":
-                self.generate_random_number(user_id, chat_id)
-                return
-                
-            elif data == "game_spin":
-                self.lucky_spin(user_id, chat_id)
-                return
-                
-            elif data == "big_spin":
-                self.big_spin(user_id, chat_id)
-                return
-                
-            elif data.startswith("random_"):
-                range_type = data.replace("random_", "")
-                self.generate_custom_random(user_id, chat_id, range_type)
-                return
-                
-            elif data == "mini_stats":
-                self.show_mini_games_stats(user_id, chat_id, message_id)
-                return
-                
-            elif data.startswith("quick_guess_"):
-                guess = int(data.replace("quick_guess_", ""))
-                self.handle_guess_input(user_id, chat_id, str(guess))
-                return
-                
-            elif data == "quick_numbers":
-                quick_buttons = []
-                row = []
-                for i in range(1, 11):
-                    row.append({"text": str(i), "callback_data": f"quick_guess_{i}"})
-                    if i % 5 == 0:
-                        quick_buttons.append(row)
-                        row = []
-                
-                keyboard = {"inline_keyboard": quick_buttons}
-                self.edit_message(chat_id, message_id, "🔢 Choose your guess quickly:", keyboard)
-                return
+        self.edit_message(chat_id, message_id, broadcast_info, self.create_broadcast_panel_buttons())
 
-            # Admin management callbacks
-            elif data == "clear_all_games":
-                self.clear_all_games(user_id, chat_id, message_id)
-                return
-                
-            elif data == "scan_bot_games":
-                if not self.is_admin(user_id):
-                    self.answer_callback_query(callback_query['id'], "❌ Access denied. Admin only.", True)
-                    return
-                
-                self.edit_message(chat_id, message_id, "🔍 Scanning for bot-uploaded games...", self.create_admin_buttons())
-                bot_games_found = self.scan_bot_uploaded_games()
-                self.update_games_cache()
-                self.edit_message(chat_id, message_id, f"✅ Bot games scan complete! Found {bot_games_found} new games.", self.create_admin_buttons())
-                return
+    def callback_edit_broadcast(self, ctx):
+        """Re-open the broadcast message prompt"""
+        user_id, chat_id, message_id = ctx.user_id, ctx.chat_id, ctx.message_id
+        if user_id in self.broadcast_sessions:
+            self.broadcast_sessions[user_id]['stage'] = 'waiting_message_or_photo'
+            self.edit_message(chat_id, message_id, "✏️ Please type your new broadcast message or send a photo:", self.create_broadcast_panel_buttons())
 
-            # Handle game file sending directly as documents
-            if data.startswith('send_game_'):
-                parts = data.replace('send_game_', '').split('_')
-                if len(parts) >= 3:
-                    message_id_to_send = int(parts[0])
-                    file_id = parts[1] if len(parts) > 1 else None
-                    is_bot_file = int(parts[2]) == 1
-                    
-                    if file_id == 'short':
-                        file_id = None
-                    else:
-                        file_id = file_id.replace('_', '-').replace('eq', '=')
-                    
-                    self.answer_callback_query(callback_query['id'], "📥 Sending file...", False)
-                    
-                    success = self.send_document_by_file_id(chat_id, file_id, is_bot_file, message_id_to_send)
-                    
-                    if success:
-                        self.answer_callback_query(callback_query['id'], "✅ File sent!", False)
-                    else:
-                        self.answer_callback_query(callback_query['id'], "❌ Failed to send file. Please try again or contact admin.", True)
-                return
+    def callback_quick_numbers(self, ctx):
+        """Show quick guess number buttons"""
+        chat_id, message_id = ctx.chat_id, ctx.message_id
+        quick_buttons = []
+        row = []
+        for i in range(1, 11):
+            row.append({"text": str(i), "callback_data": f"quick_guess_{i}"})
+            if i % 5 == 0:
+                quick_buttons.append(row)
+                row = []
+        
+        keyboard = {"inline_keyboard": quick_buttons}
+        self.edit_message(chat_id, message_id, "🔢 Choose your guess quickly:", keyboard)
+
+    def callback_scan_bot_games(self, ctx):
+        """Scan for games uploaded through the bot"""
+        chat_id, message_id = ctx.chat_id, ctx.message_id
+        self.edit_message(chat_id, message_id, "🔍 Scanning for bot-uploaded games...", self.create_admin_buttons())
+        bot_games_found = self.scan_bot_uploaded_games()
+        self.edit_message(chat_id, message_id, f"✅ Bot games scan complete! Found {bot_games_found} new games.", self.create_admin_buttons())
+
+    def callback_send_game(self, ctx):
+        """Send a game file straight from a search result button"""
+        chat_id = ctx.chat_id
+        parts = ctx.arg.split('_')
+        if len(parts) >= 3:
+            message_id_to_send = int(parts[0])
+            file_id = parts[1] if len(parts) > 1 else None
+            is_bot_file = int(parts[2]) == 1
+            
+            if file_id == 'short':
+                file_id = None
+            else:
+                file_id = file_id.replace('_', '-').replace('eq', '=')
             
-            elif data.startswith('search_page_'):
-                parts = data.replace('search_page_', '').split('_')
-                if len(parts) >= 2:
-                    search_term = parts[0]
-                    page = int(parts[1])
-                    
-                    user_results = self.search_results.get(user_id, {})
-                    if user_results and user_results.get('search_term') == search_term:
-                        results = user_results.get('results', [])
-                        
-                        results_text = f"🔍 Search Results: <code>{search_term}</code>\n\n"
-                        results_text += f"📄 Page {page + 1}\n"
-                        results_text += f"📊 Total results: {len(results)}\n\n"
-                        results_text += "📥 Click on any file below to download it:"
-                        
-                        self.edit_message(
-                            chat_id, 
-                            message_id, 
-                            results_text,
-                            self.create_search_results_buttons(results, search_term, user_id, page)
-                        )
-                return
+            self.answer_callback_query(ctx.query_id, "📥 Sending file...", False)
             
-            # Handle other existing callbacks
-            if data == "profile":
-                self.handle_profile(chat_id, message_id, user_id, first_name)
-                
-            elif data == "time":
-                current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                time_text = f"🕒 <b>Current Time</b>\n\n📅 {current_time}\n\n⏰ Server Time (UTC)"
-                self.edit_message(chat_id, message_id, time_text, self.create_main_menu_buttons())
-                
-            elif data == "channel_info":
-                channel_info = f"""📢 <b>Channel Information</b>
+            success = self.send_document_by_file_id(chat_id, file_id, is_bot_file, message_id_to_send)
+            
+            if success:
+                self.answer_callback_query(ctx.query_id, "✅ File sent!", False)
+            else:
+                self.answer_callback_query(ctx.query_id, "❌ Failed to send file. Please try again or contact admin.", True)
+
+    def callback_download_game(self, ctx):
+        """Send a game file for a compact dl: download button"""
+        decoded = GameCallbackCodec.decode(ctx.arg)
+        if decoded is None:
+            self.answer_callback_query(ctx.query_id, "❌ This button has expired. Please search again.", True)
+            return
+        
+        source, row_id = decoded
+        if source == GameCallbackCodec.SOURCE_PREMIUM:
+            self.answer_callback_query(ctx.query_id)
+            self.show_premium_game_details(ctx.user_id, ctx.chat_id, row_id, ctx.message_id)
+            return
+        
+        file_ref = self.get_game_file_ref(row_id)
+        if file_ref is None:
+            self.answer_callback_query(ctx.query_id, "❌ This game is no longer available.", True)
+            return
+        
+        self.answer_callback_query(ctx.query_id, "📥 Sending file...", False)
+        success = self.send_document_by_file_id(ctx.chat_id, file_ref['file_id'], file_ref['is_bot_file'], file_ref['message_id'])
+        if not success:
+            self.robust_send_message(ctx.chat_id, "❌ Failed to send file. Please try again or contact admin.")
+
+    def callback_search_page(self, ctx):
+        """Page through stored search results"""
+        user_id, chat_id, message_id = ctx.user_id, ctx.chat_id, ctx.message_id
+        parts = ctx.arg.split('_')
+        if len(parts) >= 2:
+            search_term = parts[0]
+            page = int(parts[1])
+            
+            user_results = self.search_results.get(user_id, {})
+            if user_results and user_results.get('search_term') == search_term:
+                results = user_results.get('results', [])
+                
+                results_text = f"🔍 Search Results: <code>{search_term}</code>\n\n"
+                results_text += f"📄 Page {page + 1}\n"
+                results_text += f"📊 Total results: {len(results)}\n\n"
+                results_text += "📥 Click on any file below to download it:"
+                
+                self.edit_message(
+                    chat_id, 
+                    message_id, 
+                    results_text,
+                    self.create_search_results_buttons(results, search_term, user_id, page)
+                )
+
+    def callback_time(self, ctx):
+        """Show current server time"""
+        chat_id, message_id = ctx.chat_id, ctx.message_id
+        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        time_text = f"🕒 <b>Current Time</b>\n\n📅 {current_time}\n\n⏰ Server Time (UTC)"
+        self.edit_message(chat_id, message_id, time_text, self.create_main_menu_buttons())
+
+    def callback_channel_info(self, ctx):
+        """Show channel information"""
+        chat_id, message_id = ctx.chat_id, ctx.message_id
+        channel_info = f"""📢 <b>Channel Information</b>
 
 🏷️ Channel: @pspgamers5
 🔗 Link: https://t.me/pspgamers5
@@ -2369,19 +4692,21 @@ Choose an option:"""
 3. Click on files to download
 
 ⚠️ Note: You need to join channel and complete verification to access games."""
-                self.edit_message(chat_id, message_id, channel_info, self.create_main_menu_buttons())
-                
-            elif data == "games":
-                if not self.is_user_completed(user_id):
-                    self.edit_message(chat_id, message_id, 
-                                    "🔐 Please complete verification first with /start", 
-                                    self.create_main_menu_buttons())
-                    return
-                
-                stats = self.get_channel_stats()
-                total_games = stats['total_games'] + stats['premium_games']
-                
-                games_text = f"""🎮 <b>Games Section</b>
+        self.edit_message(chat_id, message_id, channel_info, self.create_main_menu_buttons())
+
+    def callback_games(self, ctx):
+        """Show the games section"""
+        user_id, chat_id, message_id = ctx.user_id, ctx.chat_id, ctx.message_id
+        if not self.is_user_completed(user_id):
+            self.edit_message(chat_id, message_id, 
+                            "🔐 Please complete verification first with /start", 
+                            self.create_main_menu_buttons())
+            return
+        
+        stats = self.get_channel_stats()
+        total_games = stats['total_games'] + stats['premium_games']
+        
+        games_text = f"""🎮 <b>Games Section</b>
 
 📊 Total Games: {total_games}
 • 🆓 Regular: {stats['total_games']}
@@ -2397,17 +4722,19 @@ Choose an option:"""
 • ⭐ Donate Stars - Support our bot with Telegram Stars
 
 🔗 Channel: @pspgamers5"""
-                self.edit_message(chat_id, message_id, games_text, self.create_games_buttons())
-                
-            elif data == "game_files":
-                if not self.is_user_completed(user_id):
-                    self.edit_message(chat_id, message_id, 
-                                    "🔐 Please complete verification first with /start", 
-                                    self.create_games_buttons())
-                    return
-                
-                stats = self.get_channel_stats()
-                files_text = f"""📁 <b>Game Files Browser</b>
+        self.edit_message(chat_id, message_id, games_text, self.create_games_buttons())
+
+    def callback_game_files(self, ctx):
+        """Show the game files browser"""
+        user_id, chat_id, message_id = ctx.user_id, ctx.chat_id, ctx.message_id
+        if not self.is_user_completed(user_id):
+            self.edit_message(chat_id, message_id, 
+                            "🔐 Please complete verification first with /start", 
+                            self.create_games_buttons())
+            return
+        
+        stats = self.get_channel_stats()
+        files_text = f"""📁 <b>Game Files Browser</b>
 
 📊 Total Files: {stats['total_games']}
 
@@ -2421,16 +4748,18 @@ Choose an option:"""
 • 📋 All Files - Complete game list
 
 🔍 Use search for quick access!"""
-                self.edit_message(chat_id, message_id, files_text, self.create_game_files_buttons())
-                
-            elif data == "mini_games":
-                if not self.is_user_completed(user_id):
-                    self.edit_message(chat_id, message_id, 
-                                    "🔐 Please complete verification first with /start", 
-                                    self.create_games_buttons())
-                    return
-                
-                games_text = """🎮 <b>Mini Games</b>
+        self.edit_message(chat_id, message_id, files_text, self.create_game_files_buttons())
+
+    def callback_mini_games(self, ctx):
+        """Show the mini games menu"""
+        user_id, chat_id, message_id = ctx.user_id, ctx.chat_id, ctx.message_id
+        if not self.is_user_completed(user_id):
+            self.edit_message(chat_id, message_id, 
+                            "🔐 Please complete verification first with /start", 
+                            self.create_games_buttons())
+            return
+        
+        games_text = """🎮 <b>Mini Games</b>
 
 🎯 Choose a game to play:
 
@@ -2440,57 +4769,37 @@ Choose an option:"""
 • 📊 My Stats - View your gaming statistics
 
 Have fun! 🎉"""
-                self.edit_message(chat_id, message_id, games_text, self.create_mini_games_buttons())
-                
-            elif data == "search_games":
-                if not self.is_user_verified(user_id):
-                    self.edit_message(chat_id, message_id, 
-                                    "🔐 Please complete verification first with /start", 
-                                    self.create_main_menu_buttons())
-                    return
-                
-                self.handle_search_games(chat_id, message_id, user_id, first_name)
-                
-            elif data == "game_zip":
-                games = self.games_cache.get('zip', [])
-                text = self.format_games_list(games, "ZIP")
-                self.edit_message(chat_id, message_id, text, self.create_game_files_buttons())
-                
-            elif data == "game_7z":
-                games = self.games_cache.get('7z', [])
-                text = self.format_games_list(games, "7Z")
-                self.edit_message(chat_id, message_id, text, self.create_game_files_buttons())
-                
-            elif data == "game_iso":
-                games = self.games_cache.get('iso', [])
-                text = self.format_games_list(games, "ISO")
-                self.edit_message(chat_id, message_id, text, self.create_game_files_buttons())
-                
-            elif data == "game_apk":
-                games = self.games_cache.get('apk', [])
-                text = self.format_games_list(games, "APK")
-                self.edit_message(chat_id, message_id, text, self.create_game_files_buttons())
-                
-            elif data == "game_psp":
-                cso_games = self.games_cache.get('cso', [])
-                pbp_games = self.games_cache.get('pbp', [])
-                psp_games = cso_games + pbp_games
-                text = self.format_games_list(psp_games, "PSP")
-                self.edit_message(chat_id, message_id, text, self.create_game_files_buttons())
-                
-            elif data == "game_all":
-                games = self.games_cache.get('all', [])
-                text = self.format_games_list(games, "ALL")
-                self.edit_message(chat_id, message_id, text, self.create_game_files_buttons())
-                
-            elif data == "rescan_games":
-                self.edit_message(chat_id, message_id, "🔄 Scanning for new games...", self.create_game_files_buttons())
-                total_games = self.scan_channel_for_games()
-                stats = self.get_channel_stats()
-                self.edit_message(chat_id, message_id, f"✅ Rescan complete! Found {total_games} total games. Database now has {stats['total_games']} regular games and {stats['premium_games']} premium games.", self.create_game_files_buttons())
-            
-            elif data == "back_to_menu":
-                welcome_text = f"""👋 Welcome {first_name}!
+        self.edit_message(chat_id, message_id, games_text, self.create_mini_games_buttons())
+
+    def callback_search_games(self, ctx):
+        """Open game search"""
+        user_id, chat_id, message_id, first_name = ctx.user_id, ctx.chat_id, ctx.message_id, ctx.first_name
+        if not self.is_user_verified(user_id):
+            self.edit_message(chat_id, message_id, 
+                            "🔐 Please complete verification first with /start", 
+                            self.create_main_menu_buttons())
+            return
+        
+        self.handle_search_games(chat_id, message_id, user_id, first_name)
+
+    def callback_game_list(self, ctx, cache_keys, label):
+        """Show cached games for one or more file types"""
+        games = self.get_cached_games(*cache_keys)
+        text = self.format_games_list(games, label)
+        self.edit_message(ctx.chat_id, ctx.message_id, text, self.create_game_files_buttons())
+
+    def callback_rescan_games(self, ctx):
+        """Rescan the channel for games"""
+        chat_id, message_id = ctx.chat_id, ctx.message_id
+        self.edit_message(chat_id, message_id, "🔄 Scanning for new games...", self.create_game_files_buttons())
+        total_games = self.scan_channel_for_games()
+        stats = self.get_channel_stats()
+        self.edit_message(chat_id, message_id, f"✅ Rescan complete! Found {total_games} total games. Database now has {stats['total_games']} regular games and {stats['premium_games']} premium games.", self.create_game_files_buttons())
+
+    def callback_back_to_menu(self, ctx):
+        """Return to the main menu"""
+        chat_id, message_id, first_name = ctx.chat_id, ctx.message_id, ctx.first_name
+        welcome_text = f"""👋 Welcome {first_name}!
 
 🤖 <b>GAMERDROID™ V1</b>
 
@@ -2516,12 +4825,14 @@ Have fun! 🎉"""
 • 💾 Persistent Data Recovery
 
 Choose an option below:"""
-                self.edit_message(chat_id, message_id, welcome_text, self.create_main_menu_buttons())
-            
-            elif data == "verify_channel":
-                if self.check_channel_membership(user_id):
-                    self.mark_channel_joined(user_id)
-                    welcome_text = f"""✅ <b>Verification Complete!</b>
+        self.edit_message(chat_id, message_id, welcome_text, self.create_main_menu_buttons())
+
+    def callback_verify_channel(self, ctx):
+        """Check channel membership and unlock the menu"""
+        user_id, chat_id, message_id, first_name = ctx.user_id, ctx.chat_id, ctx.message_id, ctx.first_name
+        if self.check_channel_membership(user_id, force=True):
+            self.mark_channel_joined(user_id)
+            welcome_text = f"""✅ <b>Verification Complete!</b>
 
 👋 Welcome {first_name}!
 
@@ -2537,20 +4848,18 @@ Choose an option below:"""
 
 📢 Channel: @pspgamers5
 Choose an option below:"""
-                    self.edit_message(chat_id, message_id, welcome_text, self.create_main_menu_buttons())
-                else:
-                    self.edit_message(chat_id, message_id, 
-                                    "❌ You haven't joined the channel yet!\n\n"
-                                    "Please join @pspgamers5 first, then click Verify Join again.",
-                                    self.create_channel_buttons())
-            
-            elif data == "admin_panel":
-                if not self.is_admin(user_id):
-                    self.edit_message(chat_id, message_id, "❌ Access denied. Admin only.", self.create_main_menu_buttons())
-                    return
-                
-                stats = self.get_channel_stats()
-                admin_text = f"""👑 <b>Admin Panel</b>
+            self.edit_message(chat_id, message_id, welcome_text, self.create_main_menu_buttons())
+        else:
+            self.edit_message(chat_id, message_id, 
+                            "❌ You haven't joined the channel yet!\n\n"
+                            "Please join @pspgamers5 first, then click Verify Join again.",
+                            self.create_channel_buttons())
+
+    def callback_admin_panel(self, ctx):
+        """Show the admin panel"""
+        user_id, chat_id, message_id, first_name = ctx.user_id, ctx.chat_id, ctx.message_id, ctx.first_name
+        stats = self.get_channel_stats()
+        admin_text = f"""👑 <b>Admin Panel</b>
 
 👋 Welcome {first_name}!
 
@@ -2576,24 +4885,15 @@ Choose an option below:"""
 • Premium games: {stats['premium_games']}
 
 Choose an option:"""
-                self.edit_message(chat_id, message_id, admin_text, self.create_admin_buttons())
-            
-            elif data == "upload_stats":
-                if not self.is_admin(user_id):
-                    return
-                self.handle_upload_stats(chat_id, message_id, user_id, first_name)
-            
-            elif data == "update_cache":
-                if not self.is_admin(user_id):
-                    return
-                self.edit_message(chat_id, message_id, "🔄 Updating games cache...", self.create_admin_buttons())
-                self.update_games_cache()
-                stats = self.get_channel_stats()
-                self.edit_message(chat_id, message_id, f"✅ Cache updated! {stats['total_games']} regular games and {stats['premium_games']} premium games loaded.", self.create_admin_buttons())
-                
-        except Exception as e:
-            print(f"Callback error: {e}")
-            traceback.print_exc()
+        self.edit_message(chat_id, message_id, admin_text, self.create_admin_buttons())
+
+    def callback_update_cache(self, ctx):
+        """Rebuild the games cache on demand"""
+        chat_id, message_id = ctx.chat_id, ctx.message_id
+        self.edit_message(chat_id, message_id, "🔄 Updating games cache...", self.create_admin_buttons())
+        self.update_games_cache()
+        stats = self.get_channel_stats()
+        self.edit_message(chat_id, message_id, f"✅ Cache updated! {stats['total_games']} regular games and {stats['premium_games']} premium games loaded.", self.create_admin_buttons())
 
     # ==================== FIXED: ENHANCED FILE SENDING METHODS ====================
     
@@ -2615,14 +4915,12 @@ Choose an option:"""
             
             print(f"📤 Sending document with file_id: {file_id}")
             
-            url = self.base_url + "sendDocument"
             data = {
                 "chat_id": chat_id,
                 "document": file_id
             }
             
-            response = requests.post(url, data=data, timeout=30)
-            result = response.json()
+            result = self.api.call("sendDocument", data)
             
             if result.get('ok'):
                 print(f"✅ Sent document using file_id to user {chat_id}")
@@ -2646,15 +4944,13 @@ Choose an option:"""
                     return True
             
             if is_bot_file:
-                url = self.base_url + "forwardMessage"
                 data = {
                     "chat_id": chat_id,
                     "from_chat_id": chat_id,
                     "message_id": message_id
                 }
                 
-                response = requests.post(url, data=data, timeout=30)
-                result = response.json()
+                result = self.api.call("forwardMessage", data)
                 
                 if result.get('ok'):
                     print(f"✅ Successfully forwarded bot file {message_id}")
@@ -2663,15 +4959,13 @@ Choose an option:"""
                     print(f"❌ Bot file forward failed: {result.get('description')}")
                     return False
             else:
-                url = self.base_url + "forwardMessage"
                 data = {
                     "chat_id": chat_id,
                     "from_chat_id": self.REQUIRED_CHANNEL,
                     "message_id": message_id
                 }
                 
-                response = requests.post(url, data=data, timeout=30)
-                result = response.json()
+                result = self.api.call("forwardMessage", data)
                 
                 if result.get('ok'):
                     print(f"✅ Successfully forwarded channel file {message_id}")
@@ -2799,7 +5093,10 @@ This game already exists in the database:"""
             }
             
             cursor = self.conn.cursor()
-            cursor.execute('''
+            cursor.execute('SELECT id FROM channel_games WHERE message_id = ?', (game_info['message_id'],))
+            replaced_game = cursor.fetchone()
+            
+            cursor = self.db.execute_write('''
                 INSERT OR REPLACE INTO channel_games 
                 (message_id, file_name, file_type, file_size, upload_date, category, 
                  added_by, is_uploaded, is_forwarded, file_id, bot_message_id)
@@ -2817,9 +5114,11 @@ This game already exists in the database:"""
                 game_info['file_id'],
                 game_info['bot_message_id']
             ))
-            self.conn.commit()
+            new_row_id = cursor.lastrowid
             
-            self.update_games_cache()
+            if replaced_game:
+                self.cache_remove_game(replaced_game[0])
+            self.cache_add_game(new_row_id)
             
             size = self.format_file_size(file_size)
             source_type = "Channel Forward" if original_message_id else "Direct Upload"
@@ -2859,7 +5158,7 @@ The file is now available in the games browser and search!"""
             game_name = ""
             
             if game_type == 'R':
-                cursor.execute('SELECT file_name FROM channel_games WHERE message_id = ?', (game_id,))
+                cursor.execute('SELECT file_name, id FROM channel_games WHERE message_id = ?', (game_id,))
                 game_info = cursor.fetchone()
                 
                 if not game_info:
@@ -2867,8 +5166,8 @@ The file is now available in the games browser and search!"""
                     return False
                 
                 game_name = game_info[0]
-                cursor.execute('DELETE FROM channel_games WHERE message_id = ?', (game_id,))
-                self.conn.commit()
+                self.db.execute_write('DELETE FROM channel_games WHERE message_id = ?', (game_id,))
+                self.cache_remove_game(game_info[1])
                 
             elif game_type == 'P':
                 cursor.execute('SELECT file_name FROM premium_games WHERE id = ?', (game_id,))
@@ -2879,16 +5178,15 @@ The file is now available in the games browser and search!"""
                     return False
                 
                 game_name = game_info[0]
-                cursor.execute('DELETE FROM premium_games WHERE id = ?', (game_id,))
-                cursor.execute('DELETE FROM premium_purchases WHERE game_id = ?', (game_id,))
-                self.conn.commit()
+                self.db.execute_writes([
+                    ('DELETE FROM premium_games WHERE id = ?', (game_id,)),
+                    ('DELETE FROM premium_purchases WHERE game_id = ?', (game_id,)),
+                ])
             
             else:
                 self.answer_callback_query(message_id, "❌ Invalid game type.", True)
                 return False
             
-            self.update_games_cache()
-            
             print(f"🗑️ Admin {user_id} removed {game_type} game: {game_name} (ID: {game_id})")
             
             self.backup_after_game_action("Game Removal", game_name)
@@ -2925,11 +5223,12 @@ The file is now available in the games browser and search!"""
             cursor.execute('SELECT COUNT(*) FROM premium_games')
             premium_games_before = cursor.fetchone()[0]
             
-            cursor.execute('DELETE FROM channel_games')
-            cursor.execute('DELETE FROM premium_games')
-            self.conn.commit()
+            self.db.execute_writes([
+                ('DELETE FROM channel_games', ()),
+                ('DELETE FROM premium_games', ()),
+            ])
             
-            self.update_games_cache()
+            self.cache_clear_games()
             
             self.backup_after_game_action("Clear All Games", f"Removed {total_games_before} regular + {premium_games_before} premium games")
             
@@ -3711,7 +6010,6 @@ Thank you for using our service! 🙏"""
         if success:
             request = self.game_request_system.get_request_by_id(request_id)
             if request:
-                photo_url = self.base_url + "sendPhoto"
                 photo_data = {
                     "chat_id": request['user_id'],
                     "photo": photo_file_id,
@@ -3727,7 +6025,7 @@ Thank you for using our service! 🙏"""
                 }
                 
                 try:
-                    requests.post(photo_url, data=photo_data, timeout=30)
+                    self.api.call("sendPhoto", photo_data)
                 except Exception as e:
                     print(f"❌ Failed to send photo reply: {e}")
             
@@ -3790,6 +6088,7 @@ You can send messages to all bot subscribers.
         
         if session['stage'] == 'waiting_message_or_photo':
             session['stage'] = 'preview'
+            session['media_type'] = 'photo'
             session['photo'] = photo_file_id
             session['message'] = caption or ""
             
@@ -3814,7 +6113,6 @@ You can send messages to all bot subscribers.
                 ]
             }
             
-            photo_url = self.base_url + "sendPhoto"
             photo_data = {
                 "chat_id": chat_id,
                 "photo": photo_file_id,
@@ -3824,8 +6122,7 @@ You can send messages to all bot subscribers.
             }
             
             try:
-                response = requests.post(photo_url, data=photo_data, timeout=30)
-                result = response.json()
+                result = self.api.call("sendPhoto", photo_data)
                 if result.get('ok'):
                     print(f"✅ Photo preview sent to admin {user_id}")
                     return True
@@ -3839,7 +6136,7 @@ You can send messages to all bot subscribers.
         return False
     
     def send_broadcast_to_all_enhanced(self, user_id, chat_id):
-        """Send enhanced broadcast (text or photo) to all users"""
+        """Queue an enhanced broadcast (text or photo) to all users as a background job"""
         if user_id not in self.broadcast_sessions:
             self.robust_send_message(chat_id, "❌ No active broadcast session.")
             return False
@@ -3847,121 +6144,22 @@ You can send messages to all bot subscribers.
         session = self.broadcast_sessions[user_id]
         
         cursor = self.conn.cursor()
-        cursor.execute('SELECT user_id FROM users WHERE is_verified = 1')
-        users = cursor.fetchall()
-        
-        total_users = len(users)
-        if total_users == 0:
+        cursor.execute('SELECT COUNT(*) FROM users WHERE is_verified = 1 AND is_active = 1')
+        if cursor.fetchone()[0] == 0:
             self.robust_send_message(chat_id, "❌ No verified users found to send broadcast.")
             del self.broadcast_sessions[user_id]
             return False
         
-        progress_msg = self.robust_send_message(chat_id, 
-            f"📤 Starting broadcast...\n"
-            f"📊 Total users: {total_users}\n"
-            f"⏳ Sending messages..."
-        )
-        
-        success_count = 0
-        failed_count = 0
-        start_time = time.time()
-        
-        has_photo = session['photo'] is not None
-        message_text = f"📢 <b>Announcement from Admin</b>\n\n{session['message']}\n\n────────────────────\n<i>This is an automated broadcast message</i>"
-        
-        for i, (user_id_target,) in enumerate(users):
-            try:
-                if has_photo:
-                    photo_url = self.base_url + "sendPhoto"
-                    photo_data = {
-                        "chat_id": user_id_target,
-                        "photo": session['photo'],
-                        "caption": message_text,
-                        "parse_mode": "HTML"
-                    }
-                    response = requests.post(photo_url, data=photo_data, timeout=30)
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        if result.get('ok'):
-                            success_count += 1
-                        else:
-                            failed_count += 1
-                    else:
-                        failed_count += 1
-                else:
-                    response = requests.post(self.base_url + "sendMessage", data={
-                        "chat_id": user_id_target,
-                        "text": message_text,
-                        "parse_mode": "HTML"
-                    }, timeout=30)
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        if result.get('ok'):
-                            success_count += 1
-                        else:
-                            failed_count += 1
-                    else:
-                        failed_count += 1
-                
-                if (i + 1) % 10 == 0 or (i + 1) == total_users:
-                    progress = int((i + 1) * 100 / total_users)
-                    elapsed = time.time() - start_time
-                    eta = (elapsed / (i + 1)) * (total_users - (i + 1)) if (i + 1) > 0 else 0
-                    
-                    progress_text = f"""📤 <b>Broadcast Progress</b>
-
-📊 Progress: {i + 1}/{total_users} users
-{self.create_progress_bar(progress)} {progress}%
-
-✅ Successful: {success_count}
-❌ Failed: {failed_count}
-⏱️ Elapsed: {elapsed:.1f}s
-⏳ ETA: {eta:.1f}s
-
-Sending messages..."""
-                    
-                    self.robust_send_message(chat_id, progress_text)
-                
-                time.sleep(0.1)
-                
-            except Exception as e:
-                failed_count += 1
-                print(f"❌ Broadcast error for user {user_id_target}: {e}")
-        
-        elapsed_total = time.time() - start_time
-        success_rate = (success_count / total_users) * 100 if total_users > 0 else 0
-        
-        broadcast_type = "Photo" if has_photo else "Text"
-        stats_text = f"""✅ <b>Broadcast Completed!</b>
-
-📊 Final Statistics:
-• 📤 Total users: {total_users}
-• ✅ Successful: {success_count}
-• ❌ Failed: {failed_count}
-• 📈 Success rate: {success_rate:.1f}%
-• ⏱️ Total time: {elapsed_total:.1f}s
-• 🚀 Speed: {total_users/elapsed_total:.1f} users/second
-• 📝 Type: {broadcast_type} Broadcast
-
-📝 Message sent to {success_count} users successfully."""
-
-        broadcast_id = int(time.time())
-        self.broadcast_stats[broadcast_id] = {
-            'admin_id': user_id,
-            'timestamp': datetime.now().isoformat(),
-            'total_users': total_users,
-            'success_count': success_count,
-            'failed_count': failed_count,
-            'type': 'photo' if has_photo else 'text',
-            'message_preview': session['message'][:100] + "..." if len(session['message']) > 100 else session['message']
-        }
-        
-        self.robust_send_message(chat_id, stats_text)
+        try:
+            job_id = self.broadcast_engine.create_job(user_id, chat_id, session)
+        except Exception as e:
+            print(f"❌ Broadcast job creation error: {e}")
+            self.robust_send_message(chat_id, "❌ Could not start the broadcast. Please try again.")
+            return False
         
         del self.broadcast_sessions[user_id]
-        
+        self.broadcast_engine.start_job(job_id)
+        print(f"📢 Broadcast #{job_id} queued by admin {user_id}")
         return True
 
     # ==================== STARS PAYMENT METHODS ====================
@@ -4294,6 +6492,8 @@ All requests have been processed!"""
         
         if session['stage'] == 'waiting_message_or_photo':
             session['stage'] = 'preview'
+            session['media_type'] = 'text'
+            session['photo'] = None
             session['message'] = text
             
             preview_text = f"""📋 <b>Broadcast Preview</b>
@@ -4324,44 +6524,101 @@ Your message:
             
         return False
     
+    def get_broadcast_media_type(self, message):
+        """Return the broadcastable media key of a message, if any"""
+        for media_type in BroadcastEngine.MEDIA_TYPES:
+            if media_type in message:
+                return media_type
+        return None
+    
+    def handle_broadcast_media(self, user_id, chat_id, message):
+        """Handle any media message as broadcast content (copied to users as-is)"""
+        if user_id not in self.broadcast_sessions:
+            return False
+        
+        session = self.broadcast_sessions[user_id]
+        media_type = self.get_broadcast_media_type(message)
+        
+        if session['stage'] == 'waiting_message_or_photo' and media_type:
+            caption = message.get('caption', '')
+            session['stage'] = 'preview'
+            session['media_type'] = media_type
+            session['photo'] = None
+            session['message'] = caption
+            session['source_chat_id'] = chat_id
+            session['source_message_id'] = message['message_id']
+            
+            label = media_type.replace('_', ' ').title()
+            if media_type in BroadcastEngine.CAPTIONLESS_TYPES:
+                caption_line = "ℹ️ This media type carries no caption; it is sent exactly as received."
+            else:
+                caption_line = f"💬 Caption: {caption if caption else 'No caption'}"
+            preview_text = f"""📋 <b>Broadcast Preview</b>
+
+📎 <b>{label} Broadcast</b>
+{caption_line}
+
+📊 This broadcast will be sent to all verified users.
+
+⚠️ <b>Please review carefully before sending!</b>"""
+            
+            keyboard = {
+                "inline_keyboard": [
+                    [
+                        {"text": "✅ Send to All Users", "callback_data": "confirm_broadcast"},
+                        {"text": "✏️ Edit Message", "callback_data": "edit_broadcast"}
+                    ],
+                    [
+                        {"text": "❌ Cancel", "callback_data": "cancel_broadcast"}
+                    ]
+                ]
+            }
+            
+            self.robust_send_message(chat_id, preview_text, keyboard)
+            return True
+        
+        return False
+    
     def get_broadcast_stats(self, user_id, chat_id, message_id):
         """Show broadcast statistics"""
         if not self.is_admin(user_id):
             return False
-            
-        if not self.broadcast_stats:
+        
+        totals = self.broadcast_engine.get_totals()
+        if not totals['total']:
             stats_text = """📊 <b>Broadcast Statistics</b>
 
 No broadcasts sent yet.
 
 Use the broadcast feature to send messages to all users."""
         else:
-            total_broadcasts = len(self.broadcast_stats)
-            total_sent = sum(stats['success_count'] for stats in self.broadcast_stats.values())
-            total_failed = sum(stats['failed_count'] for stats in self.broadcast_stats.values())
-            total_users_reached = total_sent
-            
-            text_broadcasts = sum(1 for stats in self.broadcast_stats.values() if stats.get('type') == 'text')
-            photo_broadcasts = sum(1 for stats in self.broadcast_stats.values() if stats.get('type') == 'photo')
-            
-            recent_broadcasts = sorted(self.broadcast_stats.items(), key=lambda x: x[0], reverse=True)[:5]
-            
             stats_text = f"""📊 <b>Broadcast Statistics</b>
 
 📈 Overview:
-• Total broadcasts: {total_broadcasts}
-• Text broadcasts: {text_broadcasts}
-• Photo broadcasts: {photo_broadcasts}
-• Total messages sent: {total_sent}
-• Total failed: {total_failed}
-• Unique users reached: {total_users_reached}
-
-📋 Recent broadcasts:"""
-            
-            for broadcast_id, stats in recent_broadcasts:
-                date = datetime.fromisoformat(stats['timestamp']).strftime('%Y-%m-%d %H:%M')
-                broadcast_type = "📷 Photo" if stats.get('type') == 'photo' else "📝 Text"
-                stats_text += f"\n• {date}: {broadcast_type} - {stats['success_count']}/{stats['total_users']} users"
+• Total broadcasts: {totals['total']}
+• Text broadcasts: {totals['text']}
+• Photo broadcasts: {totals['photo']}
+• Other media broadcasts: {totals['media']}
+• Total messages sent: {totals['sent']}
+• Total failed: {totals['failed']}
+• Unique users reached: {totals['reached']}
+• Inactive users skipped: {totals['inactive']}"""
+            
+            if totals['errors']:
+                stats_text += "\n\n⚠️ Failures by cause:"
+                for error_class, count in totals['errors']:
+                    stats_text += f"\n• {error_class or 'unknown'}: {count}"
+            
+            stats_text += "\n\n📋 Recent broadcasts:"
+            
+            for job in self.broadcast_engine.get_recent_jobs(5):
+                date = (job['created_at'] or '')[:16]
+                if job['content_type'] in ('text', 'photo'):
+                    broadcast_type = "📷 Photo" if job['content_type'] == 'photo' else "📝 Text"
+                else:
+                    broadcast_type = f"📎 {job['content_type'].replace('_', ' ').title()}"
+                running = " (sending)" if job['status'] == 'running' else ""
+                stats_text += f"\n• {date}: {broadcast_type} - {job['success_count']}/{job['total_users']} users{running}"
         
         keyboard = {
             "inline_keyboard": [
@@ -4414,12 +6671,6 @@ Use the broadcast feature to send messages to all users."""
         """Auto-restart the bot safely"""
         print("🚀 Initiating auto-restart...")
         try:
-            if hasattr(self, 'conn'):
-                try:
-                    self.conn.close()
-                except:
-                    pass
-            
             if self.keep_alive:
                 self.keep_alive.stop()
             
@@ -4427,9 +6678,10 @@ Use the broadcast feature to send messages to all users."""
             self.consecutive_errors = 0
             self.last_restart = time.time()
             
-            self.setup_database()
-            self.verify_database_schema()
-            self.update_games_cache()
+            # Workers and background services share the live database manager;
+            # reopen only if it is gone
+            if not self.db or self.db.closed:
+                self.setup_database()
             
             if self.keep_alive:
                 self.keep_alive.start()
@@ -4444,7 +6696,6 @@ Use the broadcast feature to send messages to all users."""
         """Send message with retry logic and error handling"""
         for attempt in range(max_retries):
             try:
-                url = self.base_url + "sendMessage"
                 data = {
                     "chat_id": chat_id, 
                     "text": text, 
@@ -4453,8 +6704,7 @@ Use the broadcast feature to send messages to all users."""
                 if reply_markup:
                     data["reply_markup"] = json.dumps(reply_markup)
                 
-                response = requests.post(url, data=data, timeout=15)
-                result = response.json()
+                result = self.api.call("sendMessage", data)
                 
                 if result.get('ok'):
                     if self.consecutive_errors > 0:
@@ -4467,8 +6717,9 @@ Use the broadcast feature to send messages to all users."""
                     if any(msg in error_msg.lower() for msg in ["bot was blocked", "chat not found", "user not found"]):
                         return False
                     
-                    if attempt < max_retries - 1:
-                        time.sleep(1)
+                    # Flood waits are already handled by the API client; only
+                    # server-side failures are worth another attempt
+                    if result.get('error_code', 0) >= 500 and attempt < max_retries - 1:
                         continue
                     
                     return False
@@ -4476,20 +6727,14 @@ Use the broadcast feature to send messages to all users."""
             except requests.exceptions.Timeout:
                 print(f"⏰ Request timeout (attempt {attempt + 1})")
                 if attempt < max_retries - 1:
-                    time.sleep(2)
                     continue
                 return False
             except requests.exceptions.ConnectionError:
+                # The connection pool already retried with backoff
                 print(f"🔌 Connection error (attempt {attempt + 1})")
-                if attempt < max_retries - 1:
-                    time.sleep(3)
-                    continue
                 return False
             except Exception as e:
                 self.handle_error(e, "send_message")
-                if attempt < max_retries - 1:
-                    time.sleep(1)
-                    continue
                 return False
         return False
 
@@ -4521,26 +6766,146 @@ Use the broadcast feature to send messages to all users."""
         empty = length - filled
         return "█" * filled + "░" * empty
     
-    # ==================== DATABASE SCHEMA VERIFICATION ====================
+    # ==================== SCHEMA MIGRATIONS ====================
     
-    def verify_database_schema(self):
-        """Ensure database has correct schema for file uploads"""
+    # (version, description, method) - applied in order, tracked in PRAGMA user_version.
+    # Append new entries; never edit or renumber one that has shipped.
+    SCHEMA_MIGRATIONS = [
+        (1, "bot_message_id column on channel_games", 'migrate_bot_message_id_column'),
+        (2, "secondary indexes for game, purchase and request lookups", 'migrate_lookup_indexes'),
+        (3, "sessions table for persistent conversation state", 'migrate_sessions_table'),
+        (4, "broadcast_jobs table for resumable broadcasts", 'migrate_broadcast_jobs_table'),
+        (5, "broadcast delivery log and users.is_active", 'migrate_broadcast_deliveries'),
+        (6, "staged copyMessage source columns on broadcast_jobs", 'migrate_broadcast_staging'),
+        (7, "db_meta table with the logical write counter", 'migrate_db_meta'),
+        (8, "file verification status on uploaded games", 'migrate_file_verification'),
+    ]
+    
+    def get_schema_version(self):
+        return self.conn.execute('PRAGMA user_version').fetchone()[0]
+    
+    def run_migrations(self):
+        """Apply pending schema migrations, each in its own transaction"""
         try:
-            cursor = self.conn.cursor()
-            
-            cursor.execute("PRAGMA table_info(channel_games)")
-            columns = [column[1] for column in cursor.fetchall()]
+            current_version = self.get_schema_version()
+            pending = [m for m in self.SCHEMA_MIGRATIONS if m[0] > current_version]
+            if not pending:
+                # Cheap; only re-analyzes tables whose statistics went stale
+                self.db.run_write(lambda conn: conn.execute('PRAGMA optimize'))
+                return True
             
-            if 'bot_message_id' not in columns:
-                print("🔄 Adding bot_message_id column to database...")
-                cursor.execute('ALTER TABLE channel_games ADD COLUMN bot_message_id INTEGER')
-                self.conn.commit()
-                print("✅ Database schema updated successfully!")
+            for version, description, method in pending:
+                def apply_migration(conn, version=version, method=method):
+                    getattr(self, method)(conn)
+                    conn.execute(f'PRAGMA user_version = {int(version)}')
                 
+                print(f"🔄 Applying schema migration {version}: {description}")
+                self.db.run_write(apply_migration)
+            
+            # Refresh planner statistics so the new indexes get used
+            self.db.run_write(lambda conn: conn.execute('ANALYZE'))
+            print(f"✅ Database schema at version {self.get_schema_version()}")
             return True
         except Exception as e:
-            print(f"❌ Database schema verification failed: {e}")
+            print(f"❌ Schema migration failed: {e}")
             return False
+    
+    def migrate_bot_message_id_column(self, conn):
+        columns = [column[1] for column in conn.execute("PRAGMA table_info(channel_games)").fetchall()]
+        if 'bot_message_id' not in columns:
+            conn.execute('ALTER TABLE channel_games ADD COLUMN bot_message_id INTEGER')
+    
+    def migrate_lookup_indexes(self, conn):
+        for statement in (
+            'CREATE INDEX IF NOT EXISTS idx_channel_games_bot_message ON channel_games (bot_message_id)',
+            'CREATE INDEX IF NOT EXISTS idx_channel_games_duplicate ON channel_games (file_name, file_size, file_type)',
+            'CREATE INDEX IF NOT EXISTS idx_channel_games_uploader ON channel_games (added_by, is_uploaded)',
+            'CREATE INDEX IF NOT EXISTS idx_premium_games_bot_message ON premium_games (bot_message_id)',
+            'CREATE INDEX IF NOT EXISTS idx_premium_games_duplicate ON premium_games (file_name, file_size, file_type)',
+            'CREATE INDEX IF NOT EXISTS idx_premium_games_uploader ON premium_games (added_by, is_uploaded)',
+            'CREATE INDEX IF NOT EXISTS idx_premium_purchases_user_game ON premium_purchases (user_id, game_id)',
+            'CREATE INDEX IF NOT EXISTS idx_premium_purchases_game ON premium_purchases (game_id)',
+            'CREATE INDEX IF NOT EXISTS idx_premium_purchases_transaction ON premium_purchases (transaction_id)',
+            'CREATE INDEX IF NOT EXISTS idx_game_requests_status ON game_requests (status, created_at)',
+        ):
+            conn.execute(statement)
+    
+    def migrate_sessions_table(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                kind TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (kind, user_id)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)')
+    
+    def migrate_broadcast_jobs_table(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                admin_id INTEGER,
+                chat_id INTEGER,
+                progress_message_id INTEGER,
+                content_type TEXT,
+                message TEXT,
+                photo TEXT,
+                status TEXT DEFAULT 'running',
+                total_users INTEGER DEFAULT 0,
+                cursor INTEGER DEFAULT 0,
+                processed_count INTEGER DEFAULT 0,
+                success_count INTEGER DEFAULT 0,
+                failed_count INTEGER DEFAULT 0,
+                started_at REAL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                completed_at DATETIME
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs (status)')
+    
+    def migrate_broadcast_deliveries(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+                job_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                error_class TEXT,
+                error_code INTEGER,
+                delivered_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (job_id, user_id)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_broadcast_deliveries_time ON broadcast_deliveries (delivered_at)')
+        columns = [column[1] for column in conn.execute("PRAGMA table_info(users)").fetchall()]
+        if 'is_active' not in columns:
+            conn.execute('ALTER TABLE users ADD COLUMN is_active INTEGER DEFAULT 1')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_users_broadcast ON users (is_verified, is_active, user_id)')
+    
+    def migrate_broadcast_staging(self, conn):
+        columns = [column[1] for column in conn.execute("PRAGMA table_info(broadcast_jobs)").fetchall()]
+        for column, column_type in (('source_chat_id', 'INTEGER'), ('source_message_id', 'INTEGER'),
+                                    ('staging_chat_id', 'TEXT'), ('staging_message_id', 'INTEGER')):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE broadcast_jobs ADD COLUMN {column} {column_type}')
+    
+    def migrate_db_meta(self, conn):
+        conn.execute('CREATE TABLE IF NOT EXISTS db_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        conn.execute("INSERT OR IGNORE INTO db_meta (key, value) VALUES ('write_counter', 0)")
+    
+    def migrate_file_verification(self, conn):
+        for table in FileVerificationJob.TABLES:
+            columns = [column[1] for column in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+            if 'last_verified_at' not in columns:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN last_verified_at DATETIME')
+            if 'is_accessible' not in columns:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN is_accessible INTEGER DEFAULT 1')
+            conn.execute(f'''
+                CREATE INDEX IF NOT EXISTS idx_{table}_verification ON {table} (last_verified_at)
+                WHERE is_uploaded = 1 AND bot_message_id IS NOT NULL
+            ''')
 
     # ==================== MINI-GAMES IMPLEMENTATION ====================
     
@@ -4893,10 +7258,8 @@ Always available!
         try:
             print("🔍 Scanning for bot-uploaded games...")
             
-            url = self.base_url + "getUpdates"
             params = {"timeout": 10, "limit": 100}
-            response = requests.get(url, params=params, timeout=30)
-            result = response.json()
+            result = self.api.call("getUpdates", params=params, timeout=30, http_method='GET')
             
             if not result.get('ok'):
                 print(f"❌ Cannot get updates: {result.get('description')}")
@@ -4942,7 +7305,7 @@ Always available!
                                     'bot_message_id': message['message_id']
                                 }
                                 
-                                cursor.execute('''
+                                cursor = self.db.execute_write('''
                                     INSERT OR IGNORE INTO channel_games 
                                     (message_id, file_name, file_type, file_size, upload_date, category, 
                                      added_by, is_uploaded, is_forwarded, file_id, bot_message_id)
@@ -4961,7 +7324,8 @@ Always available!
                                     game_info['bot_message_id']
                                 ))
                                 
-                                self.conn.commit()
+                                if cursor.rowcount == 1:
+                                    self.cache_add_game(cursor.lastrowid)
                                 bot_games_found += 1
                                 print(f"✅ Found bot-uploaded game: {file_name}")
             
@@ -4977,59 +7341,96 @@ Always available!
 
     # ==================== SEARCH GAMES METHODS ====================
     
-    def search_games(self, search_term, user_id):
+    def search_games(self, search_term, user_id, limit=None):
+        """Find games by name, best matches first.
+
+        Uses the games_fts trigram index ranked by bm25. Words shorter than
+        three characters cannot match trigrams, so a query made only of such
+        words falls back to a LIKE scan.
+        """
         search_term = search_term.lower().strip()
-        results = []
-        
-        total_steps = 5
-        progress_messages = [
-            "🔍 Starting search...",
-            "📁 Scanning database...",
-            "🔎 Matching files...",
-            "📊 Analyzing results...",
-            "✅ Search complete!"
-        ]
+        limit = limit or self.SEARCH_RESULT_LIMIT
+        if not search_term:
+            return []
         
+        start_time = time.perf_counter()
+        words = [word for word in search_term.split() if len(word) >= 3]
         cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT message_id, file_name, file_type, file_size, upload_date, category, file_id, 
-                   bot_message_id, is_uploaded, is_forwarded
-            FROM channel_games 
-            WHERE LOWER(file_name) LIKE ? OR file_name LIKE ?
-        ''', (f'%{search_term}%', f'%{search_term}%'))
         
-        all_games = cursor.fetchall()
+        engine = 'fts' if self.fts_enabled and words else 'like'
+        if engine == 'fts':
+            phrases = [search_term] + words if len(words) > 1 or words[0] != search_term else words
+            match_query = ' OR '.join('"' + phrase.replace('"', '""') + '"' for phrase in phrases)
+            cursor.execute('''
+                SELECT rowid FROM games_fts
+                WHERE games_fts MATCH ?
+                ORDER BY bm25(games_fts)
+                LIMIT ?
+            ''', (match_query, limit))
+            ranked_rowids = [row[0] for row in cursor.fetchall()]
+            channel_ids = [rowid // 2 for rowid in ranked_rowids if rowid % 2 == 0]
+            premium_ids = [rowid // 2 for rowid in ranked_rowids if rowid % 2 == 1]
+        else:
+            # A literal % or _ in the query must not act as a wildcard
+            escaped_term = search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            like_term = f'%{escaped_term}%'
+            cursor.execute("SELECT id FROM channel_games WHERE file_name LIKE ? ESCAPE '\\' LIMIT ?", (like_term, limit))
+            channel_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT id FROM premium_games WHERE file_name LIKE ? ESCAPE '\\' LIMIT ?", (like_term, limit))
+            premium_ids = [row[0] for row in cursor.fetchall()]
+            ranked_rowids = [row_id * 2 for row_id in channel_ids] + [row_id * 2 + 1 for row_id in premium_ids]
+        
+        games_by_rowid = {}
+        
+        if channel_ids:
+            placeholders = ','.join('?' * len(channel_ids))
+            cursor.execute(f'''
+                SELECT id, message_id, file_name, file_type, file_size, upload_date, category, file_id, 
+                       bot_message_id, is_uploaded, is_forwarded
+                FROM channel_games 
+                WHERE id IN ({placeholders})
+            ''', channel_ids)
+            for game in cursor.fetchall():
+                (row_id, message_id, file_name, file_type, file_size, upload_date, 
+                 category, file_id, bot_message_id, is_uploaded, is_forwarded) = game
+                games_by_rowid[row_id * 2] = {
+                    'id': row_id,
+                    'source': GameCallbackCodec.SOURCE_CHANNEL,
+                    'message_id': message_id,
+                    'file_name': file_name,
+                    'file_type': file_type,
+                    'file_size': file_size,
+                    'upload_date': upload_date,
+                    'category': category,
+                    'file_id': file_id,
+                    'bot_message_id': bot_message_id,
+                    'is_uploaded': is_uploaded,
+                    'is_forwarded': is_forwarded
+                }
         
-        for step in range(total_steps):
-            progress = int((step + 1) * 100 / total_steps)
-            
-            if user_id in self.search_sessions:
-                self.search_sessions[user_id]['progress'] = progress
-                self.search_sessions[user_id]['message'] = progress_messages[step]
-            
-            time.sleep(0.3)
-            
-            if step == total_steps - 1:
-                for game in all_games:
-                    (message_id, file_name, file_type, file_size, upload_date, 
-                     category, file_id, bot_message_id, is_uploaded, is_forwarded) = game
-                    
-                    if (search_term in file_name.lower() or 
-                        search_term.replace(' ', '').lower() in file_name.lower().replace(' ', '') or
-                        any(word in file_name.lower() for word in search_term.split())):
-                        results.append({
-                            'message_id': message_id,
-                            'file_name': file_name,
-                            'file_type': file_type,
-                            'file_size': file_size,
-                            'upload_date': upload_date,
-                            'category': category,
-                            'file_id': file_id,
-                            'bot_message_id': bot_message_id,
-                            'is_uploaded': is_uploaded,
-                            'is_forwarded': is_forwarded
-                        })
+        if premium_ids:
+            placeholders = ','.join('?' * len(premium_ids))
+            cursor.execute(f'''
+                SELECT id, file_name, file_type, file_size, upload_date, category, stars_price
+                FROM premium_games 
+                WHERE id IN ({placeholders})
+            ''', premium_ids)
+            for game in cursor.fetchall():
+                row_id, file_name, file_type, file_size, upload_date, category, stars_price = game
+                games_by_rowid[row_id * 2 + 1] = {
+                    'id': row_id,
+                    'source': GameCallbackCodec.SOURCE_PREMIUM,
+                    'file_name': file_name,
+                    'file_type': file_type,
+                    'file_size': file_size or 0,
+                    'upload_date': upload_date,
+                    'category': category,
+                    'stars_price': stars_price,
+                    'is_uploaded': 1
+                }
         
+        results = [games_by_rowid[rowid] for rowid in ranked_rowids if rowid in games_by_rowid]
+        metrics.observe('game_search_duration_seconds', time.perf_counter() - start_time, (('engine', engine),))
         return results
     
     def create_search_results_buttons(self, results, search_term, user_id, page=0):
@@ -5045,22 +7446,10 @@ Always available!
             if len(button_text) > 30:
                 button_text = button_text[:27] + "..."
             
-            if game['is_uploaded'] == 1 and game['bot_message_id']:
-                message_id_to_send = game['bot_message_id']
-                is_bot_file = True
-            else:
-                message_id_to_send = game['message_id']
-                is_bot_file = False
-            
-            file_id_clean = str(game['file_id']).replace('-', '_').replace('=', 'eq')
-            callback_data = f"send_game_{message_id_to_send}_{file_id_clean}_{1 if is_bot_file else 0}"
-            
-            if len(callback_data) > 64:
-                callback_data = f"send_game_{message_id_to_send}_short_{1 if is_bot_file else 0}"
-            
+            icon = "💰" if game['source'] == GameCallbackCodec.SOURCE_PREMIUM else "📁"
             keyboard.append([{
-                "text": f"📁 {i}. {button_text}",
-                "callback_data": callback_data
+                "text": f"{icon} {i}. {button_text}",
+                "callback_data": GameCallbackCodec.encode(game['id'], game['source'])
             }])
         
         pagination_buttons = []
@@ -5117,10 +7506,9 @@ Always available!
             
             def perform_search():
                 try:
+                    search_start = time.time()
                     results = self.search_games(search_term, user_id)
-                    
-                    progress_info = self.search_sessions.get(user_id, {})
-                    search_time = time.time() - progress_info.get('start_time', time.time())
+                    search_time = time.time() - search_start
                     
                     self.search_results[user_id] = {
                         'results': results,
@@ -5137,7 +7525,10 @@ Always available!
                         
                         for i, game in enumerate(results[:5], 1):
                             size = self.format_file_size(game['file_size'])
-                            source = "🤖 Bot" if game['is_uploaded'] == 1 else "📢 Channel"
+                            if game['source'] == GameCallbackCodec.SOURCE_PREMIUM:
+                                source = f"💰 {game['stars_price']} Stars"
+                            else:
+                                source = "🤖 Bot" if game['is_uploaded'] == 1 else "📢 Channel"
                             results_text += f"{i}. <code>{game['file_name']}</code>\n"
                             results_text += f"   📦 {game['file_type']} | 📏 {size} | 🗂️ {game['category']} | {source}\n\n"
                         
@@ -5253,146 +7644,210 @@ Always available!
 
     # ==================== DATABASE & SETUP METHODS ====================
     
-    def setup_database(self):
+    def setup_database(self, db_path=None):
+        db_path = db_path or self.get_db_path()
         try:
-            db_path = self.get_db_path()
             print(f"📁 Database path: {db_path}")
             
-            self.conn = sqlite3.connect(db_path, check_same_thread=False)
-            cursor = self.conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    is_verified INTEGER DEFAULT 0,
-                    joined_channel INTEGER DEFAULT 0,
-                    verification_code TEXT,
-                    code_expires DATETIME,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS channel_games (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    message_id INTEGER UNIQUE,
-                    file_name TEXT,
-                    file_type TEXT,
-                    file_size INTEGER,
-                    upload_date DATETIME,
-                    category TEXT,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    added_by INTEGER DEFAULT 0,
-                    is_uploaded INTEGER DEFAULT 0,
-                    is_forwarded INTEGER DEFAULT 0,
-                    file_id TEXT,
-                    bot_message_id INTEGER
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS stars_transactions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    user_name TEXT,
-                    stars_amount INTEGER,
-                    usd_amount REAL,
-                    description TEXT,
-                    telegram_star_amount INTEGER,
-                    transaction_id TEXT,
-                    payment_status TEXT DEFAULT 'pending',
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    completed_at DATETIME
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS stars_balance (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    total_stars_earned INTEGER DEFAULT 0,
-                    total_usd_earned REAL DEFAULT 0.0,
-                    available_stars INTEGER DEFAULT 0,
-                    available_usd REAL DEFAULT 0.0,
-                    last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS game_requests (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    user_name TEXT,
-                    game_name TEXT,
-                    platform TEXT,
-                    status TEXT DEFAULT 'pending',
-                    admin_notes TEXT,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS game_request_replies (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    request_id INTEGER,
-                    admin_id INTEGER,
-                    reply_text TEXT,
-                    photo_file_id TEXT,
-                    reply_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (request_id) REFERENCES game_requests (id)
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS premium_games (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    message_id INTEGER UNIQUE,
-                    file_name TEXT,
-                    file_type TEXT,
-                    file_size INTEGER,
-                    upload_date DATETIME,
-                    category TEXT,
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    added_by INTEGER DEFAULT 0,
-                    is_uploaded INTEGER DEFAULT 0,
-                    is_forwarded INTEGER DEFAULT 0,
-                    file_id TEXT,
-                    bot_message_id INTEGER,
-                    stars_price INTEGER DEFAULT 0,
-                    description TEXT,
-                    is_premium INTEGER DEFAULT 1
-                )
-            ''')
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS premium_purchases (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    game_id INTEGER,
-                    stars_paid INTEGER,
-                    purchase_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    transaction_id TEXT,
-                    status TEXT DEFAULT 'completed'
-                )
-            ''')
-            
-            cursor.execute('INSERT OR IGNORE INTO stars_balance (id) VALUES (1)')
-            
-            self.conn.commit()
+            self.open_database(db_path)
+            self.db.run_write(self.create_tables)
             print("✅ Database setup successful!")
             
+            self.run_migrations()
+            self.db.write_counter_enabled = self.db.get_write_counter() is not None
+            
         except Exception as e:
             print(f"❌ Database error: {e}")
-            self.conn = sqlite3.connect(':memory:', check_same_thread=False)
-            self.setup_database()
+            if db_path != ':memory:':
+                self.setup_database(':memory:')
+    
+    def open_database(self, db_path):
+        """Open the database, closing the previous connections first"""
+        if self.db:
+            self.db.close()
+        self.db = DatabaseManager(db_path)
+        # Cached verification flags describe the old file (e.g. before a GitHub restore)
+        self.user_state_cache.clear()
+    
+    @property
+    def conn(self):
+        """Read connection for the calling thread; writes go through self.db"""
+        return self.db.reader()
+    
+    def create_tables(self, conn):
+        """Create all tables; runs inside a write transaction"""
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT,
+                is_verified INTEGER DEFAULT 0,
+                joined_channel INTEGER DEFAULT 0,
+                verification_code TEXT,
+                code_expires DATETIME,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS channel_games (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id INTEGER UNIQUE,
+                file_name TEXT,
+                file_type TEXT,
+                file_size INTEGER,
+                upload_date DATETIME,
+                category TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                added_by INTEGER DEFAULT 0,
+                is_uploaded INTEGER DEFAULT 0,
+                is_forwarded INTEGER DEFAULT 0,
+                file_id TEXT,
+                bot_message_id INTEGER
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stars_transactions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                user_name TEXT,
+                stars_amount INTEGER,
+                usd_amount REAL,
+                description TEXT,
+                telegram_star_amount INTEGER,
+                transaction_id TEXT,
+                payment_status TEXT DEFAULT 'pending',
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                completed_at DATETIME
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stars_balance (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                total_stars_earned INTEGER DEFAULT 0,
+                total_usd_earned REAL DEFAULT 0.0,
+                available_stars INTEGER DEFAULT 0,
+                available_usd REAL DEFAULT 0.0,
+                last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS game_requests (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                user_name TEXT,
+                game_name TEXT,
+                platform TEXT,
+                status TEXT DEFAULT 'pending',
+                admin_notes TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS game_request_replies (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                request_id INTEGER,
+                admin_id INTEGER,
+                reply_text TEXT,
+                photo_file_id TEXT,
+                reply_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (request_id) REFERENCES game_requests (id)
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS premium_games (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id INTEGER UNIQUE,
+                file_name TEXT,
+                file_type TEXT,
+                file_size INTEGER,
+                upload_date DATETIME,
+                category TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                added_by INTEGER DEFAULT 0,
+                is_uploaded INTEGER DEFAULT 0,
+                is_forwarded INTEGER DEFAULT 0,
+                file_id TEXT,
+                bot_message_id INTEGER,
+                stars_price INTEGER DEFAULT 0,
+                description TEXT,
+                is_premium INTEGER DEFAULT 1
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS premium_purchases (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                game_id INTEGER,
+                stars_paid INTEGER,
+                purchase_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+                transaction_id TEXT,
+                status TEXT DEFAULT 'completed'
+            )
+        ''')
+        
+        cursor.execute('INSERT OR IGNORE INTO stars_balance (id) VALUES (1)')
+        
+        self.setup_search_index(cursor)
+    
+    def setup_search_index(self, cursor):
+        """Create the games_fts trigram index and the triggers that keep it in sync.
+
+        Both game tables share one index: channel_games row N is fts rowid 2N,
+        premium_games row N is 2N+1.
+        """
+        try:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'games_fts'")
+            is_new_index = cursor.fetchone() is None
+            
+            cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS games_fts USING fts5(file_name, tokenize = 'trigram')")
+            
+            for table, rowid_expr in (('channel_games', '{row}.id * 2'), ('premium_games', '{row}.id * 2 + 1')):
+                new_rowid = rowid_expr.format(row='new')
+                old_rowid = rowid_expr.format(row='old')
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                        INSERT INTO games_fts (rowid, file_name) VALUES ({new_rowid}, new.file_name);
+                    END
+                ''')
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                        DELETE FROM games_fts WHERE rowid = {old_rowid};
+                    END
+                ''')
+                cursor.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF file_name ON {table} BEGIN
+                        UPDATE games_fts SET file_name = new.file_name WHERE rowid = {old_rowid};
+                    END
+                ''')
+            
+            if is_new_index:
+                cursor.execute('''
+                    INSERT INTO games_fts (rowid, file_name)
+                    SELECT id * 2, file_name FROM channel_games
+                    UNION ALL
+                    SELECT id * 2 + 1, file_name FROM premium_games
+                ''')
+                print("✅ Game search index built")
+            
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            # SQLite builds without FTS5 or the trigram tokenizer (< 3.34)
+            print(f"⚠️ Full-text search unavailable, using LIKE search: {e}")
+            self.fts_enabled = False
     
     def test_bot_connection(self):
         try:
-            url = self.base_url + "getMe"
-            response = requests.get(url, timeout=10)
-            data = response.json()
+            data = self.api.call("getMe", http_method='GET')
             
             if data.get('ok'):
                 bot_name = data['result']['first_name']
@@ -5417,8 +7872,6 @@ Always available!
             
             bot_games_found = self.scan_bot_uploaded_games()
             
-            self.update_games_cache()
-            
             total_games = bot_games_found
             print(f"🔄 Rescan complete! Found {total_games} total games from bot uploads")
             
@@ -5432,62 +7885,170 @@ Always available!
     
     def store_games_in_db(self, game_files):
         try:
-            cursor = self.conn.cursor()
-            for game in game_files:
-                cursor.execute('''
-                    INSERT OR IGNORE INTO channel_games 
-                    (message_id, file_name, file_type, file_size, upload_date, category, added_by, is_uploaded, is_forwarded, file_id, bot_message_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    game['message_id'],
-                    game['file_name'],
-                    game['file_type'],
-                    game['file_size'],
-                    game['upload_date'],
-                    game['category'],
-                    game.get('added_by', 0),
-                    game.get('is_uploaded', 0),
-                    game.get('is_forwarded', 0),
-                    game.get('file_id', ''),
-                    game.get('bot_message_id', None)
-                ))
-            self.conn.commit()
+            self.db.execute_writes([('''
+                INSERT OR IGNORE INTO channel_games 
+                (message_id, file_name, file_type, file_size, upload_date, category, added_by, is_uploaded, is_forwarded, file_id, bot_message_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                game['message_id'],
+                game['file_name'],
+                game['file_type'],
+                game['file_size'],
+                game['upload_date'],
+                game['category'],
+                game.get('added_by', 0),
+                game.get('is_uploaded', 0),
+                game.get('is_forwarded', 0),
+                game.get('file_id', ''),
+                game.get('bot_message_id', None)
+            )) for game in game_files])
         except Exception as e:
             print(f"Database error: {e}")
     
+    GAME_CACHE_COLUMNS = '''
+        id, file_name, file_type, file_size, upload_date, category, is_uploaded,
+        message_id, bot_message_id, file_id
+    '''
+    GAME_CACHE_BUCKETS = ('zip', '7z', 'iso', 'apk', 'rar', 'pkg', 'cso', 'pbp', 'recent', 'all')
+
     def update_games_cache(self):
+        """Rebuild the games cache from channel_games.
+
+        Normal changes go through cache_add_game/cache_remove_game; a full
+        rebuild is only needed at startup, after a restore, on admin request
+        and when check_games_cache finds drift.
+        """
         try:
             cursor = self.conn.cursor()
-            cursor.execute('SELECT file_name, file_type, file_size, upload_date, category, is_uploaded FROM channel_games')
+            cursor.execute(f'SELECT {self.GAME_CACHE_COLUMNS} FROM channel_games ORDER BY id')
             games = cursor.fetchall()
             
-            self.games_cache = {
-                'zip': [], '7z': [], 'iso': [], 'apk': [], 'rar': [], 
-                'pkg': [], 'cso': [], 'pbp': [], 'recent': [], 'all': []
-            }
+            games_cache = {bucket: {} for bucket in self.GAME_CACHE_BUCKETS}
+            game_file_refs = {}
             
             for game in games:
-                file_name, file_type, file_size, upload_date, category, is_uploaded = game
-                game_info = {
-                    'file_name': file_name,
-                    'file_type': file_type,
-                    'file_size': file_size,
-                    'upload_date': upload_date,
-                    'category': category,
-                    'is_uploaded': is_uploaded
-                }
-                
-                file_type_lower = file_type.lower()
-                if file_type_lower in self.games_cache:
-                    self.games_cache[file_type_lower].append(game_info)
-                
-                self.games_cache['all'].append(game_info)
+                self.add_game_to_buckets(games_cache, game_file_refs, game)
             
+            with self.games_cache_lock:
+                self.games_cache = games_cache
+                self.game_file_refs = game_file_refs
             print(f"🔄 Cache updated: {len(self.games_cache['all'])} games")
             
         except Exception as e:
             print(f"Cache error: {e}")
     
+    def add_game_to_buckets(self, games_cache, game_file_refs, game):
+        """Place one channel_games row (GAME_CACHE_COLUMNS order) into the cache buckets"""
+        (row_id, file_name, file_type, file_size, upload_date, category, is_uploaded,
+         message_id, bot_message_id, file_id) = game
+        game_info = {
+            'id': row_id,
+            'file_name': file_name,
+            'file_type': file_type,
+            'file_size': file_size,
+            'upload_date': upload_date,
+            'category': category,
+            'is_uploaded': is_uploaded
+        }
+        
+        file_type_lower = (file_type or '').lower()
+        if file_type_lower in games_cache:
+            games_cache[file_type_lower][row_id] = game_info
+        
+        games_cache['all'][row_id] = game_info
+        game_file_refs[row_id] = self.build_game_file_ref(message_id, bot_message_id, file_id, is_uploaded)
+    
+    def cache_add_game(self, row_id):
+        """Load a newly inserted channel_games row into the cache"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(f'SELECT {self.GAME_CACHE_COLUMNS} FROM channel_games WHERE id = ?', (row_id,))
+            game = cursor.fetchone()
+            if game:
+                with self.games_cache_lock:
+                    self.add_game_to_buckets(self.games_cache, self.game_file_refs, game)
+        except Exception as e:
+            print(f"Cache add error: {e}")
+    
+    def cache_remove_game(self, row_id):
+        """Drop a deleted channel_games row from the cache"""
+        with self.games_cache_lock:
+            for bucket in self.games_cache.values():
+                bucket.pop(row_id, None)
+            self.game_file_refs.pop(row_id, None)
+    
+    def cache_clear_games(self):
+        with self.games_cache_lock:
+            self.games_cache = {bucket: {} for bucket in self.GAME_CACHE_BUCKETS}
+            self.game_file_refs = {}
+    
+    def get_cached_games(self, *buckets):
+        """Cached games for the given file type buckets as a list"""
+        with self.games_cache_lock:
+            games = []
+            for bucket in buckets:
+                games.extend(self.games_cache.get(bucket, {}).values())
+            return games
+    
+    def check_games_cache(self):
+        """Compare the cache with channel_games and rebuild if they drifted apart"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT COUNT(*), COALESCE(SUM(id), 0) FROM channel_games')
+            db_count, db_id_sum = cursor.fetchone()
+            
+            with self.games_cache_lock:
+                cached = self.games_cache.get('all', {})
+                cache_count, cache_id_sum = len(cached), sum(cached)
+            
+            if (db_count, db_id_sum) != (cache_count, cache_id_sum):
+                print(f"⚠️ Games cache out of sync ({cache_count} cached vs {db_count} in database), rebuilding...")
+                self.update_games_cache()
+                return False
+            return True
+        except Exception as e:
+            print(f"Cache check error: {e}")
+            return False
+    
+    def start_games_cache_checker(self):
+        """Run check_games_cache periodically in the background"""
+        interval = int(os.environ.get('GAMES_CACHE_CHECK_INTERVAL', 600))
+        
+        def checker_loop():
+            while not self.stop_event.wait(interval):
+                self.check_games_cache()
+        
+        checker_thread = threading.Thread(target=checker_loop, name="games-cache-check", daemon=True)
+        checker_thread.start()
+        print(f"✅ Games cache consistency check every {interval}s")
+    
+    def build_game_file_ref(self, message_id, bot_message_id, file_id, is_uploaded):
+        """Pre-resolve where a game's file is sent from"""
+        is_bot_file = bool(is_uploaded == 1 and bot_message_id)
+        return {
+            'file_id': file_id,
+            'message_id': bot_message_id if is_bot_file else message_id,
+            'is_bot_file': is_bot_file
+        }
+    
+    def get_game_file_ref(self, row_id):
+        """File reference for a channel_games row, from memory when possible"""
+        file_ref = self.game_file_refs.get(row_id)
+        if file_ref is not None:
+            return file_ref
+        
+        # Not cached (e.g. removed, or the cache is mid-rebuild)
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT message_id, bot_message_id, file_id, is_uploaded FROM channel_games WHERE id = ?', (row_id,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            return self.build_game_file_ref(*row)
+        except Exception as e:
+            print(f"❌ Error resolving game {row_id}: {e}")
+            return None
+    
     def format_file_size(self, size_bytes):
         if size_bytes == 0:
             return "0 B"
@@ -5519,13 +8080,12 @@ Always available!
     def save_verification_code(self, user_id, username, first_name, code):
         try:
             expires = datetime.now() + timedelta(minutes=10)
-            cursor = self.conn.cursor()
-            cursor.execute('''
+            self.db.execute_write('''
                 INSERT OR REPLACE INTO users 
                 (user_id, username, first_name, verification_code, code_expires, is_verified, joined_channel)
                 VALUES (?, ?, ?, ?, ?, 0, 0)
             ''', (user_id, username, first_name, code, expires))
-            self.conn.commit()
+            self.user_state_cache.invalidate(user_id, 'state')
             print(f"✅ Verification code saved for user {user_id}: {code}")
             return True
         except Exception as e:
@@ -5553,8 +8113,8 @@ Always available!
                 return False
                 
             if stored_code == code:
-                cursor.execute('UPDATE users SET is_verified = 1 WHERE user_id = ?', (user_id,))
-                self.conn.commit()
+                self.db.execute_write('UPDATE users SET is_verified = 1 WHERE user_id = ?', (user_id,))
+                self.user_state_cache.invalidate(user_id, 'state')
                 print(f"✅ User {user_id} verified successfully")
                 return True
             else:
@@ -5565,20 +8125,27 @@ Always available!
             print(f"❌ Verification error: {e}")
             return False
     
-    def check_channel_membership(self, user_id):
+    def check_channel_membership(self, user_id, force=False):
+        """Channel membership, cached; force=True always asks Telegram"""
+        if not force:
+            cached = self.user_state_cache.get(user_id, 'member')
+            if cached is not None:
+                return cached
+        
         try:
-            url = self.base_url + "getChatMember"
             data = {
                 "chat_id": self.REQUIRED_CHANNEL,
                 "user_id": user_id
             }
-            response = requests.post(url, data=data, timeout=10)
-            result = response.json()
+            result = self.api.call("getChatMember", data)
             
             if result.get('ok'):
                 status = result['result']['status']
                 is_member = status in ['member', 'administrator', 'creator']
                 print(f"📢 Channel check for {user_id}: {status} -> {'Member' if is_member else 'Not member'}")
+                # Non-members are re-checked sooner so joining is noticed quickly
+                ttl = self.MEMBERSHIP_TTL if is_member else self.MEMBERSHIP_NEGATIVE_TTL
+                self.user_state_cache.set(user_id, 'member', is_member, ttl)
                 return is_member
             
         except Exception as e:
@@ -5588,35 +8155,51 @@ Always available!
     
     def mark_channel_joined(self, user_id):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('UPDATE users SET joined_channel = 1 WHERE user_id = ?', (user_id,))
-            self.conn.commit()
+            self.db.execute_write('UPDATE users SET joined_channel = 1 WHERE user_id = ?', (user_id,))
+            self.user_state_cache.invalidate(user_id, 'state')
             print(f"✅ Marked channel joined for user {user_id}")
             return True
         except Exception as e:
             print(f"❌ Error marking channel: {e}")
             return False
     
-    def is_user_verified(self, user_id):
+    def get_user_state(self, user_id):
+        """(is_verified, joined_channel) for a user, served from the cache when fresh"""
+        state = self.user_state_cache.get(user_id, 'state')
+        if state is not None:
+            return state
+        
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT is_verified, joined_channel FROM users WHERE user_id = ?', (user_id,))
+        result = cursor.fetchone()
+        state = (bool(result and result[0] == 1), bool(result and result[1] == 1))
+        self.user_state_cache.set(user_id, 'state', state, self.USER_STATE_TTL)
+        print(f"🔍 User {user_id} state loaded: verified={state[0]}, joined={state[1]}")
+        return state
+    
+    def reactivate_user(self, user_id):
+        """Include a user in broadcasts again after a blocked/unreachable delivery"""
         try:
             cursor = self.conn.cursor()
-            cursor.execute('SELECT is_verified FROM users WHERE user_id = ?', (user_id,))
+            cursor.execute('SELECT is_active FROM users WHERE user_id = ?', (user_id,))
             result = cursor.fetchone()
-            is_verified = result and result[0] == 1
-            print(f"🔍 User {user_id} verified: {is_verified}")
-            return is_verified
+            if result and result[0] == 0:
+                self.db.execute_write('UPDATE users SET is_active = 1 WHERE user_id = ?', (user_id,))
+                print(f"✅ User {user_id} is reachable again")
+        except Exception as e:
+            print(f"❌ Error reactivating user: {e}")
+    
+    def is_user_verified(self, user_id):
+        try:
+            return self.get_user_state(user_id)[0]
         except Exception as e:
             print(f"❌ Error checking verification: {e}")
             return False
     
     def is_user_completed(self, user_id):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('SELECT is_verified, joined_channel FROM users WHERE user_id = ?', (user_id,))
-            result = cursor.fetchone()
-            is_completed = result and result[0] == 1 and result[1] == 1
-            print(f"🔍 User {user_id} completed: {is_completed}")
-            return is_completed
+            is_verified, joined_channel = self.get_user_state(user_id)
+            return is_verified and joined_channel
         except Exception as e:
             print(f"❌ Error checking completion: {e}")
             return False
@@ -5626,7 +8209,6 @@ Always available!
     
     def edit_message(self, chat_id, message_id, text, reply_markup=None):
         try:
-            url = self.base_url + "editMessageText"
             data = {
                 "chat_id": chat_id,
                 "message_id": message_id,
@@ -5636,31 +8218,30 @@ Always available!
             if reply_markup:
                 data["reply_markup"] = json.dumps(reply_markup)
             
-            response = requests.post(url, data=data, timeout=15)
-            return response.json().get('ok', False)
+            return self.api.call("editMessageText", data).get('ok', False)
         except Exception as e:
             print(f"Edit message error: {e}")
             return False
     
     def answer_callback_query(self, callback_query_id, text=None, show_alert=False):
         try:
-            url = self.base_url + "answerCallbackQuery"
             data = {"callback_query_id": callback_query_id}
             if text:
                 data["text"] = text
             if show_alert:
                 data["show_alert"] = True
-            requests.post(url, data=data, timeout=5)
+            self.api.call("answerCallbackQuery", data)
         except:
             pass
     
     def get_updates(self, offset=None):
         try:
-            url = self.base_url + "getUpdates"
             params = {"timeout": 100, "offset": offset}
-            response = requests.get(url, params=params, timeout=110)
-            data = response.json()
-            return data.get('result', []) if data.get('ok') else []
+            data = self.api.call("getUpdates", params=params, http_method='GET')
+            if not data.get('ok'):
+                return []
+            self.health_monitor.record_updates()
+            return data.get('result', [])
         except Exception as e:
             print(f"Get updates error: {e}")
             return []
@@ -5699,8 +8280,6 @@ Always available!
         self.edit_message(chat_id, message_id, stats_text, self.create_admin_buttons())
 
     def handle_search_games(self, chat_id, message_id, user_id, first_name):
-        self.update_games_cache()
-        
         search_info = f"""🔍 Game Search
 
 👋 Hello {first_name}!
@@ -5818,6 +8397,9 @@ Use this ID for admin verification if needed."""
                             text = message['text']
                             print(f"📝 Processing forwarded broadcast text: {text}")
                             return self.handle_broadcast_message(user_id, chat_id, text)
+                        elif self.get_broadcast_media_type(message):
+                            print(f"📎 Processing forwarded broadcast {self.get_broadcast_media_type(message)}")
+                            return self.handle_broadcast_media(user_id, chat_id, message)
                 
                 elif 'document' in message and self.is_admin(user_id):
                     return self.handle_document_upload(message)
@@ -5988,6 +8570,9 @@ This service pings the bot every 4 minutes to prevent sleep on free hosting."""
                     elif text == '/backup' and self.is_admin(user_id):
                         self.show_backup_menu(user_id, chat_id, message['message_id'])
                         return True
+                    elif text == '/routestats' and self.is_admin(user_id):
+                        self.show_callback_route_stats(chat_id)
+                        return True
                 
                 if text.isdigit() and len(text) == 6:
                     return self.handle_code_verification(message)
@@ -6013,7 +8598,13 @@ This service pings the bot every 4 minutes to prevent sleep on free hosting."""
                     caption = message.get('caption', '')
                     return self.handle_photo_reply(user_id, chat_id, photo_file_id, caption)
             
-            if 'document' in message and self.is_admin(message['from']['id']):
+            user_id = message['from']['id']
+            if (self.is_admin(user_id) and user_id in self.broadcast_sessions
+                    and self.broadcast_sessions[user_id]['stage'] == 'waiting_message_or_photo'
+                    and self.get_broadcast_media_type(message)):
+                return self.handle_broadcast_media(user_id, message['chat']['id'], message)
+            
+            if 'document' in message and self.is_admin(user_id):
                 return self.handle_document_upload(message)
             
             return False
@@ -6033,6 +8624,8 @@ This service pings the bot every 4 minutes to prevent sleep on free hosting."""
             
             print(f"🔐 Verification requested by {first_name} ({user_id})")
             
+            self.reactivate_user(user_id)
+            
             if self.is_user_completed(user_id):
                 welcome_text = f"""👋 Welcome back {first_name}!
 
@@ -6125,7 +8718,7 @@ After code verification, you'll need to join our channel."""
                 return False
             
             if self.verify_code(user_id, text):
-                if self.check_channel_membership(user_id):
+                if self.check_channel_membership(user_id, force=True):
                     self.mark_channel_joined(user_id)
                     welcome_text = f"""✅ <b>Verification Complete!</b>
 
@@ -6171,12 +8764,164 @@ After joining, click the button below:"""
 
     # ==================== ENHANCED RUN METHOD WITH PERSISTENCE ====================
 
+    def get_update_sender_id(self, update):
+        """Get the user id an update belongs to (used to keep per-user ordering)"""
+        for key in ('message', 'callback_query', 'edited_message', 'pre_checkout_query'):
+            if key in update:
+                return update[key].get('from', {}).get('id', 0)
+        return 0
+
+    def dispatch_update(self, update):
+        """Route a single update to the matching handler"""
+        update_type = next((key for key in update if key != 'update_id'), 'unknown')
+        outcome = 'ok'
+        start_time = time.perf_counter()
+        try:
+            if 'message' in update:
+                self.process_message(update['message'])
+            elif 'callback_query' in update:
+                self.handle_callback_query(update['callback_query'])
+            else:
+                outcome = 'ignored'
+        except Exception as e:
+            outcome = 'error'
+            print(f"❌ Update processing error: {e}")
+        labels = (('type', update_type),)
+        metrics.observe('update_processing_duration_seconds', time.perf_counter() - start_time, labels)
+        metrics.inc('updates_processed_total', labels + (('outcome', outcome),))
+
+    # ==================== WEBHOOK MODE ====================
+
+    def get_webhook_url(self):
+        """Full public webhook URL built from WEBHOOK_URL, or None for polling"""
+        base_url = os.environ.get('WEBHOOK_URL', '').strip().rstrip('/')
+        if not base_url:
+            return None
+        if base_url.endswith(WEBHOOK_PATH):
+            return base_url
+        return base_url + WEBHOOK_PATH
+
+    def get_webhook_secret(self):
+        """Secret token registered with setWebhook"""
+        return webhook_secret_for(self.token)
+
+    def setup_webhook(self):
+        """Register the webhook with Telegram"""
+        try:
+            webhook_url = self.get_webhook_url()
+            data = {
+                "url": webhook_url,
+                "secret_token": self.get_webhook_secret(),
+                "max_connections": int(os.environ.get('WEBHOOK_MAX_CONNECTIONS', 40))
+            }
+            result = self.api.call("setWebhook", data)
+            if result.get('ok'):
+                print(f"✅ Webhook set: {webhook_url}")
+                # Quiet periods are normal with webhooks; no updates is not a failure
+                self.health_monitor.mode = 'webhook'
+                return True
+            print(f"❌ setWebhook failed: {result.get('description')}")
+            return False
+        except Exception as e:
+            print(f"❌ Webhook setup error: {e}")
+            return False
+
+    def remove_webhook(self):
+        """Delete any registered webhook so getUpdates polling works"""
+        try:
+            result = self.api.call("deleteWebhook", {"drop_pending_updates": False})
+            if result.get('ok'):
+                print("✅ Webhook removed, using long polling")
+                return True
+            print(f"⚠️ deleteWebhook failed: {result.get('description')}")
+            return False
+        except Exception as e:
+            print(f"⚠️ Webhook removal error: {e}")
+            return False
+
+    def handle_webhook_update(self, update, synchronous=False):
+        """Accept an update delivered by webhook"""
+        if self.stop_event.is_set():
+            # A shut-down instance must not revive its dispatcher; the 503 makes Telegram retry
+            return False
+        self.health_monitor.record_updates()
+        if synchronous:
+            self.dispatch_update(update)
+            return True
+        self.update_dispatcher.start()
+        # Keep the wait short: Telegram times out and retries slow webhooks
+        return self.update_dispatcher.submit(update, timeout=5)
+
+    def shutdown(self):
+        """Stop every background service of this instance and close its database.
+
+        Called on exit and before __main__ builds a fresh bot after a crash,
+        so no thread of the old instance keeps working next to the new one.
+        """
+        if self.stop_event.is_set():
+            return
+        print("🛑 Stopping background services...")
+        self.stop_event.set()
+        self.update_dispatcher.stop()
+        # Queued updates are already confirmed to Telegram; let them finish before the database closes
+        drain_timeout = float(os.environ.get('SHUTDOWN_DRAIN_SECONDS', 30))
+        if not self.update_dispatcher.join(timeout=drain_timeout):
+            print(f"⚠️ {self.update_dispatcher.queue_depth()} queued update(s) not handled within {drain_timeout:g}s")
+        for service in (self.broadcast_engine, self.file_verifier, self.health_monitor, self.backup_scheduler):
+            try:
+                service.stop()
+            except Exception as e:
+                print(f"❌ Error stopping {type(service).__name__}: {e}")
+        if self.keep_alive:
+            self.keep_alive.stop()
+        self.flush_sessions()
+        if self.db:
+            self.db.close()
+
+    def run_webhook(self):
+        """Serve updates pushed to the Flask app instead of polling"""
+        if not self.setup_webhook():
+            raise ConnectionError("Webhook registration failed")
+
+        self.update_dispatcher.start()
+
+        print("🤖 Bot is running in webhook mode...")
+        print(f"📥 Receiving updates on {WEBHOOK_PATH}")
+
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            print("\n🛑 Bot stopped by user")
+            self.shutdown()
+
     def run(self):
         """Enhanced main bot loop with comprehensive crash protection"""
         if not self.initialize_with_persistence():
             print("❌ Bot cannot start. Initialization failed.")
             return
-    
+
+        if self.get_webhook_url():
+            self.run_webhook()
+            return
+
+        # getUpdates is refused while a webhook is registered
+        self.remove_webhook()
+
+        if os.environ.get('UPDATE_ENGINE', 'polling').lower() == 'async':
+            if not load_async_modules():
+                print("⚠️ UPDATE_ENGINE=async requires aiohttp, falling back to polling loop")
+            else:
+                print("🤖 Bot is running with the async update engine...")
+                try:
+                    AsyncUpdateEngine(self).run()
+                except KeyboardInterrupt:
+                    print("\n🛑 Bot stopped by user")
+                    self.shutdown()
+                return
+
+        self.update_dispatcher.start()
+
         print("🤖 Bot is running with enhanced protection...")
         print("📊 Monitoring: Health checks every 4 minutes")
         print("🛡️ Protection: Auto-restart on failures")
@@ -6196,16 +8941,10 @@ After joining, click the button below:"""
                     update_failures = 0
                     
                     for update in updates:
+                        if not self.update_dispatcher.submit(update):
+                            # Not confirmed: the next getUpdates starts at this update again
+                            break
                         offset = update['update_id'] + 1
-                        
-                        try:
-                            if 'message' in update:
-                                self.process_message(update['message'])
-                            elif 'callback_query' in update:
-                                self.handle_callback_query(update['callback_query'])
-                        except Exception as e:
-                            print(f"❌ Update processing error: {e}")
-                            continue
                 else:
                     update_failures += 1
                     print(f"ℹ️ No updates received (Failure #{update_failures})")
@@ -6227,21 +8966,22 @@ After joining, click the button below:"""
                 
             except KeyboardInterrupt:
                 print("\n🛑 Bot stopped by user")
-                if self.keep_alive:
-                    self.keep_alive.stop()
+                self.shutdown()
                 break
-                
+
             except ConnectionError as e:
                 print(f"🔌 Connection issue: {e}")
                 self.handle_error(e, "connection_lost")
+                self.update_dispatcher.stop()
                 raise
-                
+
             except Exception as e:
                 error_msg = str(e)
                 print(f"❌ Main loop error: {error_msg}")
-                
+
                 if any(keyword in error_msg.lower() for keyword in ['token', 'connection', 'network', 'timeout']):
                     self.handle_error(e, "critical_error")
+                    self.update_dispatcher.stop()
                     raise
                 else:
                     self.handle_error(e, "non_critical_error")
@@ -6283,24 +9023,27 @@ def test_bot_connection(token):
         print(f"❌ Connection error: {e}")
         return False
 
+startup_profiler.mark('module body')
+
 if __name__ == "__main__":
     print("🚀 Starting Enhanced Telegram Bot with GitHub Backup System...")
     
     start_health_check()
-    
-    time.sleep(2)
+    startup_profiler.mark('health server')
     
     if BOT_TOKEN:
         print("🔍 Testing bot token...")
         
         if test_bot_connection(BOT_TOKEN):
             print("✅ Bot token is valid")
+            startup_profiler.mark('token check')
             
             restart_count = 0
             max_restarts = 50
             restart_delay = 10
             
             while restart_count < max_restarts:
+                bot = None
                 try:
                     restart_count += 1
                     print(f"🔄 Bot start attempt #{restart_count}")
@@ -6314,6 +9057,12 @@ if __name__ == "__main__":
                 except Exception as e:
                     print(f"💥 Bot crash (#{restart_count}): {e}")
                     
+                    # The next instance must not share the database with this one's threads
+                    if bot:
+                        bot.shutdown()
+                    # The webhook route reads the global; answer 503 until the next instance exists
+                    bot = None
+                    
                     if restart_count < max_restarts:
                         print(f"🔄 Restarting in {restart_delay} seconds...")
                         time.sleep(restart_delay)
@@ -8,13 +8,19 @@ from flask import Flask, jsonify, request
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # Import your bot class from channel_bot.py
-from channel_bot import CrossPlatformBot, BOT_TOKEN
+from channel_bot import (CrossPlatformBot, BOT_TOKEN, WEBHOOK_PATH, process_webhook_request,
+                         reject_invalid_webhook_secret, metrics_endpoint)
 
 app = Flask(__name__)
 
 # Store bot thread
 bot_thread = None
 
+# Webhook mode: updates are pushed to WEBHOOK_PATH, no background thread needed
+WEBHOOK_MODE = bool(os.environ.get('WEBHOOK_URL'))
+webhook_bot = None
+webhook_bot_lock = threading.Lock()
+
 def run_bot():
     """Run your original bot in background thread"""
     try:
@@ -30,6 +36,11 @@ def run_bot():
         import traceback
         traceback.print_exc()
 
+def bot_is_alive():
+    if WEBHOOK_MODE:
+        return webhook_bot is not None
+    return bool(bot_thread and bot_thread.is_alive())
+
 @app.route('/')
 def home():
     """Root endpoint"""
@@ -37,7 +48,7 @@ def home():
         'status': 'running',
         'service': 'telegram-game-bot',
         'version': '1.0.0',
-        'bot_status': 'active' if bot_thread and bot_thread.is_alive() else 'starting',
+        'bot_status': 'active' if bot_is_alive() else 'starting',
         'message': 'Bot is running on Vercel'
     })
 
@@ -45,21 +56,48 @@ def home():
 def health():
     """Health check endpoint"""
     return jsonify({
-        'status': 'healthy' if bot_thread and bot_thread.is_alive() else 'degraded',
+        'status': 'healthy' if bot_is_alive() else 'degraded',
         'timestamp': time.time(),
-        'bot_alive': bot_thread and bot_thread.is_alive() if bot_thread else False,
+        'bot_alive': bot_is_alive(),
         'bot_thread_id': bot_thread.ident if bot_thread and bot_thread.is_alive() else None
     })
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics of the bot running in this instance"""
+    return metrics_endpoint()
+
 @app.route('/keepalive')
 def keepalive():
     """Keep-alive endpoint to prevent bot from stopping"""
     return jsonify({
         'status': 'pong',
         'timestamp': time.time(),
-        'bot_alive': bot_thread and bot_thread.is_alive() if bot_thread else False
+        'bot_alive': bot_is_alive()
     })
 
+def get_webhook_bot():
+    """Create the bot once per warm instance for webhook requests"""
+    global webhook_bot
+    with webhook_bot_lock:
+        if webhook_bot is None and BOT_TOKEN:
+            bot = CrossPlatformBot(BOT_TOKEN)
+            if bot.initialize_with_persistence() and bot.setup_webhook():
+                webhook_bot = bot
+            else:
+                # Don't leave the failed instance's threads running behind the next attempt
+                bot.shutdown()
+        return webhook_bot
+
+@app.route(WEBHOOK_PATH, methods=['POST'])
+def webhook():
+    """Telegram webhook endpoint - handled inline so work finishes before the response"""
+    # Forged requests must not pay for (or trigger) a cold bot start
+    rejection = reject_invalid_webhook_secret(BOT_TOKEN)
+    if rejection:
+        return rejection
+    return process_webhook_request(get_webhook_bot(), synchronous=True)
+
 # Start bot in background when app loads
 def start_background_bot():
     global bot_thread
@@ -68,8 +106,7 @@ def start_background_bot():
         bot_thread = threading.Thread(target=run_bot, daemon=True)
         bot_thread.start()
         print("✅ Bot thread started")
-        time.sleep(2)
-        print(f"Bot thread alive: {bot_thread.is_alive()}")
 
 # This runs when the module loads
-start_background_bot()
+if not WEBHOOK_MODE:
+    start_background_bot()
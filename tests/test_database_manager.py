@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from channel_bot import DatabaseManager
+
+
+class DatabaseManagerCloseTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.directory.name, 'test.db'))
+        self.db.execute_write('CREATE TABLE items (value INTEGER)')
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def test_write_after_close_is_rejected(self):
+        self.db.close()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            self.db.execute_write('INSERT INTO items VALUES (1)')
+
+    def test_close_during_writes_never_leaves_callers_hanging(self):
+        outcomes = []
+
+        def writer():
+            for value in range(200):
+                try:
+                    self.db.execute_write('INSERT INTO items VALUES (?)', (value,))
+                    outcomes.append('ok')
+                except sqlite3.ProgrammingError:
+                    outcomes.append('closed')
+
+        threads = [threading.Thread(target=writer) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.01)
+        self.db.close()
+        for thread in threads:
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual(len(outcomes), 800)
+
+
+
+class DatabaseManagerTimeoutTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.directory.name, 'test.db'))
+        self.db.execute_write('CREATE TABLE items (value INTEGER)')
+        self.db.write_timeout = 0.2
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def count(self):
+        return self.db.reader().execute('SELECT COUNT(*) FROM items').fetchone()[0]
+
+    def test_timed_out_queued_write_is_never_applied(self):
+        release = threading.Event()
+        blocker = threading.Thread(target=self.db.run_write, args=(lambda conn: release.wait(5),),
+                                   kwargs={'transactional': False})
+        blocker.start()
+        time.sleep(0.05)
+        with self.assertRaises(TimeoutError):
+            self.db.execute_write('INSERT INTO items VALUES (1)')
+        release.set()
+        blocker.join(timeout=5)
+        self.db.execute_write('INSERT INTO items VALUES (2)')
+        self.assertEqual(self.count(), 1)
+
+    def test_running_write_is_waited_out(self):
+        def slow_insert(conn):
+            time.sleep(0.5)
+            return conn.execute('INSERT INTO items VALUES (1)').rowcount
+        self.assertEqual(self.db.run_write(slow_insert), 1)
+        self.assertEqual(self.count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
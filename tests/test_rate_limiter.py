@@ -0,0 +1,36 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from channel_bot import OutboundRateLimiter
+
+
+class OutboundRateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.limiter = OutboundRateLimiter(global_rate=30, chat_rate=1, burst=3)
+
+    def test_chat_backlog_does_not_delay_other_chats(self):
+        for _ in range(8):
+            self.limiter.reserve(111)
+        self.assertGreater(self.limiter.reserve(111), 4)
+        self.assertLess(self.limiter.reserve(222), 0.5)
+
+    def test_flood_wait_on_one_chat_does_not_delay_other_chats(self):
+        self.limiter.apply_retry_after(111, 25)
+        self.assertGreater(self.limiter.reserve(111), 24)
+        self.assertLess(self.limiter.reserve(222), 0.5)
+
+    def test_flood_wait_without_chat_holds_back_everyone(self):
+        self.limiter.apply_retry_after(None, 5)
+        self.assertGreater(self.limiter.reserve(222), 4)
+
+    def test_global_rate_still_applies_across_chats(self):
+        delays = [self.limiter.reserve(chat_id) for chat_id in range(1, 61)]
+        # 30/s with a burst of 30: the 60th distinct chat waits about a second
+        self.assertGreater(delays[-1], 0.9)
+
+
+if __name__ == '__main__':
+    unittest.main()
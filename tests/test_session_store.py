@@ -0,0 +1,42 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from channel_bot import SessionStore
+
+
+class SessionStoreWriteBehindTest(unittest.TestCase):
+    def setUp(self):
+        self.store = SessionStore('test_sessions', ttl=3600, max_entries=100, persistent=True)
+        self.store[1] = {'stage': 'name'}
+        upserts, _ = self.store.drain_changes()
+        self.assertEqual([key for key, _, _ in upserts], [1])
+
+    def test_read_only_lookups_are_not_written(self):
+        self.assertIn(1, self.store)
+        self.assertEqual(self.store[1]['stage'], 'name')
+        self.assertEqual(self.store.get(1), {'stage': 'name'})
+        self.assertEqual(self.store.drain_changes(), ([], []))
+
+    def test_in_place_mutation_is_written(self):
+        self.store[1]['stage'] = 'file'
+        upserts, _ = self.store.drain_changes()
+        self.assertEqual([(key, data) for key, data, _ in upserts], [(1, '{"stage": "file"}')])
+        self.assertEqual(self.store.drain_changes(), ([], []))
+
+    def test_expiry_is_refreshed_lazily(self):
+        expires_at = self.store.entries[1][1]
+        self.store.persisted[1] = (self.store.persisted[1][0], expires_at - 2000)
+        self.store.get(1)
+        upserts, _ = self.store.drain_changes()
+        self.assertEqual([key for key, _, _ in upserts], [1])
+
+    def test_delete_is_reported(self):
+        del self.store[1]
+        self.assertEqual(self.store.drain_changes(), ([], [1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from channel_bot import UpdateDispatcher
+
+
+class SlowBot:
+    """Just enough of the bot for the dispatcher: one slow handler"""
+
+    def __init__(self, release):
+        self.release = release
+        self.handled = []
+
+    def get_update_sender_id(self, update):
+        return 0
+
+    def dispatch_update(self, update):
+        self.release.wait()
+        self.handled.append(update['update_id'])
+
+
+class OrderBot:
+    """Records handling order and how many updates ran at once"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.handled = []
+        self.running = 0
+        self.max_running = 0
+
+    def get_update_sender_id(self, update):
+        return 0
+
+    def dispatch_update(self, update):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+            self.handled.append(update['update_id'])
+
+
+class UpdateDispatcherStopTest(unittest.TestCase):
+    def test_stop_with_full_queue_does_not_block(self):
+        release = threading.Event()
+        bot = SlowBot(release)
+        dispatcher = UpdateDispatcher(bot, num_workers=1, max_queue_size=2)
+        dispatcher.start()
+        for update_id in range(3):
+            self.assertTrue(dispatcher.submit({'update_id': update_id}, timeout=1))
+        time.sleep(0.1)
+
+        start = time.monotonic()
+        dispatcher.stop()
+        self.assertLess(time.monotonic() - start, 0.5)
+
+        # Queued updates still finish, then the worker exits
+        workers = [thread for thread in threading.enumerate() if thread.name == 'update-worker-0']
+        release.set()
+        for thread in workers:
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual(bot.handled, [0, 1, 2])
+
+    def test_restart_after_stop_keeps_processing(self):
+        release = threading.Event()
+        release.set()
+        bot = SlowBot(release)
+        dispatcher = UpdateDispatcher(bot, num_workers=1, max_queue_size=2)
+        dispatcher.start()
+        dispatcher.stop()
+        dispatcher.start()
+        dispatcher.submit({'update_id': 7}, timeout=1)
+        deadline = time.monotonic() + 5
+        while not bot.handled and time.monotonic() < deadline:
+            time.sleep(0.05)
+        dispatcher.stop()
+        self.assertEqual(bot.handled, [7])
+
+    def test_stop_then_start_keeps_per_user_order(self):
+        bot = OrderBot()
+        dispatcher = UpdateDispatcher(bot, num_workers=1, max_queue_size=10)
+        dispatcher.start()
+        for update_id in range(5):
+            dispatcher.submit({'update_id': update_id}, timeout=1)
+        dispatcher.stop()
+        dispatcher.start()
+        for update_id in range(5, 10):
+            dispatcher.submit({'update_id': update_id}, timeout=1)
+        dispatcher.stop()
+        self.assertTrue(dispatcher.join(timeout=5))
+        self.assertEqual(bot.handled, list(range(10)))
+        self.assertEqual(bot.max_running, 1)
+
+    def test_submit_after_stop_is_refused(self):
+        bot = OrderBot()
+        dispatcher = UpdateDispatcher(bot, num_workers=1, max_queue_size=2)
+        dispatcher.start()
+        dispatcher.stop()
+        self.assertFalse(dispatcher.submit({'update_id': 1}, timeout=0))
+        self.assertTrue(dispatcher.join(timeout=5))
+        self.assertEqual(bot.handled, [])
+
+    def test_full_partition_is_deferred_not_dropped(self):
+        release = threading.Event()
+        bot = SlowBot(release)
+        dispatcher = UpdateDispatcher(bot, num_workers=1, max_queue_size=1)
+        dispatcher.start()
+        dispatcher.submit({'update_id': 0}, timeout=1)
+        time.sleep(0.1)
+        dispatcher.submit({'update_id': 1}, timeout=1)
+        self.assertFalse(dispatcher.submit({'update_id': 2}, timeout=0.1))
+        self.assertEqual(dispatcher.deferred_count, 1)
+        release.set()
+        dispatcher.stop()
+        self.assertTrue(dispatcher.join(timeout=5))
+        self.assertEqual(bot.handled, [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()